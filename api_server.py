@@ -0,0 +1,373 @@
+import argparse
+import asyncio
+import datetime as dt
+import json
+import logging
+import re
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+import db
+import federation
+import invoice_archive
+
+# ------------------------------------------------------------
+# Lokale JSON-HTTP-Schnittstelle (Kasse, Webshop-Formular)
+# Start: python api_server.py --port 8765
+#
+#   GET  /orders?from=YYYY-MM-DD&to=YYYY-MM-DD   Bestellungen im Zeitraum
+#   POST /orders                                 Bestellung anlegen (optional mit Kunde)
+#   GET  /orders/<id>                            Bestellung mit Positionen und Summen
+#   GET  /search?q=<text>[&status=&from=&to=&limit=&cursor=]  Volltextsuche, beste Treffer zuerst
+#   POST /orders/<id>/payment                    Zahlung erfassen (Zahlungsart, Status "paid")
+#   POST /orders/<id>/invoice                    Rechnungsnummer vergeben
+#   GET  /orders/<id>/invoice.pdf                Rechnung als PDF
+#   GET  /changes?since=<seq>&limit=<n>          Änderungen seit Cursor (order_events)
+#   GET  /metrics                                Latenzen je Route
+#
+# Alle Routen nehmen ?standort=<Code> (standorte.json); ohne Angabe gilt
+# DB_PATH. GET /orders?standort=alle liest alle Standorte parallel.
+#
+# SQLite-Aufrufe blockieren und laufen deshalb in einem festen Thread-Pool;
+# jeder Worker-Thread hält eine eigene Verbindung (db.CONNECTION_MODE = "per_thread").
+# ------------------------------------------------------------
+
+MAX_BODY_BYTES = 1_000_000
+METRIK_FENSTER = 10_000  # letzte N Latenzen je Route
+
+log = logging.getLogger("api_server")
+
+
+class ApiFehler(Exception):
+    def __init__(self, status: HTTPStatus, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _datum(value: str | None, name: str) -> str:
+    try:
+        return dt.date.fromisoformat(value or "").isoformat()
+    except ValueError:
+        raise ApiFehler(HTTPStatus.BAD_REQUEST, f"'{name}' muss ein Datum YYYY-MM-DD sein.")
+
+
+def _uhrzeit(value: str | None) -> str:
+    if not re.fullmatch(r"[0-2]\d:[0-5]\d", value or ""):
+        raise ApiFehler(HTTPStatus.BAD_REQUEST, "'event_time' muss HH:MM sein.")
+    return value
+
+
+def _bestellung_laden(order_id: int):
+    try:
+        return db.get_order_with_customer(order_id)
+    except ValueError as e:
+        raise ApiFehler(HTTPStatus.NOT_FOUND, str(e))
+
+
+# ------------------------------------------------------------
+# Handler (laufen im Thread-Pool, dürfen blockieren)
+# ------------------------------------------------------------
+def bestellungen_auflisten(query: dict, body: dict | None, order_id: int | None):
+    start = _datum(query.get("from"), "from")
+    end = _datum(query.get("to") or start, "to")
+    if query.get("standort") == federation.ALLE:
+        return HTTPStatus.OK, [
+            {"location": z.location, **dict(z.row)} for z in federation.orders_for_period(start, end)
+        ]
+    return HTTPStatus.OK, [dict(o) for o in db.list_orders_for_period(start, end)]
+
+
+def bestellungen_suchen(query: dict, body: dict | None, order_id: int | None):
+    text = (query.get("q") or "").strip()
+    if not text:
+        raise ApiFehler(HTTPStatus.BAD_REQUEST, "'q' fehlt.")
+    limit = max(1, min(int(query.get("limit") or 20), 200))
+    treffer, cursor = db.search_orders(
+        text,
+        limit,
+        query.get("cursor") or None,
+        _datum(query["from"], "from") if query.get("from") else None,
+        _datum(query["to"], "to") if query.get("to") else None,
+        query.get("status") or None,
+    )
+    return HTTPStatus.OK, {"results": [dict(t) for t in treffer], "next": cursor}
+
+
+def bestellung_anlegen(query: dict, body: dict | None, order_id: int | None):
+    if not isinstance(body, dict):
+        raise ApiFehler(HTTPStatus.BAD_REQUEST, "JSON-Objekt erwartet.")
+
+    event_date = _datum(body.get("event_date"), "event_date")
+    event_time = _uhrzeit(body.get("event_time"))
+    customer_id = body.get("customer_id")
+    kunde = body.get("customer")
+    try:
+        # Kunde und Bestellung in einer Transaktion (kein Kunde ohne Bestellung bei 409/400)
+        with db.unit_of_work() as conn:
+            if kunde:
+                customer_id = db.upsert_customer(
+                    name=kunde.get("name") or "Unbekannt",
+                    phone=kunde.get("phone"),
+                    address=kunde.get("address"),
+                    conn=conn,
+                )
+            new_id = db.create_order(
+                customer_id=customer_id,
+                event_date=event_date,
+                event_time=event_time,
+                fulfilment_type=body.get("fulfilment_type", ""),
+                notes=body.get("notes"),
+                discount_cents=int(body.get("discount_cents", 0)),
+                delivery_fee_cents=int(body.get("delivery_fee_cents", 0)),
+                items=body.get("items") or [],
+                allow_overbooking=bool(body.get("allow_overbooking")),
+                conn=conn,
+            )
+    except db.KapazitaetErschoepft as e:
+        raise ApiFehler(HTTPStatus.CONFLICT, str(e))
+    return HTTPStatus.CREATED, {"id": new_id, "customer_id": customer_id}
+
+
+def bestellung_lesen(query: dict, body: dict | None, order_id: int | None):
+    order = _bestellung_laden(order_id)
+    return HTTPStatus.OK, {
+        "order": dict(order),
+        "items": [dict(it) for it in db.get_order_items(order_id)],
+        "totals": db.compute_totals(order_id),
+    }
+
+
+def zahlung_erfassen(query: dict, body: dict | None, order_id: int | None):
+    _bestellung_laden(order_id)
+    payment_method = (body or {}).get("payment_method")
+    with db.unit_of_work() as conn:
+        db.set_payment_method(order_id, payment_method, conn=conn)
+        db.update_status(order_id, "paid", conn=conn)
+    return HTTPStatus.OK, dict(_bestellung_laden(order_id))
+
+
+def rechnung_vergeben(query: dict, body: dict | None, order_id: int | None):
+    order = _bestellung_laden(order_id)
+    if not order.invoice_number:
+        db.assign_invoice_number(order_id)
+        order = _bestellung_laden(order_id)
+    return HTTPStatus.OK, {"invoice_number": order.invoice_number, "invoice_date": order.invoice_date}
+
+
+def rechnung_pdf(query: dict, body: dict | None, order_id: int | None):
+    order = _bestellung_laden(order_id)
+    pdf = invoice_archive.lesen(order.invoice_number) if order.invoice_number else None
+    if pdf is None:
+        import invoice_pdf  # ReportLab erst bei Bedarf laden
+
+        invoice_pdf.rechnung_pdf_erzeugen(order_id)
+        pdf = invoice_archive.lesen(_bestellung_laden(order_id).invoice_number)
+    return HTTPStatus.OK, pdf
+
+
+def aenderungen_lesen(query: dict, body: dict | None, order_id: int | None):
+    since = int(query.get("since") or 0)
+    limit = max(1, min(int(query.get("limit") or 500), 5000))
+    events = db.changes_since(since, limit)
+    return HTTPStatus.OK, {
+        "events": [dict(e) for e in events],
+        "next": events[-1].seq if events else since,
+    }
+
+
+def zeitfenster_lesen(query: dict, body: dict | None, order_id: int | None):
+    tag = _datum(query.get("date"), "date")
+    return HTTPStatus.OK, [
+        {**dict(s), "free_orders": s.free_orders, "free_portions": s.free_portions}
+        for s in db.free_slots(tag)
+    ]
+
+
+def _im_standort(handler, query: dict, body: dict | None, order_id: int | None):
+    """Handler im angefragten Standort ausführen ("alle" lesen die Handler selbst über federation)."""
+    code = query.get("standort")
+    with db.im_standort(None if code in (None, "", federation.ALLE) else code):
+        return handler(query, body, order_id)
+
+
+ROUTEN = [
+    ("GET", re.compile(r"/orders"), "orders.list", bestellungen_auflisten),
+    ("POST", re.compile(r"/orders"), "orders.create", bestellung_anlegen),
+    ("GET", re.compile(r"/orders/(\d+)"), "orders.get", bestellung_lesen),
+    ("POST", re.compile(r"/orders/(\d+)/payment"), "orders.payment", zahlung_erfassen),
+    ("POST", re.compile(r"/orders/(\d+)/invoice"), "orders.invoice", rechnung_vergeben),
+    ("GET", re.compile(r"/orders/(\d+)/invoice\.pdf"), "orders.invoice_pdf", rechnung_pdf),
+    ("GET", re.compile(r"/search"), "search", bestellungen_suchen),
+    ("GET", re.compile(r"/changes"), "changes", aenderungen_lesen),
+    ("GET", re.compile(r"/slots"), "slots", zeitfenster_lesen),
+]
+
+
+# ------------------------------------------------------------
+# Latenz-Metriken je Route
+# ------------------------------------------------------------
+class Metriken:
+    def __init__(self):
+        self.latenzen: dict[str, deque] = {}
+        self.anzahl: dict[str, int] = {}
+        self.fehler: dict[str, int] = {}
+
+    def erfassen(self, route: str, sekunden: float, status: int) -> None:
+        self.latenzen.setdefault(route, deque(maxlen=METRIK_FENSTER)).append(sekunden)
+        self.anzahl[route] = self.anzahl.get(route, 0) + 1
+        if status >= 400:
+            self.fehler[route] = self.fehler.get(route, 0) + 1
+
+    def bericht(self) -> dict:
+        bericht = {}
+        for route, werte in self.latenzen.items():
+            sortiert = sorted(werte)
+            bericht[route] = {
+                "count": self.anzahl[route],
+                "errors": self.fehler.get(route, 0),
+                "mean_ms": round(sum(sortiert) / len(sortiert) * 1000, 3),
+                "p50_ms": round(_perzentil(sortiert, 0.50) * 1000, 3),
+                "p99_ms": round(_perzentil(sortiert, 0.99) * 1000, 3),
+                "max_ms": round(sortiert[-1] * 1000, 3),
+            }
+        return bericht
+
+
+def _perzentil(sortiert: list[float], p: float) -> float:
+    return sortiert[min(len(sortiert) - 1, int(p * len(sortiert)))]
+
+
+# ------------------------------------------------------------
+# HTTP/1.1 über asyncio-Streams (Keep-Alive, Content-Length)
+# ------------------------------------------------------------
+class ApiServer:
+    def __init__(self, workers: int = 4):
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="db")
+        # begrenzt wartende Aufträge, damit die Pool-Warteschlange nicht unbegrenzt wächst
+        self.plaetze = asyncio.Semaphore(workers * 8)
+        self.metriken = Metriken()
+
+    async def anfrage_bearbeiten(self, method: str, target: str, raw_body: bytes):
+        url = urlsplit(target)
+        if method == "GET" and url.path == "/metrics":
+            return "metrics", HTTPStatus.OK, self.metriken.bericht()
+
+        pfad_passt = False
+        for r_method, muster, name, handler in ROUTEN:
+            m = muster.fullmatch(url.path)
+            if not m:
+                continue
+            pfad_passt = True
+            if r_method != method:
+                continue
+
+            try:
+                body = json.loads(raw_body) if raw_body else None
+            except ValueError:
+                return name, HTTPStatus.BAD_REQUEST, {"error": "Ungültiges JSON."}
+            query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            order_id = int(m.group(1)) if m.groups() else None
+
+            async with self.plaetze:
+                loop = asyncio.get_running_loop()
+                try:
+                    status, payload = await loop.run_in_executor(self.pool, _im_standort, handler, query, body, order_id)
+                except ApiFehler as e:
+                    status, payload = e.status, {"error": e.message}
+                except db.KapazitaetErschoepft as e:
+                    status, payload = HTTPStatus.CONFLICT, {"error": str(e)}
+                except (ValueError, TypeError, KeyError) as e:
+                    status, payload = HTTPStatus.BAD_REQUEST, {"error": str(e)}
+                except Exception:
+                    # z. B. sqlite3.OperationalError ("database is locked"): als JSON-500
+                    # beantworten und in den Metriken zählen statt die Verbindung abzubrechen
+                    log.exception("Fehler bei %s %s", method, url.path)
+                    status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {"error": "Interner Fehler."}
+            return name, status, payload
+
+        if pfad_passt:
+            return "method_not_allowed", HTTPStatus.METHOD_NOT_ALLOWED, {"error": "Methode nicht erlaubt."}
+        return "not_found", HTTPStatus.NOT_FOUND, {"error": "Unbekannter Pfad."}
+
+    async def verbindung(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                zeile = await reader.readline()
+                if not zeile:
+                    break
+                method, target, version = zeile.decode("latin-1").split()
+
+                headers = {}
+                while True:
+                    h = await reader.readline()
+                    if h in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = h.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+
+                laenge = int(headers.get("content-length") or 0)
+                if laenge > MAX_BODY_BYTES:
+                    await self._antworten(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"error": "Anfrage zu groß."}, False)
+                    break
+                raw_body = await reader.readexactly(laenge) if laenge else b""
+
+                start = time.perf_counter()
+                route, status, payload = await self.anfrage_bearbeiten(method, target, raw_body)
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                await self._antworten(writer, status, payload, keep_alive)
+                self.metriken.erfassen(route, time.perf_counter() - start, int(status))
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _antworten(self, writer, status: HTTPStatus, payload, keep_alive: bool) -> None:
+        if isinstance(payload, (bytes, memoryview)):
+            data, ctype = payload, "application/pdf"
+        else:
+            data, ctype = json.dumps(payload, ensure_ascii=False).encode("utf-8"), "application/json; charset=utf-8"
+        kopf = (
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            f"Content-Type: {ctype}\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(kopf.encode("latin-1"))
+        writer.write(data)
+        await writer.drain()
+
+
+async def starten(host: str, port: int, workers: int) -> None:
+    db.CONNECTION_MODE = "per_thread"
+    for code in db.standort_codes():
+        with db.im_standort(code):
+            db.init_db()
+
+    api = ApiServer(workers=workers)
+    server = await asyncio.start_server(api.verbindung, host, port)
+    print(f"API läuft auf http://{host}:{port} ({workers} DB-Worker)")
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lokale JSON-API für Bestellungen")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=4, help="Größe des DB-Thread-Pools")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    try:
+        asyncio.run(starten(args.host, args.port, args.workers))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,9 @@
 import datetime as dt
 from pathlib import Path
+import pandas as pd
 import streamlit as st
 import db
-import invoice_pdf
+import maintenance
 
 # -------------------- Seiteneinstellungen --------------------
 st.set_page_config(
@@ -10,8 +11,47 @@ st.set_page_config(
     layout="wide"
 )
 
+# -------------------- Standort --------------------
+# Jede Sitzung arbeitet in genau einem Standort (eigene Datenbankdatei, siehe
+# standorte.json). Die Wahl gilt je Thread: zu Beginn jedes Laufs setzen und
+# ebenso in Callbacks, die Streamlit vor dem Skript ausführt, und am Anfang
+# jedes Fragments (Fragment-Läufe starten in einem neuen Thread).
+STANDORTE = db.standorte()
+if STANDORTE and st.session_state.get("standort") not in STANDORTE:
+    st.session_state["standort"] = next(iter(STANDORTE))
+
+
+def standort_setzen() -> None:
+    db.standort_waehlen(st.session_state.get("standort"))
+
+
+standort_setzen()
+
+
 # -------------------- Datenbank initialisieren --------------------
-db.init_db()
+# Einmal je Prozess (nicht bei jedem Rerun) für alle Standorte; invoice_pdf /
+# ReportLab werden erst beim ersten PDF geladen.
+@st.cache_resource
+def datenbank_vorbereiten() -> None:
+    for code in db.standort_codes():
+        with db.im_standort(code):
+            db.init_db()
+
+
+datenbank_vorbereiten()
+
+
+# Wartung (optimize, incremental_vacuum, WAL, quick_check) im Hintergrund,
+# sobald die App eine Weile nicht benutzt wurde; jeder Rerun zählt als Aktivität.
+@st.cache_resource
+def wartung_starten() -> maintenance.Planer:
+    planer = maintenance.Planer()
+    planer.starten()
+    return planer
+
+
+wartung_starten().aktivitaet()
+
 
 # -------------------- Anzeige-Texte --------------------
 STATUS_LABELS = {
@@ -38,6 +78,11 @@ MWST_OPTIONEN = [
     ("7 %", 0.07),
 ]
 
+WOCHENTAGE = ["Mo", "Di", "Mi", "Do", "Fr", "Sa", "So"]
+
+# Serienbestellungen werden so weit im Voraus als Bestellungen angelegt
+SERIEN_HORIZONT_TAGE = 56
+
 # -------------------- Hilfsfunktionen --------------------
 def euro_zu_cent(betrag_euro: float) -> int:
     """Wandelt Euro (float) in Cent (int) um"""
@@ -49,11 +94,78 @@ def cent_zu_euro_text(cent: int) -> str:
     return f"{cent / 100:.2f}".replace(".", ",")
 
 
+def auslastung_text(s: db.SlotRow) -> str:
+    """Belegung eines Zeitfensters, z. B. "2/3 Fahrten, 40/60 Portionen" """
+    einheit = "Fahrten" if s.fulfilment_type == "delivery" else "Bestellungen"
+    teile = [
+        f"{s.order_count}/{s.max_orders} {einheit}" if s.max_orders is not None else f"{s.order_count} {einheit}",
+        f"{s.portions:g}/{s.max_portions:g} Portionen" if s.max_portions is not None else f"{s.portions:g} Portionen",
+    ]
+    if s.max_orders is None and s.max_portions is None:
+        teile.append("ohne Grenze")
+    return ", ".join(teile)
+
+
+def leere_position() -> dict:
+    """Neue, leere Bestellposition für den Positions-Editor"""
+    return {
+        "product_id": None,
+        "description": "",
+        "quantity": 1.0,
+        "unit": "Stk",
+        "unit_price_eur": 0.0,
+        "vat_rate": 0.19
+    }
+
+
+def position_brutto_cent(item: dict) -> int:
+    """Bruttobetrag einer Position in Cent (leere Beschreibung zählt nicht)"""
+    if not (item.get("description") or "").strip():
+        return 0
+    preis_cent = euro_zu_cent(float(item.get("unit_price_eur", 0.0)))
+    menge = float(item.get("quantity", 0.0) or 0.0)
+    return int(round(preis_cent * menge))
+
+
+@st.cache_data
+def produktkatalog(standort: str | None) -> dict:
+    """Aktive Produkte des Standorts nach ID (gecacht, wird beim Anlegen eines Produkts geleert)"""
+    # Standort ausdrücklich: der Cache-Schlüssel ist `standort`, nicht der Thread-Kontext
+    with db.im_standort(standort):
+        return {p.id: p for p in db.list_products(active_only=True)}
+
+
+@st.cache_data(ttl=3600)
+def serien_fortschreiben(heute: str, standort: str | None) -> int:
+    """Legt Serienbestellungen bis zum Horizont an – höchstens stündlich, ein Schreibvorgang für alle Serien"""
+    bis = dt.date.fromisoformat(heute) + dt.timedelta(days=SERIEN_HORIZONT_TAGE)
+    with db.im_standort(standort):
+        return db.generate_template_orders(bis.isoformat())
+
+
+serien_fortschreiben(dt.date.today().isoformat(), st.session_state.get("standort"))
+
+
 # -------------------- Titel --------------------
 st.title("Partyservice – Bestellverwaltung")
 
-tab_bestellung, tab_tagesliste, tab_produkte = st.tabs(
-    ["Neue Bestellung", "Tagesliste", "Produktliste"]
+if STANDORTE:
+    def standort_gewechselt():
+        # Zwischengespeicherte Listen gehören zum bisherigen Standort
+        for key in ("kunden_historie", "dubletten"):
+            st.session_state.pop(key, None)
+        standort_setzen()
+
+    st.sidebar.selectbox(
+        "Standort",
+        options=list(STANDORTE),
+        format_func=lambda c: STANDORTE[c].name,
+        key="standort",
+        on_change=standort_gewechselt,
+    )
+
+tab_bestellung, tab_tagesliste, tab_kunden, tab_serien, tab_produkte = st.tabs(
+    ["Neue Bestellung", "Tagesliste", "Kunden", "Serien", "Produktliste"]
 )
 
 # ==========================================================
@@ -82,6 +194,12 @@ with tab_bestellung:
             format_func=lambda k: ART_LABELS[k]
         )
 
+        # -------- Belegung im Zeitfenster (ändert sich nur mit Datum/Uhrzeit/Art) --------
+        # Der Abgleich mit den Portionen läuft im Positions-Editor (Fragment),
+        # damit Warnung und freie Zeitfenster jeder Mengenänderung folgen.
+        zeitfenster = db.slot_for_time(event_time.strftime("%H:%M"))
+        slots = [s for s in db.free_slots(event_date.isoformat()) if s.fulfilment_type == fulfilment_type]
+
         notes = st.text_area(
             "Notizen",
             placeholder="z. B. Allergien, extra Besteck, Klingeln bei ..."
@@ -97,6 +215,15 @@ with tab_bestellung:
             "Telefon",
         )
 
+        stammkunde = db.get_customer_by_phone(customer_phone)
+        if stammkunde:
+            st.caption(
+                f"Stammkunde {stammkunde.name}: {stammkunde.order_count} Bestellungen, "
+                f"zuletzt {stammkunde.last_order_date or '-'}, "
+                f"Umsatz {cent_zu_euro_text(stammkunde.lifetime_gross_cents)} €, "
+                f"offen {cent_zu_euro_text(stammkunde.open_balance_cents)} €"
+            )
+
         customer_address = st.text_area(
             "Adresse",
         )
@@ -111,7 +238,8 @@ with tab_bestellung:
             "Lieferpauschale (EUR, brutto)",
             min_value=0.0,
             step=1.0,
-            value=0.0
+            value=0.0,
+            key="delivery_fee_eur"
         )
 
     with c2:
@@ -119,7 +247,8 @@ with tab_bestellung:
             "Rabatt (EUR, brutto)",
             min_value=0.0,
             step=1.0,
-            value=0.0
+            value=0.0,
+            key="discount_eur"
         )
 
     # -------- Produkte --------
@@ -127,156 +256,176 @@ with tab_bestellung:
     st.markdown("**Produkte**")
 
     if "items" not in st.session_state:
-        st.session_state["items"] = [{
-            "product_id": None,
-            "description": "",
-            "quantity": 1.0,
-            "unit": "Stk",
-            "unit_price_eur": 0.0,
-            "vat_rate": 0.19
-        }]
+        st.session_state["items"] = [leere_position()]
 
     def position_hinzufuegen():
-        st.session_state["items"].append({
-            "product_id": None,
-            "description": "",
-            "quantity": 1.0,
-            "unit": "Stk",
-            "unit_price_eur": 0.0,
-            "vat_rate": 0.19
-        })
+        st.session_state["items"].append(leere_position())
 
     def letzte_position_entfernen():
         if len(st.session_state["items"]) > 1:
             st.session_state["items"].pop()
 
-    b1, b2 = st.columns(2)
-    with b1:
-        st.button("Position hinzufügen", on_click=position_hinzufuegen)
-    with b2:
-        st.button("Letzte Position entfernen", on_click=letzte_position_entfernen)
+    # Positions-Editor als Fragment: Eingaben hier laufen nur das Fragment neu,
+    # nicht die Tagesliste / Produktliste mit ihren Datenbankabfragen.
+    @st.fragment
+    def positionen_bearbeiten(zeitfenster, slots):
+        standort_setzen()
+        b1, b2 = st.columns(2)
+        with b1:
+            st.button("Position hinzufügen", on_click=position_hinzufuegen)
+        with b2:
+            st.button("Letzte Position entfernen", on_click=letzte_position_entfernen)
 
-    produkte = db.list_products(active_only=True)
-    produkte_by_id = {p["id"]: p for p in produkte}
+        produkte_by_id = produktkatalog(st.session_state.get("standort"))
 
-    def produkt_text(p: dict) -> str:
-        return p["name"]
+        def produkt_text(p) -> str:
+            return p["name"]
 
-    optionen = [None] + [p["id"] for p in produkte]
+        optionen = [None] + list(produkte_by_id)
+        vat_values = [x[1] for x in MWST_OPTIONEN]
 
-    for i, item in enumerate(st.session_state["items"]):
-        # Einheit als eigenes Feld anzeigen
-        c_prod, c_desc, c_qty, c_unit, c_price, c_vat = st.columns([3, 6, 2, 2, 3, 2])
+        gesamt_cent = 0
+        for i, item in enumerate(st.session_state["items"]):
+            # Einheit als eigenes Feld anzeigen
+            c_prod, c_desc, c_qty, c_unit, c_price, c_vat = st.columns([3, 6, 2, 2, 3, 2])
+
+            try:
+                idx = optionen.index(item.get("product_id"))
+            except ValueError:
+                idx = 0
+
+            pid = c_prod.selectbox(
+                "Produkt",
+                options=optionen,
+                index=idx,
+                format_func=lambda x: "— (Freitext)" if x is None else produkt_text(produkte_by_id[x]),
+                key=f"prod_{i}",
+            )
 
-        try:
-            idx = optionen.index(item.get("product_id"))
-        except ValueError:
-            idx = 0
-
-        pid = c_prod.selectbox(
-            "Produkt",
-            options=optionen,
-            index=idx,
-            format_func=lambda x: "— (Freitext)" if x is None else produkt_text(produkte_by_id[x]),
-            key=f"prod_{i}",
-        )
+            # Produktwechsel: alles vorbelegen (Menge+Einheit+Preis+MwSt)
+            if pid != item.get("product_id"):
+                item["product_id"] = pid
+                if pid is not None:
+                    p = produkte_by_id[pid]
 
-        # Produktwechsel: alles vorbelegen (Menge+Einheit+Preis+MwSt)
-        if pid != item.get("product_id"):
-            item["product_id"] = pid
-            if pid is not None:
-                p = produkte_by_id[pid]
+                    item["description"] = p["name"]
+                    st.session_state[f"desc_{i}"] = p["name"]
 
-                item["description"] = p["name"]
-                st.session_state[f"desc_{i}"] = p["name"]
+                    std_qty = float(p.get("default_quantity", 1.0))
+                    item["quantity"] = std_qty
+                    st.session_state[f"qty_{i}"] = std_qty
 
-                std_qty = float(p.get("default_quantity", 1.0))
-                item["quantity"] = std_qty
-                st.session_state[f"qty_{i}"] = std_qty
+                    std_unit = (p.get("default_unit") or "Stk").strip() or "Stk"
+                    item["unit"] = std_unit
+                    st.session_state[f"unit_{i}"] = std_unit
 
-                std_unit = (p.get("default_unit") or "Stk").strip() or "Stk"
-                item["unit"] = std_unit
-                st.session_state[f"unit_{i}"] = std_unit
+                    item["unit_price_eur"] = float(p["default_unit_price_cents"]) / 100.0
+                    st.session_state[f"price_{i}"] = item["unit_price_eur"]
 
-                item["unit_price_eur"] = float(p["default_unit_price_cents"]) / 100.0
-                st.session_state[f"price_{i}"] = item["unit_price_eur"]
+                    item["vat_rate"] = float(p["default_vat_rate"])
 
-                item["vat_rate"] = float(p["default_vat_rate"])
+            item["description"] = c_desc.text_input(
+                "Beschreibung",
+                value=st.session_state.get(f"desc_{i}", item.get("description", "")),
+                key=f"desc_{i}",
+            )
 
-        item["description"] = c_desc.text_input(
-            "Beschreibung",
-            value=st.session_state.get(f"desc_{i}", item.get("description", "")),
-            key=f"desc_{i}",
-        )
+            item["quantity"] = c_qty.number_input(
+                f"Menge #{i+1}",
+                value=float(st.session_state.get(f"qty_{i}", item.get("quantity", 1.0))),
+                min_value=0.0,
+                step=1.0,
+                key=f"qty_{i}",
+            )
 
-        item["quantity"] = c_qty.number_input(
-            f"Menge #{i+1}",
-            value=float(st.session_state.get(f"qty_{i}", item.get("quantity", 1.0))),
-            min_value=0.0,
-            step=1.0,
-            key=f"qty_{i}",
-        )
+            item["unit"] = c_unit.text_input(
+                "Einheit",
+                value=st.session_state.get(f"unit_{i}", item.get("unit", "Stk")),
+                key=f"unit_{i}",
+            )
 
-        item["unit"] = c_unit.text_input(
-            "Einheit",
-            value=st.session_state.get(f"unit_{i}", item.get("unit", "Stk")),
-            key=f"unit_{i}",
-        )
+            item["unit_price_eur"] = c_price.number_input(
+                f"Einzelpreis (EUR, brutto) #{i+1}",
+                value=float(st.session_state.get(f"price_{i}", item.get("unit_price_eur", 0.0))),
+                min_value=0.0,
+                step=0.5,
+                key=f"price_{i}",
+            )
 
-        item["unit_price_eur"] = c_price.number_input(
-            f"Einzelpreis (EUR, brutto) #{i+1}",
-            value=float(st.session_state.get(f"price_{i}", item.get("unit_price_eur", 0.0))),
-            min_value=0.0,
-            step=0.5,
-            key=f"price_{i}",
-        )
+            try:
+                vat_idx = vat_values.index(float(item.get("vat_rate", 0.19)))
+            except ValueError:
+                vat_idx = 0
+
+            auswahl = c_vat.selectbox(
+                f"MwSt #{i+1}",
+                options=list(range(len(MWST_OPTIONEN))),
+                format_func=lambda x: MWST_OPTIONEN[x][0],
+                index=vat_idx,
+                key=f"vat_{i}",
+            )
+            item["vat_rate"] = MWST_OPTIONEN[auswahl][1]
 
-        vat_values = [x[1] for x in MWST_OPTIONEN]
-        try:
-            vat_idx = vat_values.index(float(item.get("vat_rate", 0.19)))
-        except ValueError:
-            vat_idx = 0
-
-        auswahl = c_vat.selectbox(
-            f"MwSt #{i+1}",
-            options=list(range(len(MWST_OPTIONEN))),
-            format_func=lambda x: MWST_OPTIONEN[x][0],
-            index=vat_idx,
-            key=f"vat_{i}",
-        )
-        item["vat_rate"] = MWST_OPTIONEN[auswahl][1]
+            gesamt_cent += position_brutto_cent(item)
 
-    # -------- Gesamtsumme Vorschau --------
-    st.markdown("---")
+        # -------- Gesamtsumme Vorschau --------
+        st.markdown("---")
 
-    gesamt_cent = 0
-    for it in st.session_state["items"]:
-        desc = (it.get("description") or "").strip()
-        if not desc:
-            continue
-        preis_cent = euro_zu_cent(float(it.get("unit_price_eur", 0.0)))
-        menge = float(it.get("quantity", 0.0) or 0.0)
-        gesamt_cent += int(round(preis_cent * menge))
-
-    gesamt_cent += euro_zu_cent(delivery_fee_eur)
-    gesamt_cent -= euro_zu_cent(discount_eur)
-
-    st.write(
-        f"**Vorschau Gesamtbetrag (brutto): "
-        f"{cent_zu_euro_text(gesamt_cent)} €**"
-    )
+        gesamt_cent += euro_zu_cent(st.session_state.get("delivery_fee_eur", 0.0))
+        gesamt_cent -= euro_zu_cent(st.session_state.get("discount_eur", 0.0))
+
+        st.write(
+            f"**Vorschau Gesamtbetrag (brutto): "
+            f"{cent_zu_euro_text(gesamt_cent)} €**"
+        )
+
+        # -------- Verfügbarkeit im Zeitfenster (live bei jeder Position) --------
+        slot = next((s for s in slots if s.slot == zeitfenster), None)
+        neue_portionen = sum(
+            float(it.get("quantity") or 0)
+            for it in st.session_state["items"]
+            if (it.get("description") or "").strip()
+        )
+        ausgebucht = slot is not None and (
+            (slot.free_orders is not None and slot.free_orders < 1)
+            or (slot.free_portions is not None and slot.free_portions < neue_portionen)
+        )
+        if ausgebucht:
+            frei = [
+                s.slot for s in slots
+                if (s.free_orders is None or s.free_orders >= 1)
+                and (s.free_portions is None or s.free_portions >= neue_portionen)
+            ]
+            st.warning(
+                f"Zeitfenster {zeitfenster} ist ausgebucht ({auslastung_text(slot)})."
+                + (f" Frei: {', '.join(frei)}" if frei else "")
+            )
+            return st.checkbox("Trotzdem annehmen (überbuchen)", key="ueberbuchen")
+        if slot is not None:
+            st.caption(f"Zeitfenster {zeitfenster}: {auslastung_text(slot)}")
+        return False
+
+    # Rückgabe nur beim vollen Lauf (z. B. Klick auf Speichern) – dort wird sie gebraucht
+    ueberbuchen = positionen_bearbeiten(zeitfenster, slots)
+
+    # -------- Wiederholung (optional) --------
+    with st.expander("Als Serie speichern (wiederkehrende Bestellung)"):
+        serie_aktiv = st.checkbox("Regelmäßig wiederholen", key="serie_aktiv")
+        s1, s2, s3 = st.columns([3, 1, 2])
+        serie_tage = s1.multiselect(
+            "Wochentage",
+            options=list(range(7)),
+            default=[event_date.weekday()],
+            format_func=lambda w: WOCHENTAGE[w],
+            key="serie_tage",
+        )
+        serie_intervall = s2.number_input("Alle … Wochen", min_value=1, step=1, value=1, key="serie_intervall")
+        serie_ende = s3.date_input("Letzter Termin (optional)", value=None, format="DD.MM.YYYY", key="serie_ende")
+        serie_name = st.text_input("Name der Serie", placeholder="z. B. Firma AG – Mittagessen", key="serie_name")
 
     # -------- Speichern --------
     if st.button("Bestellung speichern", type="primary"):
         try:
-            kunden_id = None
-            if customer_name.strip() or customer_phone.strip():
-                kunden_id = db.upsert_customer(
-                    name=customer_name.strip() or "Unbekannt",
-                    phone=customer_phone,
-                    address=customer_address
-                )
-
             positionen = []
             for it in st.session_state["items"]:
                 desc = (it.get("description") or "").strip()
@@ -295,36 +444,291 @@ with tab_bestellung:
             if not positionen:
                 raise ValueError("Mindestens eine Position ist erforderlich.")
 
-            order_id = db.create_order(
-                customer_id=kunden_id,
-                event_date=event_date.isoformat(),
-                event_time=event_time.strftime("%H:%M"),
-                fulfilment_type=fulfilment_type,
-                notes=notes,
-                discount_cents=euro_zu_cent(discount_eur),
-                delivery_fee_cents=euro_zu_cent(delivery_fee_eur),
-                items=positionen
-            )
+            # Kunde und Bestellung (bzw. Serie) in einer Transaktion: ein Commit,
+            # und bei einem Fehler bleibt kein Kunde ohne Bestellung zurück
+            with db.unit_of_work() as conn:
+                kunden_id = None
+                if customer_name.strip() or customer_phone.strip():
+                    kunden_id = db.upsert_customer(
+                        name=customer_name.strip() or "Unbekannt",
+                        phone=customer_phone,
+                        address=customer_address,
+                        conn=conn,
+                    )
+
+                if serie_aktiv:
+                    template_id = db.create_order_template(
+                        customer_id=kunden_id,
+                        name=serie_name.strip() or customer_name.strip(),
+                        event_time=event_time.strftime("%H:%M"),
+                        fulfilment_type=fulfilment_type,
+                        notes=notes,
+                        weekdays=serie_tage,
+                        interval_weeks=int(serie_intervall),
+                        start_date=event_date.isoformat(),
+                        end_date=serie_ende.isoformat() if serie_ende else None,
+                        discount_cents=euro_zu_cent(discount_eur),
+                        delivery_fee_cents=euro_zu_cent(delivery_fee_eur),
+                        items=positionen,
+                        conn=conn,
+                    )
+                    bis = max(event_date, dt.date.today()) + dt.timedelta(days=SERIEN_HORIZONT_TAGE)
+                    anzahl = db.generate_template_orders(bis.isoformat(), template_id=template_id, conn=conn)
+                    meldung = f"Serie angelegt: {anzahl} Bestellungen bis {bis.strftime('%d.%m.%Y')} erzeugt"
+                else:
+                    order_id = db.create_order(
+                        customer_id=kunden_id,
+                        event_date=event_date.isoformat(),
+                        event_time=event_time.strftime("%H:%M"),
+                        fulfilment_type=fulfilment_type,
+                        notes=notes,
+                        discount_cents=euro_zu_cent(discount_eur),
+                        delivery_fee_cents=euro_zu_cent(delivery_fee_eur),
+                        items=positionen,
+                        allow_overbooking=ueberbuchen,
+                        conn=conn,
+                    )
+                    meldung = f"Bestellung gespeichert (Nr. {order_id})"
 
-            st.success(f"Bestellung gespeichert (Nr. {order_id})")
-            st.session_state["items"] = [{
-                "description": "",
-                "quantity": 1.0,
-                "unit_price_eur": 0.0,
-                "vat_rate": 0.19
-            }]
+            st.success(meldung)
+            st.session_state["items"] = [leere_position()]
             st.rerun()
 
         except Exception as e:
             st.error(f"Fehler: {e}")
 
 
+# ==========================================================
+# Bestellung in der Tagesliste (eigenes Fragment je Bestellung)
+# ==========================================================
+def bestellung_neu_laden(order_id: int) -> None:
+    """Liest nur diese Bestellung neu und läuft nur ihr Fragment neu."""
+    st.session_state[f"order_row_{order_id}"] = db.get_order_with_customer(order_id)
+    try:
+        st.rerun(scope="fragment")
+    except st.errors.StreamlitAPIException:
+        # Aktion kam aus einem vollen Seitenlauf (kein Fragment-Lauf aktiv)
+        st.rerun()
+
+
+@st.fragment
+def bestellung_anzeigen(o) -> None:
+    """Zeigt eine Bestellung; Aktionen laufen nur dieses Fragment neu."""
+    standort_setzen()
+    order_id = int(o["id"])
+    # Nach einer Aktion in diesem Fragment: nur die eigene Zeile neu gelesen
+    aktualisiert = f"order_row_{order_id}" in st.session_state
+    o = st.session_state.get(f"order_row_{order_id}", o)
+
+    titel = (
+        f"#{order_id} – {o['event_time']} – "
+        f"{ART_LABELS.get(o['fulfilment_type'], o['fulfilment_type'])} – "
+        f"{STATUS_LABELS.get(o['status'], o['status'])}"
+    )
+    if o.get("customer_name"):
+        titel += f" – {o['customer_name']}"
+    if o.get("invoice_number"):
+        titel += f" – Rechnung {o['invoice_number']}"
+
+    with st.expander(titel, expanded=aktualisiert):
+        links, rechts = st.columns([3, 2])
+
+        # -------------------- Linke Seite: Details --------------------
+        with links:
+            st.write("**Kunde**")
+            st.write(f"Name: {o.get('customer_name') or '-'}")
+            st.write(f"Telefon: {o.get('customer_phone') or '-'}")
+            if o["fulfilment_type"] == "delivery":
+                st.write(f"Adresse: {o.get('customer_address') or '-'}")
+
+            if o.get("notes"):
+                st.write("**Notizen**")
+                st.write(o["notes"])
+
+            st.write("**Positionen**")
+            items = db.get_order_items(order_id)
+            for it in items:
+                line_gross = int(round(float(it["quantity"]) * int(it["unit_price_cents"])))
+                einheit = (it.get("unit") or "").strip()
+                einheit_txt = f" {einheit}" if einheit else ""
+                st.write(
+                    f"- {float(it['quantity']):g}{einheit_txt} × {it['description']} "
+                    f"({cent_zu_euro_text(int(it['unit_price_cents']))} €; MwSt {int(float(it['vat_rate'])*100)}%) "
+                    f"= **{cent_zu_euro_text(line_gross)} €**"
+                )
+
+            totals = db.compute_totals(order_id)
+            st.markdown("---")
+            st.write(f"Lieferpauschale: {cent_zu_euro_text(totals['delivery_fee_cents'])} €")
+            st.write(f"Rabatt: -{cent_zu_euro_text(totals['discount_cents'])} €")
+            st.write(f"**Gesamt (Brutto): {cent_zu_euro_text(totals['gross_total_cents'])} €**")
+
+            st.write("**MwSt-Aufschlüsselung**")
+            for vat_rate, vals in sorted(totals["by_vat"].items(), key=lambda x: x[0]):
+                st.write(
+                    f"- {int(vat_rate*100)}%: Netto {cent_zu_euro_text(vals['net'])} € / "
+                    f"MwSt {cent_zu_euro_text(vals['vat'])} € / "
+                    f"Brutto {cent_zu_euro_text(vals['gross'])} €"
+                )
+
+        # -------------------- Rechte Seite: Status, Zahlung, Rechnung --------------------
+        with rechts:
+            st.write("**Status / Zahlung / Rechnung**")
+
+            neuer_status = st.selectbox(
+                "Auftragsstatus",
+                options=list(STATUS_LABELS.keys()),
+                index=list(STATUS_LABELS.keys()).index(o["status"]),
+                format_func=lambda k: STATUS_LABELS[k],
+                key=f"status_{order_id}",
+            )
+
+            aktuelle_art = o.get("payment_method") or ""
+            if aktuelle_art not in ZAHLUNGSARTEN:
+                ZAHLUNGSARTEN.append(aktuelle_art)
+
+            zahl_art = st.selectbox(
+                "Zahlungsart",
+                options=ZAHLUNGSARTEN,
+                index=ZAHLUNGSARTEN.index(aktuelle_art),
+                format_func=lambda k: ZAHLUNGSART_LABELS.get(k, k),
+                key=f"paymethod_{order_id}",
+            )
+
+            s1, s2 = st.columns(2)
+            with s1:
+                if st.button("Status speichern", key=f"save_status_{order_id}"):
+                    try:
+                        db.update_status(order_id, neuer_status)
+                        st.success("Auftragsstatus aktualisiert")
+                        bestellung_neu_laden(order_id)
+                    except Exception as e:
+                        st.error(f"Fehler: {e}")
+
+            with s2:
+                if st.button("Zahlung speichern", key=f"save_pay_{order_id}"):
+                    try:
+                        with db.unit_of_work() as conn:
+                            db.set_payment_method(order_id, zahl_art, conn=conn)   # nur Zahlungsart speichern
+                            db.update_status(order_id, "paid", conn=conn)          # Auftrag auf bezahlt setzen
+                        st.success("Zahlung gespeichert und Auftrag auf 'Bezahlt' gesetzt")
+                        bestellung_neu_laden(order_id)
+                    except Exception as e:
+                        st.error(f"Fehler: {e}")
+
+
+            st.markdown("---")
+
+            if not o.get("invoice_number"):
+                if st.button("Rechnungsnummer vergeben", key=f"assign_inv_{order_id}"):
+                    try:
+                        inv = db.assign_invoice_number(order_id)
+                        st.success(f"Rechnung vergeben: {inv}")
+                        bestellung_neu_laden(order_id)
+                    except Exception as e:
+                        st.error(f"Fehler: {e}")
+            else:
+                st.write(f"Rechnungsnummer: **{o['invoice_number']}**")
+                st.write(f"Rechnungsdatum: **{o.get('invoice_date') or '-'}**")
+
+            if st.button("Rechnung als PDF erzeugen", key=f"pdf_{order_id}"):
+                try:
+                    import invoice_pdf
+
+                    # Falls du invoice_pdf.py deutsch benannt hast:
+                    if hasattr(invoice_pdf, "rechnung_pdf_erzeugen"):
+                        pdf_path = invoice_pdf.rechnung_pdf_erzeugen(order_id)
+                    else:
+                        # Falls noch alte Funktion:
+                        pdf_path = invoice_pdf.generate_invoice_pdf(order_id)
+
+                    # Rechnungsnummer kann dabei vergeben worden sein
+                    st.session_state[f"order_row_{order_id}"] = db.get_order_with_customer(order_id)
+                    st.success(f"PDF erstellt: {pdf_path}")
+
+                    pdf_bytes = Path(pdf_path).read_bytes()
+                    st.download_button(
+                        label="PDF herunterladen",
+                        data=pdf_bytes,
+                        file_name=Path(pdf_path).name,
+                        mime="application/pdf",
+                        key=f"dl_{order_id}",
+                    )
+                except Exception as e:
+                    st.error(f"Fehler: {e}")
+
+            st.markdown("---")
+            st.write("**Bestellung löschen**")
+
+            bestaetigen = st.checkbox(
+                "Ich möchte diese Bestellung endgültig löschen",
+                key=f"del_confirm_{order_id}",
+            )
+
+            if st.button("Bestellung löschen", key=f"del_btn_{order_id}", disabled=not bestaetigen):
+                try:
+                    db.delete_order(order_id)
+                    st.success("Bestellung wurde gelöscht.")
+                    st.rerun()  # Liste ändert sich -> ganze Seite neu
+                except Exception as e:
+                    st.error(f"Fehler: {e}")
+
+
 # ==========================================================
 # TAB 2: Tagesliste / Rechnungen
 # ==========================================================
 with tab_tagesliste:
     st.subheader("Tagesliste / Rechnungen")
 
+    # Volltextsuche über alle Bestellungen, unabhängig vom Zeitraum unten
+    such_text = st.text_input(
+        "Suche",
+        key="bestell_suche",
+        placeholder="Notiz, Position, Kunde, Telefon oder Rechnungsnummer – z. B. glutenfrei Müller",
+    ).strip()
+    if such_text:
+        s1, s2, s3 = st.columns(3)
+        such_status = s1.selectbox(
+            "Status",
+            options=[""] + list(STATUS_LABELS),
+            format_func=lambda s: STATUS_LABELS.get(s, "Alle"),
+            key="suche_status",
+        )
+        such_von = s2.date_input("Datum ab", value=None, key="suche_von")
+        such_bis = s3.date_input("Datum bis", value=None, key="suche_bis")
+
+        # Neue Suche beginnt wieder mit der ersten Seite
+        such_filter = (such_text, such_status, such_von, such_bis)
+        if st.session_state.get("bestell_suche_filter") != such_filter:
+            st.session_state["bestell_suche_filter"] = such_filter
+            st.session_state["bestell_suche_anzahl"] = 20
+        anzahl = st.session_state.setdefault("bestell_suche_anzahl", 20)
+
+        such_treffer, weitere = db.search_orders(
+            such_text,
+            limit=anzahl,
+            start_date=such_von.isoformat() if such_von else None,
+            end_date=such_bis.isoformat() if such_bis else None,
+            status=such_status or None,
+        )
+
+        def suche_weiter_laden():
+            st.session_state["bestell_suche_anzahl"] += 20
+
+        if not such_treffer:
+            st.info("Keine Bestellungen gefunden.")
+        else:
+            # Volle Seite: Trefferzeilen sind frisch, zwischengespeicherte Einzelzeilen verwerfen
+            for key in [k for k in st.session_state if str(k).startswith("order_row_")]:
+                del st.session_state[key]
+
+            for o in such_treffer:
+                st.caption(f"{o.event_date}: {o.snippet or ''}")
+                bestellung_anzeigen(o)
+            if weitere:
+                st.button("Weitere Treffer", on_click=suche_weiter_laden, key="bestell_suche_mehr")
+        st.divider()
+
     col1, col2 = st.columns([1, 1])
     with col1:
         start_tag = st.date_input(
@@ -340,165 +744,341 @@ with tab_tagesliste:
             key="end_tag"
         )
 
-    orders = db.list_orders_for_period(start_tag.isoformat(), end_tag.isoformat())
+    if st.button(f"Tagesplan {start_tag.strftime('%d.%m.%Y')} als PDF", key="tagesplan_pdf"):
+        try:
+            import invoice_pdf
+
+            plan_path = invoice_pdf.tagesplan_pdf_erzeugen(start_tag.isoformat())
+            st.download_button(
+                label="Tagesplan herunterladen",
+                data=Path(plan_path).read_bytes(),
+                file_name=Path(plan_path).name,
+                mime="application/pdf",
+                key="dl_tagesplan",
+            )
+        except Exception as e:
+            st.error(f"Fehler: {e}")
 
-    if not orders:
+    with st.expander(f"Auslastung {start_tag.strftime('%d.%m.%Y')} und Kapazitäten je Zeitfenster"):
+        auslastung = db.free_slots(start_tag.isoformat())
+        if auslastung:
+            st.dataframe(
+                [
+                    {"Zeitfenster": s.slot, "Art": ART_LABELS.get(s.fulfilment_type, s.fulfilment_type), "Belegung": auslastung_text(s)}
+                    for s in auslastung
+                ],
+                hide_index=True,
+            )
+
+        st.caption(f"Obergrenzen je {db.SLOT_MINUTEN}-Minuten-Fenster; leere Felder = keine Grenze.")
+        kapazitaeten = pd.DataFrame(
+            [
+                {"Zeitfenster": k.slot, "Art": k.fulfilment_type, "Max. Bestellungen/Fahrten": k.max_orders, "Max. Portionen": k.max_portions}
+                for k in db.list_slot_capacities()
+            ],
+            columns=["Zeitfenster", "Art", "Max. Bestellungen/Fahrten", "Max. Portionen"],
+        )
+        kapazitaeten = st.data_editor(
+            kapazitaeten,
+            num_rows="dynamic",
+            hide_index=True,
+            column_config={
+                "Art": st.column_config.SelectboxColumn(options=list(ART_LABELS), required=True),
+                "Max. Bestellungen/Fahrten": st.column_config.NumberColumn(min_value=0, step=1),
+                "Max. Portionen": st.column_config.NumberColumn(min_value=0),
+            },
+            key="kapazitaeten",
+        )
+        if st.button("Kapazitäten speichern", key="kapazitaeten_speichern"):
+            try:
+                db.set_slot_capacities([
+                    {
+                        "slot": str(k["Zeitfenster"] or "").strip(),
+                        "fulfilment_type": k["Art"],
+                        "max_orders": None if pd.isna(k["Max. Bestellungen/Fahrten"]) else int(k["Max. Bestellungen/Fahrten"]),
+                        "max_portions": None if pd.isna(k["Max. Portionen"]) else float(k["Max. Portionen"]),
+                    }
+                    for k in kapazitaeten.to_dict("records")
+                ])
+                st.success("Kapazitäten gespeichert")
+            except ValueError as e:
+                st.error(f"Fehler: {e}")
+
+    with st.expander(f"Einkaufsliste {start_tag.strftime('%d.%m.%Y')} – {end_tag.strftime('%d.%m.%Y')}"):
+        einkauf, ohne_rezept = db.purchasing_list(start_tag.isoformat(), end_tag.isoformat())
+        if einkauf:
+            einkauf_df = pd.DataFrame(
+                [{"Zutat": e.name, "Menge": e.quantity, "Einheit": e.unit} for e in einkauf]
+            )
+            st.dataframe(einkauf_df, hide_index=True)
+            st.download_button(
+                "Einkaufsliste als CSV",
+                data=einkauf_df.to_csv(index=False, sep=";", decimal=",").encode("utf-8-sig"),
+                file_name=f"einkauf_{start_tag.isoformat()}_{end_tag.isoformat()}.csv",
+                mime="text/csv",
+                key="dl_einkauf",
+            )
+        else:
+            st.info("Keine Zutaten im Zeitraum (keine Bestellungen oder keine Rezepturen hinterlegt).")
+        if ohne_rezept:
+            st.caption("Ohne Rezeptur (nicht aufgelöst):")
+            st.dataframe(
+                [{"Position": o.description, "Menge": o.quantity, "Einheit": o.unit} for o in ohne_rezept],
+                hide_index=True,
+            )
+
+    if len(STANDORTE) > 1:
+        with st.expander(f"Alle Standorte {start_tag.strftime('%d.%m.%Y')} – {end_tag.strftime('%d.%m.%Y')} (nur lesen)"):
+            import federation
+
+            alle = federation.orders_for_period(start_tag.isoformat(), end_tag.isoformat())
+            if alle:
+                st.dataframe(
+                    [
+                        {
+                            "Standort": STANDORTE[z.location].name,
+                            "Datum": z.row.event_date,
+                            "Uhrzeit": z.row.event_time,
+                            "Art": ART_LABELS.get(z.row.fulfilment_type, z.row.fulfilment_type),
+                            "Status": STATUS_LABELS.get(z.row.status, z.row.status),
+                            "Kunde": z.row.customer_name or "",
+                            "Rechnung": z.row.invoice_number or "",
+                        }
+                        for z in alle
+                    ],
+                    hide_index=True,
+                )
+                einkauf_alle, _ = federation.purchasing_list(start_tag.isoformat(), end_tag.isoformat())
+                if einkauf_alle:
+                    st.caption("Einkauf aller Standorte:")
+                    st.dataframe(
+                        [{"Zutat": e.name, "Menge": e.quantity, "Einheit": e.unit} for e in einkauf_alle],
+                        hide_index=True,
+                    )
+            else:
+                st.info("Keine Bestellungen in diesem Zeitraum.")
+
+    # Während der Suche erscheinen die Bestellungen nur in den Treffern
+    orders = [] if such_text else db.list_orders_for_period(start_tag.isoformat(), end_tag.isoformat())
+
+    if such_text:
+        st.caption("Tagesliste ausgeblendet, solange ein Suchbegriff eingegeben ist.")
+    elif not orders:
         st.info("Keine Bestellungen für diesen Tag.")
     else:
+        # Volle Seite: Listenzeilen sind frisch, zwischengespeicherte Einzelzeilen verwerfen
+        for key in [k for k in st.session_state if str(k).startswith("order_row_")]:
+            del st.session_state[key]
+
         for o in orders:
-            order_id = int(o["id"])
+            bestellung_anzeigen(o)
+
 
-            titel = (
-                f"#{order_id} – {o['event_time']} – "
-                f"{ART_LABELS.get(o['fulfilment_type'], o['fulfilment_type'])} – "
-                f"{STATUS_LABELS.get(o['status'], o['status'])}"
+# ==========================================================
+# TAB 3: Kunden (Historie und Kennzahlen)
+# ==========================================================
+with tab_kunden:
+    st.subheader("Kunden")
+
+    suche = st.text_input("Name oder Telefon", key="kunden_suche")
+    treffer = db.find_customers(suche)
+
+    if suche.strip() and not treffer:
+        st.info("Keine Kunden gefunden.")
+
+    if treffer:
+        treffer_by_id = {k.id: k for k in treffer}
+        kunde_id = st.selectbox(
+            "Kunde",
+            options=list(treffer_by_id),
+            format_func=lambda k: f"{treffer_by_id[k].name} ({treffer_by_id[k].phone or 'ohne Telefon'})",
+            key="kunde_auswahl",
+        )
+        kunde = treffer_by_id[kunde_id]
+
+        k1, k2, k3, k4 = st.columns(4)
+        k1.metric("Bestellungen", kunde.order_count)
+        k2.metric("Umsatz (brutto)", f"{cent_zu_euro_text(kunde.lifetime_gross_cents)} €")
+        k3.metric("Offen", f"{cent_zu_euro_text(kunde.open_balance_cents)} €")
+        k4.metric("Letzte Bestellung", kunde.last_order_date or "-")
+        if kunde.address:
+            st.write(f"Adresse: {kunde.address}")
+
+        # Historie seitenweise (Cursor), beim Kundenwechsel neu beginnen
+        historie = st.session_state.get("kunden_historie")
+        if not historie or historie["kunde_id"] != kunde_id:
+            zeilen, cursor = db.get_customer_history(kunde_id, limit=20)
+            historie = st.session_state["kunden_historie"] = {"kunde_id": kunde_id, "zeilen": zeilen, "cursor": cursor}
+
+        def historie_weiter_laden():
+            standort_setzen()
+            h = st.session_state["kunden_historie"]
+            zeilen, cursor = db.get_customer_history(h["kunde_id"], limit=20, cursor=h["cursor"])
+            h["zeilen"] = h["zeilen"] + zeilen
+            h["cursor"] = cursor
+
+        st.write("**Bestellungen**")
+        if not historie["zeilen"]:
+            st.info("Noch keine Bestellungen.")
+        else:
+            st.dataframe(
+                [
+                    {
+                        "Nr.": z.id,
+                        "Datum": z.event_date,
+                        "Uhrzeit": z.event_time,
+                        "Art": ART_LABELS.get(z.fulfilment_type, z.fulfilment_type),
+                        "Status": STATUS_LABELS.get(z.status, z.status),
+                        "Rechnung": z.invoice_number or "",
+                        "Brutto (€)": cent_zu_euro_text(z.gross_total_cents),
+                    }
+                    for z in historie["zeilen"]
+                ],
+                hide_index=True,
+                use_container_width=True,
+            )
+        if historie["cursor"]:
+            st.button("Weitere laden", on_click=historie_weiter_laden, key="kunden_historie_mehr")
+
+    with st.expander("Mögliche Dubletten"):
+        st.caption("Gleiche Telefonnummer, ähnlich klingender Name oder gleiche Anschrift; beim Zusammenführen wandern alle Bestellungen zum behaltenen Kunden.")
+        if st.button("Dubletten suchen", key="dubletten_suchen"):
+            import customer_dedup
+
+            st.session_state["dubletten"] = customer_dedup.kandidaten(limit=50)
+
+        def dublette_zusammenfuehren(paar):
+            import customer_dedup
+
+            standort_setzen()
+            customer_dedup.zusammenfuehren(paar)
+            entfernt = paar.duplicate.id
+            st.session_state["dubletten"] = [
+                p for p in st.session_state["dubletten"] if entfernt not in (p.keep.id, p.duplicate.id)
+            ]
+
+        dubletten = st.session_state.get("dubletten")
+        if dubletten is not None and not dubletten:
+            st.info("Keine wahrscheinlichen Dubletten gefunden.")
+        for nr, paar in enumerate(dubletten or []):
+            d1, d2, d3 = st.columns([3, 3, 1])
+            d1.write(f"**{paar.keep.name}** ({paar.keep.phone or 'ohne Telefon'}, {paar.keep.order_count} Best.)  \n{paar.keep.address or ''}")
+            d2.write(f"{paar.duplicate.name} ({paar.duplicate.phone or 'ohne Telefon'}, {paar.duplicate.order_count} Best.)  \n{paar.duplicate.address or ''}")
+            d3.button(
+                f"{paar.score:.0%} zusammenführen",
+                on_click=dublette_zusammenfuehren,
+                args=(paar,),
+                key=f"dublette_{paar.keep.id}_{paar.duplicate.id}",
+                help=", ".join(paar.gruende),
             )
-            if o.get("customer_name"):
-                titel += f" – {o['customer_name']}"
-            if o.get("invoice_number"):
-                titel += f" – Rechnung {o['invoice_number']}"
-
-            with st.expander(titel, expanded=False):
-                links, rechts = st.columns([3, 2])
-
-                # -------------------- Linke Seite: Details --------------------
-                with links:
-                    st.write("**Kunde**")
-                    st.write(f"Name: {o.get('customer_name') or '-'}")
-                    st.write(f"Telefon: {o.get('customer_phone') or '-'}")
-                    if o["fulfilment_type"] == "delivery":
-                        st.write(f"Adresse: {o.get('customer_address') or '-'}")
-
-                    if o.get("notes"):
-                        st.write("**Notizen**")
-                        st.write(o["notes"])
-
-                    st.write("**Positionen**")
-                    items = db.get_order_items(order_id)
-                    for it in items:
-                        line_gross = int(round(float(it["quantity"]) * int(it["unit_price_cents"])))
-                        einheit = (it.get("unit") or "").strip()
-                        einheit_txt = f" {einheit}" if einheit else ""
-                        st.write(
-                            f"- {float(it['quantity']):g}{einheit_txt} × {it['description']} "
-                            f"({cent_zu_euro_text(int(it['unit_price_cents']))} €; MwSt {int(float(it['vat_rate'])*100)}%) "
-                            f"= **{cent_zu_euro_text(line_gross)} €**"
-                        )
-
-                    totals = db.compute_totals(order_id)
-                    st.markdown("---")
-                    st.write(f"Lieferpauschale: {cent_zu_euro_text(totals['delivery_fee_cents'])} €")
-                    st.write(f"Rabatt: -{cent_zu_euro_text(totals['discount_cents'])} €")
-                    st.write(f"**Gesamt (Brutto): {cent_zu_euro_text(totals['gross_total_cents'])} €**")
-
-                    st.write("**MwSt-Aufschlüsselung**")
-                    for vat_rate, vals in sorted(totals["by_vat"].items(), key=lambda x: x[0]):
-                        st.write(
-                            f"- {int(vat_rate*100)}%: Netto {cent_zu_euro_text(vals['net'])} € / "
-                            f"MwSt {cent_zu_euro_text(vals['vat'])} € / "
-                            f"Brutto {cent_zu_euro_text(vals['gross'])} €"
-                        )
-
-                # -------------------- Rechte Seite: Status, Zahlung, Rechnung --------------------
-                with rechts:
-                    st.write("**Status / Zahlung / Rechnung**")
-
-                    neuer_status = st.selectbox(
-                        "Auftragsstatus",
-                        options=list(STATUS_LABELS.keys()),
-                        index=list(STATUS_LABELS.keys()).index(o["status"]),
-                        format_func=lambda k: STATUS_LABELS[k],
-                        key=f"status_{order_id}",
-                    )
 
-                    aktuelle_art = o.get("payment_method") or ""
-                    if aktuelle_art not in ZAHLUNGSARTEN:
-                        ZAHLUNGSARTEN.append(aktuelle_art)
 
-                    zahl_art = st.selectbox(
-                        "Zahlungsart",
-                        options=ZAHLUNGSARTEN,
-                        index=ZAHLUNGSARTEN.index(aktuelle_art),
-                        format_func=lambda k: ZAHLUNGSART_LABELS.get(k, k),
-                        key=f"paymethod_{order_id}",
-                    )
+# ==========================================================
+# TAB 4: Serien (Vorlagen wiederkehrender Bestellungen)
+# Änderungen gelten für alle künftigen, noch nicht abgerechneten Termine.
+# ==========================================================
+with tab_serien:
+    st.subheader("Serienbestellungen")
+
+    vorlagen = db.list_order_templates()
+    if not vorlagen:
+        st.info("Keine aktiven Serien. Anlegen über „Neue Bestellung“ → „Als Serie speichern“.")
+
+    for t in vorlagen:
+        tage_text = ", ".join(WOCHENTAGE[int(w)] for w in t.weekdays.split(","))
+        intervall_text = "jede Woche" if t.interval_weeks == 1 else f"alle {t.interval_weeks} Wochen"
+        with st.expander(f"{t.name} – {tage_text} {t.event_time} ({intervall_text}, {ART_LABELS.get(t.fulfilment_type, t.fulfilment_type)})"):
+            st.caption(
+                f"Kunde: {t.customer_name or '-'} | ab {t.start_date} | bis {t.end_date or 'offen'} | "
+                f"erzeugt bis {t.generated_until or '-'}"
+            )
+            v1, v2, v3 = st.columns(3)
+            v_zeit = v1.time_input("Uhrzeit", value=dt.time.fromisoformat(t.event_time), key=f"vz_{t.id}")
+            v_art = v2.selectbox(
+                "Art",
+                options=list(ART_LABELS),
+                index=list(ART_LABELS).index(t.fulfilment_type),
+                format_func=lambda k: ART_LABELS[k],
+                key=f"va_{t.id}",
+            )
+            v_intervall = v3.number_input("Alle … Wochen", min_value=1, step=1, value=int(t.interval_weeks), key=f"vi_{t.id}")
+            v_tage = st.multiselect(
+                "Wochentage",
+                options=list(range(7)),
+                default=[int(w) for w in t.weekdays.split(",")],
+                format_func=lambda w: WOCHENTAGE[w],
+                key=f"vt_{t.id}",
+            )
+            v4, v5, v6 = st.columns(3)
+            v_liefer = v4.number_input("Lieferpauschale (EUR)", min_value=0.0, step=1.0, value=t.delivery_fee_cents / 100, key=f"vl_{t.id}")
+            v_rabatt = v5.number_input("Rabatt (EUR)", min_value=0.0, step=1.0, value=t.discount_cents / 100, key=f"vr_{t.id}")
+            v_ende = v6.date_input(
+                "Letzter Termin",
+                value=dt.date.fromisoformat(t.end_date) if t.end_date else None,
+                format="DD.MM.YYYY",
+                key=f"ve_{t.id}",
+            )
+            v_notizen = st.text_area("Notizen", value=t.notes or "", key=f"vn_{t.id}")
+
+            v_positionen = st.data_editor(
+                [
+                    {
+                        "Beschreibung": p.description,
+                        "Menge": p.quantity,
+                        "Einheit": p.unit,
+                        "Einzelpreis (EUR)": p.unit_price_cents / 100,
+                        "MwSt": p.vat_rate,
+                        "product_id": p.product_id,
+                    }
+                    for p in db.get_order_template_items(t.id)
+                ],
+                num_rows="dynamic",
+                column_config={"product_id": None},
+                key=f"vp_{t.id}",
+            )
 
-                    s1, s2 = st.columns(2)
-                    with s1:
-                        if st.button("Status speichern", key=f"save_status_{order_id}"):
-                            try:
-                                db.update_status(order_id, neuer_status)
-                                st.success("Auftragsstatus aktualisiert")
-                                st.rerun()
-                            except Exception as e:
-                                st.error(f"Fehler: {e}")
-
-                    with s2:
-                        if st.button("Zahlung speichern", key=f"save_pay_{order_id}"):
-                            try:
-                                db.set_payment_method(order_id, zahl_art)   # nur Zahlungsart speichern
-                                db.update_status(order_id, "paid")          # Auftrag auf bezahlt setzen
-                                st.success("Zahlung gespeichert und Auftrag auf 'Bezahlt' gesetzt")
-                                st.rerun()
-                            except Exception as e:
-                                st.error(f"Fehler: {e}")
-
-
-                    st.markdown("---")
-
-                    if not o.get("invoice_number"):
-                        if st.button("Rechnungsnummer vergeben", key=f"assign_inv_{order_id}"):
-                            try:
-                                inv = db.assign_invoice_number(order_id)
-                                st.success(f"Rechnung vergeben: {inv}")
-                                st.rerun()
-                            except Exception as e:
-                                st.error(f"Fehler: {e}")
-                    else:
-                        st.write(f"Rechnungsnummer: **{o['invoice_number']}**")
-                        st.write(f"Rechnungsdatum: **{o.get('invoice_date') or '-'}**")
-
-                    if st.button("Rechnung als PDF erzeugen", key=f"pdf_{order_id}"):
-                        try:
-                            # Falls du invoice_pdf.py deutsch benannt hast:
-                            if hasattr(invoice_pdf, "rechnung_pdf_erzeugen"):
-                                pdf_path = invoice_pdf.rechnung_pdf_erzeugen(order_id)
-                            else:
-                                # Falls noch alte Funktion:
-                                pdf_path = invoice_pdf.generate_invoice_pdf(order_id)
-
-                            st.success(f"PDF erstellt: {pdf_path}")
-
-                            pdf_bytes = Path(pdf_path).read_bytes()
-                            st.download_button(
-                                label="PDF herunterladen",
-                                data=pdf_bytes,
-                                file_name=Path(pdf_path).name,
-                                mime="application/pdf",
-                                key=f"dl_{order_id}",
-                            )
-                        except Exception as e:
-                            st.error(f"Fehler: {e}")
-
-                    st.markdown("---")
-                    st.write("**Bestellung löschen**")
-
-                    bestaetigen = st.checkbox(
-                        "Ich möchte diese Bestellung endgültig löschen",
-                        key=f"del_confirm_{order_id}",
+            b1, b2 = st.columns(2)
+            if b1.button("Speichern (künftige Termine anpassen)", key=f"vs_{t.id}", type="primary"):
+                try:
+                    anzahl = db.update_order_template(
+                        t.id,
+                        customer_id=t.customer_id,
+                        name=t.name,
+                        event_time=v_zeit.strftime("%H:%M"),
+                        fulfilment_type=v_art,
+                        notes=v_notizen,
+                        weekdays=v_tage,
+                        interval_weeks=int(v_intervall),
+                        start_date=t.start_date,
+                        end_date=v_ende.isoformat() if v_ende else None,
+                        discount_cents=euro_zu_cent(v_rabatt),
+                        delivery_fee_cents=euro_zu_cent(v_liefer),
+                        items=[
+                            {
+                                "product_id": p.get("product_id"),
+                                "description": p.get("Beschreibung") or "",
+                                "quantity": float(p.get("Menge") or 1),
+                                "unit": p.get("Einheit") or "Stk",
+                                "unit_price_cents": euro_zu_cent(p.get("Einzelpreis (EUR)") or 0),
+                                "vat_rate": float(p.get("MwSt") or 0.19),
+                            }
+                            for p in v_positionen
+                        ],
                     )
-
-                    if st.button("Bestellung löschen", key=f"del_btn_{order_id}", disabled=not bestaetigen):
-                        try:
-                            db.delete_order(order_id)
-                            st.success("Bestellung wurde gelöscht.")
-                            st.rerun()
-                        except Exception as e:
-                            st.error(f"Fehler: {e}")
+                    st.success(f"Serie gespeichert, {anzahl} künftige Bestellungen angepasst")
+                except ValueError as e:
+                    st.error(f"Fehler: {e}")
+            if b2.button("Serie beenden", key=f"vx_{t.id}"):
+                try:
+                    anzahl = db.end_order_template(t.id)
+                    st.success(f"Serie beendet, {anzahl} künftige Bestellungen entfernt")
+                    st.rerun()
+                except ValueError as e:
+                    st.error(f"Fehler: {e}")
 
 
 # ==========================================================
-# TAB 3: Produktliste
+# TAB 5: Produktliste
 # ==========================================================
 
 with tab_produkte:
@@ -522,6 +1102,7 @@ with tab_produkte:
             default_quantity=float(pqty),
             sku=psku or None,
         )
+        produktkatalog.clear()
         st.success(f"Produkt angelegt (ID {pid})")
 
     st.markdown("---")
@@ -533,3 +1114,67 @@ with tab_produkte:
             f"{p['default_unit_price_cents']/100:.2f} € | MwSt {int(p['default_vat_rate']*100)}% | Aktiv: {bool(p['is_active'])}"
         )
 
+    st.markdown("---")
+    st.write("**Rezepturen**")
+    st.caption("Bestandteile je 1 Einheit des Produkts – Zutaten oder andere Produkte als Unterrezept.")
+
+    zcol1, zcol2, zcol3 = st.columns([2, 1, 1])
+    with zcol1:
+        zname = st.text_input("Neue Zutat", key="zutat_name")
+    with zcol2:
+        zunit = st.text_input("Einheit", value="kg", key="zutat_einheit")
+    with zcol3:
+        st.write("")
+        if st.button("Zutat anlegen", key="zutat_anlegen"):
+            try:
+                db.create_ingredient(zname, zunit)
+                st.success("Zutat angelegt")
+            except ValueError as e:
+                st.error(f"Fehler: {e}")
+
+    if produkte:
+        rezept_produkt = st.selectbox(
+            "Rezeptur für",
+            options=produkte,
+            format_func=lambda p: p["name"],
+            key="rezept_produkt",
+        )
+        # Bestandteile als Auswahltext "Zutat: Mehl (kg)" / "Produkt: Kartoffelsalat"
+        bestandteile = {f"Zutat: {z.name} ({z.unit})": ("ingredient_id", z.id) for z in db.list_ingredients()}
+        bestandteile.update({
+            f"Produkt: {p['name']}": ("sub_product_id", p["id"]) for p in produkte if p["id"] != rezept_produkt["id"]
+        })
+        beschriftung = {v: k for k, v in bestandteile.items()}
+
+        rezept_df = pd.DataFrame(
+            [
+                {
+                    "Bestandteil": beschriftung.get(
+                        ("ingredient_id", r.ingredient_id) if r.ingredient_id is not None else ("sub_product_id", r.sub_product_id)
+                    ),
+                    "Menge je Einheit": r.quantity,
+                }
+                for r in db.get_recipe(rezept_produkt["id"])
+            ],
+            columns=["Bestandteil", "Menge je Einheit"],
+        )
+        rezept_df = st.data_editor(
+            rezept_df,
+            num_rows="dynamic",
+            hide_index=True,
+            column_config={
+                "Bestandteil": st.column_config.SelectboxColumn(options=list(bestandteile), required=True),
+                "Menge je Einheit": st.column_config.NumberColumn(min_value=0.0, format="%.3f"),
+            },
+            key=f"rezept_{rezept_produkt['id']}",
+        )
+        if st.button("Rezeptur speichern", key="rezept_speichern"):
+            try:
+                db.set_recipe(rezept_produkt["id"], [
+                    {bestandteile[r["Bestandteil"]][0]: bestandteile[r["Bestandteil"]][1], "quantity": r["Menge je Einheit"]}
+                    for r in rezept_df.to_dict("records")
+                    if r["Bestandteil"] in bestandteile
+                ])
+                st.success("Rezeptur gespeichert")
+            except ValueError as e:
+                st.error(f"Fehler: {e}")
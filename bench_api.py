@@ -0,0 +1,100 @@
+import argparse
+import datetime as dt
+import http.client
+import json
+import random
+import threading
+import time
+
+# ------------------------------------------------------------
+# Lasttest für api_server.py
+# Start: python bench_api.py --clients 16 --seconds 10
+# Mischung aus Zeitraum-Listen, Einzelabrufen und neuen Bestellungen;
+# meldet Anfragen/Sekunde sowie p50/p99-Latenz je Route.
+# ------------------------------------------------------------
+
+
+def _perzentil(sortiert: list[float], p: float) -> float:
+    return sortiert[min(len(sortiert) - 1, int(p * len(sortiert)))]
+
+
+def _neue_bestellung(heute: dt.date) -> dict:
+    tag = heute + dt.timedelta(days=random.randint(0, 30))
+    return {
+        "customer": {"name": "Lasttest", "phone": f"0170{random.randint(0, 9999):04d}", "address": "Teststraße 1"},
+        "event_date": tag.isoformat(),
+        "event_time": f"{random.randint(8, 19):02d}:{random.choice(['00', '15', '30', '45'])}",
+        "fulfilment_type": random.choice(["pickup", "delivery"]),
+        "items": [
+            {"description": "Brötchen", "quantity": 10, "unit": "Stk", "unit_price_cents": 80, "vat_rate": 0.07},
+            {"description": "Kaffee", "quantity": 2, "unit": "Kanne", "unit_price_cents": 900, "vat_rate": 0.19},
+        ],
+    }
+
+
+def client(host: str, port: int, ende: float, anteil_schreiben: float, ergebnisse: list, order_ids: list) -> None:
+    conn = http.client.HTTPConnection(host, port, timeout=30)
+    heute = dt.date.today()
+    while time.perf_counter() < ende:
+        r = random.random()
+        if r < anteil_schreiben:
+            route, method, path = "orders.create", "POST", "/orders"
+            body = json.dumps(_neue_bestellung(heute))
+        elif r < anteil_schreiben + 0.3 and order_ids:
+            route, method, path, body = "orders.get", "GET", f"/orders/{random.choice(order_ids)}", None
+        else:
+            start = heute + dt.timedelta(days=random.randint(0, 30))
+            route, method, body = "orders.list", "GET", None
+            path = f"/orders?from={start.isoformat()}&to={(start + dt.timedelta(days=1)).isoformat()}"
+
+        t0 = time.perf_counter()
+        headers = {"Content-Type": "application/json"} if body else {}
+        conn.request(method, path, body=body, headers=headers)
+        resp = conn.getresponse()
+        data = resp.read()
+        dauer = time.perf_counter() - t0
+
+        ergebnisse.append((route, dauer, resp.status))
+        if route == "orders.create" and resp.status == 201:
+            order_ids.append(json.loads(data)["id"])
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lasttest für die lokale Bestell-API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--write-share", type=float, default=0.1, help="Anteil neuer Bestellungen (0..1)")
+    args = parser.parse_args()
+
+    ergebnisse: list[tuple[str, float, int]] = []
+    order_ids: list[int] = []
+    start = time.perf_counter()
+    ende = start + args.seconds
+    threads = [
+        threading.Thread(target=client, args=(args.host, args.port, ende, args.write_share, ergebnisse, order_ids))
+        for _ in range(args.clients)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    gesamt = time.perf_counter() - start
+
+    print(f"{len(ergebnisse)} Anfragen in {gesamt:.1f} s mit {args.clients} Clients: {len(ergebnisse) / gesamt:.0f} req/s")
+    routen = sorted({r for r, _, _ in ergebnisse})
+    print(f"{'Route':<16}{'Anzahl':>8}{'Fehler':>8}{'req/s':>9}{'p50 ms':>9}{'p99 ms':>9}")
+    for route in routen + ["gesamt"]:
+        werte = [(d, s) for r, d, s in ergebnisse if route in (r, "gesamt")]
+        dauern = sorted(d for d, _ in werte)
+        fehler = sum(1 for _, s in werte if s >= 400)
+        print(
+            f"{route:<16}{len(dauern):>8}{fehler:>8}{len(dauern) / gesamt:>9.0f}"
+            f"{_perzentil(dauern, 0.50) * 1000:>9.2f}{_perzentil(dauern, 0.99) * 1000:>9.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import argparse
+import datetime as dt
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+# ------------------------------------------------------------
+# Import-Zeit-Profil (python -X importtime) für den Kaltstart
+# Start: python bench_importtime.py [--out importtime.jsonl]
+# Misst je Modul in einem frischen Interpreter die kumulierte Importzeit
+# und listet die teuersten Einzelimporte. Mit --out wird eine JSON-Zeile
+# angehängt, damit sich Messungen über Commits vergleichen lassen.
+# ------------------------------------------------------------
+
+PROJEKTORDNER = Path(__file__).resolve().parent
+
+# Was der Streamlit-Start und der Launcher tatsächlich laden (app.py selbst
+# lässt sich nicht außerhalb von Streamlit importieren).
+MODULE = ["db", "catering_manager", "streamlit", "invoice_pdf", "api_server"]
+
+
+def importzeiten(modul: str | None) -> list[tuple[int, int, str]]:
+    """(self_us, cumulative_us, name) je Import aus `python -X importtime`."""
+    ergebnis = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {modul}" if modul else "pass"],
+        cwd=PROJEKTORDNER,
+        capture_output=True,
+        text=True,
+    )
+    if ergebnis.returncode != 0:
+        raise RuntimeError(f"Import von {modul} fehlgeschlagen:\n{ergebnis.stderr[-2000:]}")
+
+    zeilen = []
+    for line in ergebnis.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cum_us, name = line[len("import time:"):].split("|", 2)
+        zeilen.append((int(self_us), int(cum_us), name.rstrip()))
+    return zeilen
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-Zeit-Profil der Module")
+    parser.add_argument("module", nargs="*", default=MODULE)
+    parser.add_argument("--runs", type=int, default=5, help="Messläufe je Modul (Median wird berichtet)")
+    parser.add_argument("--top", type=int, default=8, help="teuerste Einzelimporte je Modul")
+    parser.add_argument("--out", help="JSON-Zeile mit den Ergebnissen an diese Datei anhängen")
+    args = parser.parse_args()
+
+    # Importe des Interpreterstarts (site, .pth-Dateien) nicht mitzählen
+    start_importe = {name.strip() for _, _, name in importzeiten(None)}
+
+    messung = {"timestamp": dt.datetime.now().isoformat(timespec="seconds"), "modules": {}}
+    for modul in args.module:
+        laeufe = [importzeiten(modul) for _ in range(args.runs)]
+        gesamt = sorted(next(cum for _, cum, name in reversed(z) if name.strip() == modul) for z in laeufe)
+        median_us = gesamt[len(gesamt) // 2]
+        messung["modules"][modul] = median_us
+
+        print(f"{modul:<20}{median_us / 1000:>9.1f} ms  (Median aus {args.runs})")
+        teuerste = sorted(laeufe[0], key=lambda z: z[1], reverse=True)
+        teuerste = [z for z in teuerste if z[2].strip() not in start_importe and z[2].strip() != modul]
+        for _, cum_us, name in teuerste[: args.top]:
+            print(f"    {name.strip():<40}{cum_us / 1000:>9.1f} ms")
+
+    if args.out:
+        with open(args.out, "a", encoding="utf-8") as f:
+            f.write(json.dumps(messung) + "\n")
+
+
+if __name__ == "__main__":
+    main()
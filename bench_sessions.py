@@ -0,0 +1,196 @@
+import argparse
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import db
+import invoice_archive
+
+# ------------------------------------------------------------
+# Lasttest für gleichzeitige Sitzungen (Telefon, Theke, Küche)
+# Start: python bench_sessions.py --sessions 8 --seconds 10 [--processes] [--wal] [--mode per_thread]
+#        [--unit-of-work]
+#
+# Jede Sitzung legt in einer Schleife Kunden an/aktualisiert sie, erfasst
+# Bestellungen, vergibt Rechnungsnummern und erzeugt optional PDFs – alles
+# gegen dieselbe, frisch angelegte Datenbankdatei in einem Temp-Ordner.
+# "save" ist der ganze Speichervorgang (Kunde, Bestellung, Rechnungsnummer):
+# ohne --unit-of-work drei Transaktionen, mit einer (db.unit_of_work).
+# Bericht: Durchsatz, p50/p99 je Operation, "database is locked",
+# doppelte Rechnungsnummern, Lücken im Nummernkreis und doppelt angelegte Kunden.
+# ------------------------------------------------------------
+
+PROJEKTORDNER = Path(__file__).resolve().parent
+OPERATIONEN = ["save", "upsert_customer", "create_order", "assign_invoice_number", "pdf"]
+SPEICHERSCHRITTE = {"upsert_customer", "create_order", "assign_invoice_number"}
+
+
+def _perzentil(sortiert: list[float], p: float) -> float:
+    return sortiert[min(len(sortiert) - 1, int(p * len(sortiert)))]
+
+
+def _konfigurieren(db_path: str, mode: str, timeout: float) -> None:
+    db.DB_PATH = Path(db_path)
+    db.CONNECTION_MODE = mode
+    db.BUSY_TIMEOUT_S = timeout
+    invoice_archive.PACK_PATH = Path(db_path).parent / "rechnungen" / "rechnungen.pack"
+
+
+def sitzung(
+    nr: int, db_path: str, mode: str, timeout: float, sekunden: float, pdf_jede: int, einheit: bool = False
+) -> list[tuple]:
+    """Eine simulierte Sitzung; liefert (operation, dauer_s, fehlerart|None) je Aufruf."""
+    _konfigurieren(db_path, mode, timeout)
+    rnd = random.Random(nr)
+    ergebnisse = []
+    ende = time.perf_counter() + sekunden
+    runde = 0
+
+    def messen(operation, fn, *args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            wert = fn(*args, **kwargs)
+            ergebnisse.append((operation, time.perf_counter() - t0, None))
+            return wert
+        except Exception as e:
+            if isinstance(e, sqlite3.OperationalError):
+                art = "locked" if "locked" in str(e) else "operational"
+            else:
+                art = "integrity" if isinstance(e, sqlite3.IntegrityError) else "other"
+            ergebnisse.append((operation, time.perf_counter() - t0, art))
+            # Ein fehlgeschlagener Teilschritt bricht den ganzen Speichervorgang ab
+            if operation in SPEICHERSCHRITTE:
+                raise
+        return None
+
+    def speichern(conn=None):
+        # Stammkunden teilen sich Telefonnummern über alle Sitzungen -> Konflikte bei upsert_customer
+        kunden_id = messen("upsert_customer", db.upsert_customer,
+                           f"Kunde {rnd.randint(0, 199)}", f"0170{rnd.randint(0, 199):04d}", "Teststraße 1", conn=conn)
+        order_id = messen("create_order", db.create_order,
+                          customer_id=kunden_id,
+                          event_date="2026-01-15",
+                          event_time=f"{rnd.randint(8, 19):02d}:00",
+                          fulfilment_type=rnd.choice(["pickup", "delivery"]),
+                          notes=None,
+                          items=[{"description": "Buffet", "quantity": 10, "unit_price_cents": 1490, "vat_rate": 0.07}],
+                          conn=conn)
+        messen("assign_invoice_number", db.assign_invoice_number, order_id, conn=conn)
+        return order_id
+
+    def in_einheit():
+        with db.unit_of_work() as conn:
+            return speichern(conn)
+
+    while time.perf_counter() < ende:
+        runde += 1
+        # Einzelzeiten innerhalb der Einheit enthalten den Commit nicht; "save" schon
+        order_id = messen("save", in_einheit if einheit else speichern)
+        if order_id is None:
+            continue
+        if pdf_jede and runde % pdf_jede == 0:
+            import invoice_pdf
+
+            messen("pdf", invoice_pdf.rechnung_pdf_erzeugen, order_id, out_dir=str(Path(db_path).parent / "rechnungen"))
+    return ergebnisse
+
+
+def _nummernkreis_pruefen(db_path: Path) -> tuple[int, int, int]:
+    """(vergebene Nummern, doppelte Nummern, Lücken) im Rechnungsnummernkreis."""
+    conn = sqlite3.connect(db_path)
+    nummern = [int(r[0]) for r in conn.execute("SELECT invoice_number FROM orders WHERE invoice_number IS NOT NULL")]
+    naechste = int(conn.execute("SELECT value FROM settings WHERE key='next_invoice_number'").fetchone()[0])
+    conn.close()
+    doppelt = len(nummern) - len(set(nummern))
+    luecken = len(set(range(1001, naechste)) - set(nummern))
+    return len(nummern), doppelt, luecken
+
+
+def _doppelte_kunden(db_path: Path) -> int:
+    """Kunden, die unter derselben Telefonnummer mehrfach angelegt wurden."""
+    conn = sqlite3.connect(db_path)
+    anzahl = conn.execute(
+        "SELECT COALESCE(SUM(n - 1), 0) FROM (SELECT COUNT(*) AS n FROM customers WHERE phone IS NOT NULL GROUP BY phone)"
+    ).fetchone()[0]
+    conn.close()
+    return anzahl
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gleichzeitige Sitzungen gegen eine gemeinsame Datenbank")
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--processes", action="store_true", help="Sitzungen als Prozesse statt Threads")
+    parser.add_argument("--mode", choices=["per_call", "per_thread"], default="per_call", help="db.CONNECTION_MODE")
+    parser.add_argument("--wal", action="store_true", help="Datenbank im WAL-Modus betreiben")
+    parser.add_argument("--timeout", type=float, default=db.BUSY_TIMEOUT_S, help="Busy-Timeout in Sekunden")
+    parser.add_argument("--pdf-every", type=int, default=0, help="jede n-te Runde ein PDF erzeugen (0 = nie)")
+    parser.add_argument("--unit-of-work", action="store_true", help="Kunde, Bestellung und Rechnungsnummer in einer Transaktion")
+    parser.add_argument("--keep", action="store_true", help="Temp-Ordner mit Datenbank behalten")
+    args = parser.parse_args()
+
+    arbeitsordner = Path(tempfile.mkdtemp(prefix="sessions_"))
+    db_path = arbeitsordner / "partyservice.db"
+    _konfigurieren(str(db_path), "per_call", args.timeout)
+    db.SCHEMA_PATH = PROJEKTORDNER / "schema.sql"
+    db.init_db()
+    if args.wal:
+        sqlite3.connect(db_path).execute("PRAGMA journal_mode=WAL").close()
+
+    params = [
+        (i, str(db_path), args.mode, args.timeout, args.seconds, args.pdf_every, args.unit_of_work)
+        for i in range(args.sessions)
+    ]
+    start = time.perf_counter()
+    if args.processes:
+        with ProcessPoolExecutor(max_workers=args.sessions) as pool:
+            teilergebnisse = list(pool.map(sitzung, *zip(*params)))
+    else:
+        teilergebnisse = [None] * args.sessions
+
+        def lauf(i):
+            teilergebnisse[i] = sitzung(*params[i])
+
+        threads = [threading.Thread(target=lauf, args=(i,)) for i in range(args.sessions)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    gesamt = time.perf_counter() - start
+    ergebnisse = [e for teil in teilergebnisse for e in teil]
+
+    art = "Prozesse" if args.processes else "Threads"
+    journal = "WAL" if args.wal else "DELETE"
+    speichern = "eine Transaktion je Speichern" if args.unit_of_work else "eine Transaktion je Aufruf"
+    print(f"{args.sessions} Sitzungen ({art}), Verbindungen {args.mode}, Journal {journal}, Timeout {args.timeout:g} s, {speichern}")
+    print(f"{len(ergebnisse)} Operationen in {gesamt:.1f} s: {len(ergebnisse) / gesamt:.0f} op/s")
+    print(f"{'Operation':<24}{'Anzahl':>8}{'op/s':>8}{'p50 ms':>9}{'p99 ms':>9}{'locked':>8}{'andere':>8}")
+    for op in OPERATIONEN:
+        werte = [(d, f) for o, d, f in ergebnisse if o == op]
+        if not werte:
+            continue
+        dauern = sorted(d for d, _ in werte)
+        locked = sum(1 for _, f in werte if f == "locked")
+        andere = sum(1 for _, f in werte if f and f != "locked")
+        print(
+            f"{op:<24}{len(werte):>8}{len(werte) / gesamt:>8.0f}"
+            f"{_perzentil(dauern, 0.50) * 1000:>9.2f}{_perzentil(dauern, 0.99) * 1000:>9.2f}{locked:>8}{andere:>8}"
+        )
+
+    vergeben, doppelt, luecken = _nummernkreis_pruefen(db_path)
+    print(f"Rechnungsnummern: {vergeben} vergeben, {doppelt} doppelt, {luecken} Lücken im Nummernkreis")
+    print(f"Kunden mit doppelter Telefonnummer: {_doppelte_kunden(db_path)}")
+
+    if args.keep:
+        print(f"Datenbank: {db_path}")
+    else:
+        shutil.rmtree(arbeitsordner, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,10 +2,19 @@ import subprocess
 import sys
 from pathlib import Path
 
+import db
+
 def main():
     projektordner = Path(__file__).resolve().parent
     app_py = projektordner / "app.py"
 
+    # Vorab-Check im Launcher: Schema/Migration und Integrität, bevor Streamlit startet
+    try:
+        db.preflight()
+    except Exception as e:
+        print(f"Datenbank nicht bereit: {e}", file=sys.stderr)
+        sys.exit(1)
+
     p = subprocess.Popen([sys.executable, "-m", "streamlit", "run", str(app_py)])
     p.wait()
 
@@ -0,0 +1,270 @@
+import argparse
+import re
+import time
+from collections import namedtuple
+from functools import lru_cache
+from itertools import combinations
+
+import db
+
+# ------------------------------------------------------------
+# Kunden-Dubletten finden und zusammenführen
+#
+# upsert_customer erkennt Stammkunden nur an der exakt gleichen
+# Telefonnummer; fehlt sie oder ist sie anders geschrieben, entsteht ein
+# neuer Kunde und die Bestellhistorie zerfällt. Statt alle Paare zu
+# vergleichen (bei 100.000 Kunden 5 Mrd.), werden Kandidaten nur innerhalb
+# gleicher Blockschlüssel gebildet:
+#   - normalisierte Telefonnummer (nur Ziffern, +49/0049 -> 0)
+#   - Kölner Phonetik des Namens (Reihenfolge der Namensteile egal)
+#   - Anschrift mit Postleitzahl (normalisiert, "Str."/"Straße" gleich)
+# und anschließend bewertet (Telefon, Namens- und Adressähnlichkeit).
+#
+# Von Hand: python customer_dedup.py list [--min-score 0.75] [--limit 50]
+#           python customer_dedup.py merge BEHALTEN DUBLETTE [DUBLETTE ...]
+# ------------------------------------------------------------
+
+MIN_SCORE = 0.75
+# Sehr große Blöcke (z. B. "Hans Müller", Wohnheim, Sammelnummer einer
+# Firma) tragen kaum zur Trefferquote bei, machen den Vergleich aber quadratisch.
+BLOCK_MAX = 200
+
+Kunde = namedtuple("Kunde", "id name phone address order_count")
+DublettenPaar = namedtuple("DublettenPaar", "score keep duplicate gruende")
+
+# "Müller" und "Mueller" sollen gleich aussehen
+_UMLAUTE = str.maketrans({"ä": "ae", "ö": "oe", "ü": "ue", "ß": "ss", "é": "e", "è": "e"})
+_NICHT_ZIFFER = re.compile(r"\D")
+_PLZ = re.compile(r"\b(\d{5})\b")
+_BUCHSTABEN = re.compile(r"[a-z]+")
+_WORTE = re.compile(r"[a-z0-9]+")
+
+
+def telefon_normalisieren(phone: str | None) -> str | None:
+    ziffern = _NICHT_ZIFFER.sub("", phone or "")
+    if (phone or "").strip().startswith("+49"):
+        ziffern = "0" + ziffern[2:]
+    elif ziffern.startswith("0049"):
+        ziffern = "0" + ziffern[4:]
+    # Platzhalter wie "000000" sind keine Nummer (würden sonst alle Kunden verbinden)
+    return ziffern if len(ziffern) >= 6 and len(set(ziffern)) > 1 else None
+
+
+def postleitzahl(address: str | None) -> str | None:
+    treffer = _PLZ.search(address or "")
+    return treffer.group(1) if treffer else None
+
+
+def _namensteile(name: str | None) -> list[str]:
+    return _BUCHSTABEN.findall((name or "").lower().translate(_UMLAUTE))
+
+
+def _adressteile(address: str | None) -> list[str]:
+    # Hausnummer und PLZ bleiben erhalten; "Str."/"Straße" werden gleich behandelt
+    text = (address or "").lower().translate(_UMLAUTE).replace("strasse", "str")
+    return _WORTE.findall(text)
+
+
+@lru_cache(maxsize=100_000)
+def koelner_phonetik(wort: str) -> str:
+    """Phonetischer Code nach der Kölner Phonetik (für deutsche Namen)."""
+    w = re.sub(r"[^A-Z]", "", wort.upper().translate(str.maketrans({"Ä": "A", "Ö": "O", "Ü": "U", "ß": "S"})))
+    codes = []
+    for i, c in enumerate(w):
+        vor = w[i - 1] if i else ""
+        nach = w[i + 1] if i + 1 < len(w) else ""
+        if c in "AEIJOUY":
+            code = "0"
+        elif c == "H":
+            code = ""
+        elif c == "B":
+            code = "1"
+        elif c == "P":
+            code = "3" if nach == "H" else "1"
+        elif c in "DT":
+            code = "8" if nach and nach in "CSZ" else "2"
+        elif c in "FVW":
+            code = "3"
+        elif c in "GKQ":
+            code = "4"
+        elif c == "C":
+            if i == 0:
+                code = "4" if nach and nach in "AHKLOQRUX" else "8"
+            else:
+                code = "8" if vor in ("S", "Z") or not nach or nach not in "AHKOQUX" else "4"
+        elif c == "X":
+            code = "8" if vor and vor in "CKQ" else "48"
+        elif c == "L":
+            code = "5"
+        elif c in "MN":
+            code = "6"
+        elif c == "R":
+            code = "7"
+        else:  # S, Z
+            code = "8"
+        codes.append(code)
+
+    ergebnis = ""
+    for ziffer in "".join(codes):
+        if not ergebnis or ergebnis[-1] != ziffer:
+            ergebnis += ziffer
+    return ergebnis[:1] + ergebnis[1:].replace("0", "")
+
+
+def _trigramme(text: str) -> frozenset:
+    text = f" {text} "
+    return frozenset(zip(text, text[1:], text[2:]))
+
+
+def _dice(a: frozenset, b: frozenset) -> float:
+    return 2 * len(a & b) / (len(a) + len(b)) if a or b else 1.0
+
+
+def _blockschluessel(kunde: Kunde, telefon: str | None) -> list[tuple]:
+    schluessel = []
+    if telefon:
+        schluessel.append(("t", telefon))
+    codes = [c for c in map(koelner_phonetik, _namensteile(kunde.name)) if c]
+    if codes:
+        schluessel.append(("n", " ".join(sorted(codes))))
+    plz = postleitzahl(kunde.address)
+    strasse = " ".join(t for t in _adressteile(kunde.address) if t != plz)
+    if plz and strasse:
+        # gleiche Anschrift (Straße, Hausnummer, PLZ) – fängt abgekürzte oder verschriebene Namen
+        schluessel.append(("a", plz, strasse))
+    return schluessel
+
+
+# Vergleichswerte je Kunde: normalisierte Telefonnummer, Trigramme des Namens
+# und Adressbestandteile – der Paarvergleich ist dann nur noch ein Mengenschnitt
+_Merkmale = namedtuple("_Merkmale", "telefon name adresse")
+
+
+def _merkmale(kunde: Kunde, telefon: str | None) -> _Merkmale:
+    name = _trigramme(" ".join(sorted(_namensteile(kunde.name))))
+    return _Merkmale(telefon, name, frozenset(_adressteile(kunde.address)) or None)
+
+
+def _bewerten(a: _Merkmale, b: _Merkmale, min_score: float = 0.0) -> tuple[float, list[str]] | None:
+    gruende = []
+    if a.telefon and b.telefon:
+        telefon = 1.0 if a.telefon == b.telefon else 0.0
+        if telefon:
+            gruende.append("gleiche Telefonnummer")
+    else:
+        telefon = 0.5
+    # Obergrenze bei perfektem Namen/Adresse: verschiedene Telefonnummern
+    # scheiden so ohne Textvergleich aus
+    if 0.4 * telefon + 0.6 < min_score:
+        return None
+
+    name = _dice(a.name, b.name)
+    if name >= 0.85:
+        gruende.append("ähnlicher Name")
+
+    if a.adresse and b.adresse:
+        adresse = _dice(a.adresse, b.adresse)
+        if adresse >= 0.75:
+            gruende.append("ähnliche Adresse")
+    else:
+        adresse = 0.5
+
+    score = round(0.4 * telefon + 0.4 * name + 0.2 * adresse, 3)
+    return (score, gruende) if score >= min_score else None
+
+
+def bewerten(a: Kunde, b: Kunde) -> tuple[float, list[str]]:
+    """Score 0..1 und Begründung; fehlende Angaben zählen neutral (0,5)."""
+    return _bewerten(
+        _merkmale(a, telefon_normalisieren(a.phone)), _merkmale(b, telefon_normalisieren(b.phone))
+    )
+
+
+def _kunden_laden() -> list[Kunde]:
+    with db.get_conn() as conn:
+        return [
+            Kunde(*r)
+            for r in conn.execute(
+                """
+                SELECT c.id, c.name, c.phone, c.address, COALESCE(s.order_count, 0)
+                FROM customers c
+                LEFT JOIN customer_stats s ON s.customer_id = c.id
+                """
+            )
+        ]
+
+
+def kandidaten(min_score: float = MIN_SCORE, limit: int | None = None) -> list[DublettenPaar]:
+    """Wahrscheinliche Dubletten, beste zuerst; `keep` ist der Kunde mit mehr Bestellungen (sonst der ältere)."""
+    kunden = _kunden_laden()
+    telefone = [telefon_normalisieren(k.phone) for k in kunden]
+    bloecke: dict[tuple, list[int]] = {}
+    for idx, kunde in enumerate(kunden):
+        for schluessel in _blockschluessel(kunde, telefone[idx]):
+            bloecke.setdefault(schluessel, []).append(idx)
+
+    paare = set()
+    for schluessel, mitglieder in bloecke.items():
+        if len(mitglieder) < 2 or len(mitglieder) > BLOCK_MAX:
+            continue
+        paare.update(combinations(mitglieder, 2))
+
+    # Vergleichswerte nur für Kunden, die überhaupt in einem Paar vorkommen
+    merkmale: dict[int, _Merkmale] = {}
+    ergebnis = []
+    for i, j in paare:
+        if telefone[i] and telefone[j] and telefone[i] != telefone[j] and min_score > 0.6:
+            continue
+        for idx in (i, j):
+            if idx not in merkmale:
+                merkmale[idx] = _merkmale(kunden[idx], telefone[idx])
+        bewertung = _bewerten(merkmale[i], merkmale[j], min_score)
+        if bewertung is None:
+            continue
+        keep, dublette = sorted((kunden[i], kunden[j]), key=lambda k: (-k.order_count, k.id))
+        ergebnis.append(DublettenPaar(bewertung[0], keep, dublette, bewertung[1]))
+    ergebnis.sort(key=lambda p: (-p.score, p.keep.id, p.duplicate.id))
+    return ergebnis[:limit] if limit else ergebnis
+
+
+def zusammenfuehren(paar: DublettenPaar) -> int:
+    return db.merge_customers(paar.keep.id, [paar.duplicate.id])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Kunden-Dubletten finden und zusammenführen")
+    sub = parser.add_subparsers(dest="befehl", required=True)
+
+    p_list = sub.add_parser("list", help="wahrscheinliche Dubletten anzeigen")
+    p_list.add_argument("--min-score", type=float, default=MIN_SCORE)
+    p_list.add_argument("--limit", type=int, default=50)
+
+    p_merge = sub.add_parser("merge", help="Kunden zusammenführen (Bestellungen werden umgehängt)")
+    p_merge.add_argument("keep", type=int, help="Kunde, der erhalten bleibt")
+    p_merge.add_argument("duplicates", type=int, nargs="+", help="Dubletten, die entfernt werden")
+
+    parser.add_argument("--standort", help="Standort-Code aus standorte.json (Standard: DB_PATH)")
+    args = parser.parse_args()
+    try:
+        db.standort_waehlen(args.standort)
+    except ValueError as e:
+        parser.error(str(e))
+    db.init_db()
+
+    if args.befehl == "merge":
+        anzahl = db.merge_customers(args.keep, args.duplicates)
+        print(f"{len(args.duplicates)} Kunde(n) in {args.keep} zusammengeführt, {anzahl} Bestellung(en) umgehängt.")
+        return
+
+    t0 = time.perf_counter()
+    paare = kandidaten(args.min_score, args.limit)
+    for p in paare:
+        print(
+            f"{p.score:.2f}  {p.keep.id:>6} {p.keep.name} ({p.keep.phone or '-'})  <-  "
+            f"{p.duplicate.id:>6} {p.duplicate.name} ({p.duplicate.phone or '-'})  [{', '.join(p.gruende)}]"
+        )
+    print(f"{len(paare)} Paar(e) in {time.perf_counter() - t0:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
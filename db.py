@@ -1,20 +1,111 @@
+import json
+import re
 import sqlite3
+import threading
+from collections import namedtuple
 from contextlib import contextmanager
+from contextvars import ContextVar
 from pathlib import Path
-from datetime import date
+from datetime import date, timedelta
+from itertools import groupby
 
 DB_PATH = Path("partyservice.db")
 SCHEMA_PATH = Path("schema.sql")
 
+# Verbindungsmodus:
+#   "per_call"   – neue Verbindung je get_conn() (Standard, Streamlit)
+#   "per_thread" – eine Verbindung je Thread, wird wiederverwendet
+#                  (Pool über feste Worker-Threads, z. B. api_server.py)
+CONNECTION_MODE = "per_call"
+
+# Wartezeit in Sekunden, wenn eine andere Sitzung gerade schreibt ("database is locked")
+BUSY_TIMEOUT_S = 5.0
+
+# Länge eines Zeitfensters für Kapazität und Auslastung (Küche / Lieferfahrzeuge)
+SLOT_MINUTEN = 30
+
+# Standorte (Küchen): je Standort eine eigene Datenbankdatei – eigener
+# Schreibpfad, eigene Sperren, eigener Rechnungsnummernkreis mit Präfix.
+# standorte.json, z. B.:
+#   [{"code": "HQ", "name": "Hauptküche", "db": "partyservice.db", "invoice_prefix": ""},
+#    {"code": "N", "name": "Küche Nord", "db": "kueche_nord.db", "invoice_prefix": "N-"}]
+# Ohne Datei gibt es nur DB_PATH. Der Standort gilt je Thread/Kontext
+# (standort_waehlen, im_standort); ohne Wahl wird DB_PATH verwendet.
+STANDORTE_PATH = Path("standorte.json")
+
+Standort = namedtuple("Standort", "code name db_path invoice_prefix")
+
+_standort: ContextVar[Standort | None] = ContextVar("standort", default=None)
+_standorte: dict[str, Standort] | None = None
+
+_thread_local = threading.local()
+
+
+def standorte() -> dict[str, Standort]:
+    """Konfigurierte Standorte in Dateireihenfolge (einmal je Prozess gelesen)."""
+    global _standorte
+    if _standorte is None:
+        eintraege = json.loads(STANDORTE_PATH.read_text(encoding="utf-8")) if STANDORTE_PATH.exists() else []
+        _standorte = {
+            e["code"]: Standort(e["code"], e.get("name") or e["code"], Path(e["db"]), e.get("invoice_prefix", ""))
+            for e in eintraege
+        }
+    return _standorte
+
+
+def standort_codes() -> list[str | None]:
+    """Alle Standorte; [None] (nur DB_PATH), wenn keine konfiguriert sind."""
+    return list(standorte()) or [None]
+
+
+def standort_waehlen(code: str | None) -> Standort | None:
+    """Standort für alle folgenden Zugriffe dieses Threads/Kontexts; None = DB_PATH."""
+    standort = None
+    if code is not None:
+        standort = standorte().get(code)
+        if standort is None:
+            raise ValueError(f"Unbekannter Standort: {code}")
+    _standort.set(standort)
+    return standort
+
+
+def aktueller_standort() -> Standort | None:
+    return _standort.get()
+
+
+@contextmanager
+def im_standort(code: str | None):
+    vorher = _standort.get()
+    standort_waehlen(code)
+    try:
+        yield
+    finally:
+        _standort.set(vorher)
+
+
+def _db_path() -> Path:
+    standort = _standort.get()
+    return standort.db_path if standort is not None else DB_PATH
+
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(_db_path(), timeout=BUSY_TIMEOUT_S)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys = ON;")
+    return conn
+
 
 # ------------------------------------------------------------
 # Verbindungs-Helper: Transaktion + Foreign Keys aktivieren
 # ------------------------------------------------------------
 @contextmanager
 def get_conn():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA foreign_keys = ON;")
+    if CONNECTION_MODE == "per_thread":
+        with _thread_conn() as conn:
+            yield conn
+        return
+
+    conn = _connect()
     try:
         yield conn
         conn.commit()
@@ -25,32 +116,316 @@ def get_conn():
         conn.close()
 
 
+@contextmanager
+def _thread_conn():
+    """Wiederverwendete Verbindung des aktuellen Threads je Datei; Commit nur im äußersten Block."""
+    verbindungen = getattr(_thread_local, "verbindungen", None)
+    if verbindungen is None:
+        verbindungen = _thread_local.verbindungen = {}
+    path = _db_path()
+    if path not in verbindungen:
+        verbindungen[path] = [_connect(), 0]
+    eintrag = verbindungen[path]
+    conn = eintrag[0]
+
+    outermost = eintrag[1] == 0
+    eintrag[1] += 1
+    try:
+        yield conn
+        if outermost:
+            conn.commit()
+    except Exception:
+        if outermost:
+            conn.rollback()
+        raise
+    finally:
+        eintrag[1] -= 1
+
+
+@contextmanager
+def _verbindung(conn: sqlite3.Connection | None):
+    """Verbindung der umgebenden Arbeitseinheit (Commit macht deren Besitzer) oder eine eigene."""
+    if conn is not None:
+        yield conn
+        return
+    with get_conn() as conn:
+        yield conn
+
+
+@contextmanager
+def unit_of_work():
+    """Mehrere Schreibfunktionen als eine Transaktion mit einem Commit.
+
+        with db.unit_of_work() as conn:
+            kunde = db.upsert_customer(name, phone, address, conn=conn)
+            db.create_order(kunde, ..., conn=conn)
+
+    Die Schreibsperre wird sofort genommen (BEGIN IMMEDIATE), damit keine
+    der Funktionen mitten in der Einheit auf eine fremde Sperre trifft.
+    Eine Ausnahme verwirft alles, es bleibt z. B. kein Kunde ohne Bestellung
+    zurück. Jede Funktion nimmt `conn=`; ohne Angabe arbeitet sie wie bisher
+    in einer eigenen Transaktion.
+    """
+    with get_conn() as conn:
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+        yield conn
+
+
+# ------------------------------------------------------------
+# Zeilen-Typen: schmale, typisierte Datensätze statt dict pro Zeile
+# Jede Abfrage liest nur die Spalten, die ihr Typ beschreibt.
+# Zugriff per Attribut (o.status) oder wie bisher per Schlüssel (o["status"], o.get(...)).
+# ------------------------------------------------------------
+class _Datensatz:
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            if key in self._fields:
+                return getattr(self, key)
+            raise KeyError(key)
+        return tuple.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        if key in self._fields:
+            return getattr(self, key)
+        return default
+
+    def keys(self):
+        return self._fields
+
+
+class ProductRow(_Datensatz, namedtuple("ProductRow", (
+    "id sku name default_quantity default_unit default_vat_rate default_unit_price_cents is_active"
+))):
+    __slots__ = ()
+
+
+class OrderListRow(_Datensatz, namedtuple("OrderListRow", (
+    "id event_date event_time fulfilment_type status notes invoice_number invoice_date payment_method "
+    "customer_name customer_phone customer_address"
+))):
+    __slots__ = ()
+
+
+class OrderRow(_Datensatz, namedtuple("OrderRow", (
+    "id customer_id event_date event_time fulfilment_type status notes invoice_number invoice_date "
+    "payment_status payment_method discount_cents delivery_fee_cents created_at updated_at "
+    "customer_name customer_phone customer_address"
+))):
+    __slots__ = ()
+
+
+class OrderItemRow(_Datensatz, namedtuple("OrderItemRow", (
+    "id product_id description quantity unit unit_price_cents vat_rate"
+))):
+    __slots__ = ()
+
+
+class RunSheetRow(_Datensatz, namedtuple("RunSheetRow", (
+    "order_id event_time fulfilment_type status notes invoice_number payment_method "
+    "discount_cents delivery_fee_cents customer_name customer_phone customer_address "
+    "item_id product_id description quantity unit unit_price_cents vat_rate"
+))):
+    __slots__ = ()
+
+
+class RunSheetOrder(_Datensatz, namedtuple("RunSheetOrder", (
+    "id event_date event_time fulfilment_type status notes invoice_number payment_method "
+    "discount_cents delivery_fee_cents customer_name customer_phone customer_address "
+    "items gross_total_cents amount_due_cents"
+))):
+    __slots__ = ()
+
+
+class OrderEvent(_Datensatz, namedtuple("OrderEvent", "seq order_id event_type payload created_at")):
+    __slots__ = ()
+
+
+class CustomerSummary(_Datensatz, namedtuple("CustomerSummary", (
+    "id name phone address order_count lifetime_gross_cents last_order_date open_balance_cents"
+))):
+    __slots__ = ()
+
+
+class CustomerOrderRow(_Datensatz, namedtuple("CustomerOrderRow", (
+    "id event_date event_time fulfilment_type status invoice_number gross_total_cents"
+))):
+    __slots__ = ()
+
+
+class SlotRow(_Datensatz, namedtuple("SlotRow", (
+    "slot fulfilment_type max_orders max_portions order_count portions"
+))):
+    __slots__ = ()
+
+    @property
+    def free_orders(self) -> int | None:
+        """Freie Bestellungen/Fahrten; None = unbegrenzt."""
+        return None if self.max_orders is None else max(0, self.max_orders - self.order_count)
+
+    @property
+    def free_portions(self) -> float | None:
+        return None if self.max_portions is None else max(0.0, self.max_portions - self.portions)
+
+
+class IngredientRow(_Datensatz, namedtuple("IngredientRow", "id name unit")):
+    __slots__ = ()
+
+
+class RecipeLineRow(_Datensatz, namedtuple("RecipeLineRow", (
+    "id ingredient_id sub_product_id quantity component_name component_unit"
+))):
+    __slots__ = ()
+
+
+class SearchHitRow(_Datensatz, namedtuple("SearchHitRow", (
+    "id event_date event_time fulfilment_type status notes invoice_number invoice_date payment_method "
+    "customer_name customer_phone customer_address score snippet"
+))):
+    """Wie OrderListRow, dazu Rang (bm25, kleiner = besser) und Textausschnitt mit **Treffern**."""
+    __slots__ = ()
+
+
+class PurchaseRow(_Datensatz, namedtuple("PurchaseRow", "ingredient_id name unit quantity")):
+    __slots__ = ()
+
+
+class UnresolvedRow(_Datensatz, namedtuple("UnresolvedRow", "product_id description unit quantity")):
+    __slots__ = ()
+
+
+class OrderTemplateRow(_Datensatz, namedtuple("OrderTemplateRow", (
+    "id customer_id name event_time fulfilment_type notes discount_cents delivery_fee_cents "
+    "weekdays interval_weeks start_date end_date generated_until is_active customer_name"
+))):
+    __slots__ = ()
+
+
+def _abfragen(conn: sqlite3.Connection, typ: type, sql: str, params: tuple = ()) -> list:
+    """Führt eine Abfrage aus und baut jede Zeile direkt als `typ` (ohne sqlite3.Row/dict)."""
+    cur = conn.execute(sql, params)
+    # tuple.__new__ prüft die Feldanzahl nicht: einmal je Abfrage gegen die Spalten abgleichen
+    if len(cur.description) != len(typ._fields):
+        spalten = ", ".join(d[0] for d in cur.description)
+        raise ValueError(
+            f"{typ.__name__} erwartet {len(typ._fields)} Spalten ({', '.join(typ._fields)}), "
+            f"Abfrage liefert {len(cur.description)} ({spalten})."
+        )
+    cur.row_factory = lambda _cur, row, _neu=tuple.__new__: _neu(typ, row)
+    return cur.fetchall()
+
+
 # ------------------------------------------------------------
 # Datenbank-Schema initialisieren
 # ------------------------------------------------------------
 def init_db():
     schema_sql = SCHEMA_PATH.read_text(encoding="utf-8")
     with get_conn() as conn:
+        _ereignistypen_migrieren(conn, schema_sql)
         conn.executescript(schema_sql)
 
+        # Migration: Bestellungen merken sich ihre Vorlage (Serienbestellungen)
+        spalten = {r["name"] for r in conn.execute("PRAGMA table_info(orders)")}
+        if "template_id" not in spalten:
+            conn.execute("ALTER TABLE orders ADD COLUMN template_id INTEGER REFERENCES order_templates(id)")
+        conn.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_orders_template_date "
+            "ON orders(template_id, event_date) WHERE template_id IS NOT NULL"
+        )
+
+        # Kundenkennzahlen einmalig für Bestandsdaten aufbauen
+        if not conn.execute("SELECT 1 FROM customer_stats LIMIT 1").fetchone():
+            ids = [r[0] for r in conn.execute("SELECT DISTINCT customer_id FROM orders WHERE customer_id IS NOT NULL")]
+            _refresh_customer_stats(conn, ids)
+
+        # Auslastung der Zeitfenster einmalig für Bestandsdaten aufbauen
+        if not conn.execute("SELECT 1 FROM slot_usage LIMIT 1").fetchone():
+            _refresh_slot_usage(conn, [r[0] for r in conn.execute("SELECT DISTINCT event_date FROM orders")])
+        # Leere Zeilen aus älteren Ständen (vor dem Aufräumen in _slot_belegen)
+        conn.execute("DELETE FROM slot_usage WHERE order_count <= 0")
+
+        # Volltextindex einmalig für Bestandsdaten aufbauen
+        if not conn.execute("SELECT 1 FROM order_search LIMIT 1").fetchone():
+            conn.execute(_SUCHTEXT_SQL)
+
+        # Präfix des Rechnungsnummernkreises liegt in der Datei selbst, damit auch
+        # Werkzeuge ohne Standortwahl richtig nummerieren
+        standort = _standort.get()
+        if standort is not None:
+            conn.execute(
+                """
+                INSERT INTO settings (key, value) VALUES ('invoice_prefix', ?)
+                ON CONFLICT (key) DO UPDATE SET value = excluded.value
+                """,
+                (standort.invoice_prefix,),
+            )
+
+
+def _ereignistypen_migrieren(conn: sqlite3.Connection, schema_sql: str) -> None:
+    """Neue Ereignistypen ändern die CHECK-Bedingung von order_events: Tabelle neu anlegen, seq bleibt erhalten."""
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'order_events'").fetchone()
+    neu = re.search(r"CREATE TABLE IF NOT EXISTS order_events \(.*?\n\);", schema_sql, re.S).group(0)
+    if row is None or re.search(r"CHECK \(event_type IN \([^)]*\)\)", neu).group(0) in row[0]:
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    conn.execute("DROP INDEX IF EXISTS idx_order_events_order")
+    conn.execute("ALTER TABLE order_events RENAME TO order_events_alt")
+    conn.execute(neu)
+    conn.execute(
+        "INSERT INTO order_events (seq, order_id, event_type, payload, created_at) "
+        "SELECT seq, order_id, event_type, payload, created_at FROM order_events_alt"
+    )
+    conn.execute("DROP TABLE order_events_alt")
+    conn.commit()
+
+
+def preflight() -> None:
+    """Schema anlegen/migrieren und Dateien aller Standorte prüfen – vor dem Start der Oberfläche."""
+    for code in standort_codes():
+        with im_standort(code):
+            init_db()
+            _auto_vacuum_umstellen()
+            with get_conn() as conn:
+                result = conn.execute("PRAGMA quick_check").fetchone()[0]
+            if result != "ok":
+                raise RuntimeError(f"Datenbankprüfung fehlgeschlagen ({_db_path()}): {result}")
+
+
+def _auto_vacuum_umstellen() -> None:
+    """Bestehende Datei einmalig auf auto_vacuum=INCREMENTAL umstellen (wirkt erst nach VACUUM)."""
+    conn = _connect()
+    try:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+    finally:
+        conn.close()
+
 
 # ------------------------------------------------------------
 # Kunden: anlegen oder aktualisieren
 # Logik: wenn Telefon vorhanden und existiert -> update, sonst insert
 # ------------------------------------------------------------
-def upsert_customer(name: str, phone: str | None, address: str | None) -> int:
+def upsert_customer(name: str, phone: str | None, address: str | None, conn: sqlite3.Connection | None = None) -> int:
     phone_norm = (phone or "").strip() or None
     address = (address or "").strip() or None
     name = (name or "").strip() or "Unbekannt"
 
-    with get_conn() as conn:
+    with _verbindung(conn) as conn:
         if phone_norm:
-            row = conn.execute("SELECT id FROM customers WHERE phone = ?", (phone_norm,)).fetchone()
+            # Schreibsperre vor der Suche, sonst legen zwei Sitzungen denselben Kunden doppelt an
+            if not conn.in_transaction:
+                conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT id, name, address FROM customers WHERE phone = ?", (phone_norm,)).fetchone()
             if row:
-                conn.execute(
-                    "UPDATE customers SET name=?, address=? WHERE id=?",
-                    (name, address, row["id"]),
-                )
+                if (row["name"], row["address"]) != (name, address):
+                    conn.execute(
+                        "UPDATE customers SET name=?, address=? WHERE id=?",
+                        (name, address, row["id"]),
+                    )
+                    _suchindex_kunden(conn, [row["id"]])
                 return int(row["id"])
 
         cur = conn.execute(
@@ -61,6 +436,341 @@ def upsert_customer(name: str, phone: str | None, address: str | None) -> int:
 
 
 
+# ------------------------------------------------------------
+# Kundenhistorie und Kennzahlen
+# customer_stats wird von den Schreibfunktionen gepflegt; Lesen ist ein Zugriff per Primärschlüssel.
+# ------------------------------------------------------------
+def _refresh_customer_stats(conn: sqlite3.Connection, customer_ids) -> None:
+    """Berechnet die Kennzahlen der Kunden neu (über idx_orders_customer_date)."""
+    for customer_id in {int(c) for c in customer_ids}:
+        rows = conn.execute(
+            """
+            SELECT o.id, o.event_date, o.status, o.discount_cents, o.delivery_fee_cents,
+                   i.quantity, i.unit_price_cents, i.vat_rate
+            FROM orders o
+            LEFT JOIN order_items i ON i.order_id = o.id
+            WHERE o.customer_id = ? AND o.status != 'cancelled'
+            ORDER BY o.id
+            """,
+            (customer_id,),
+        ).fetchall()
+
+        bestellungen: dict[int, list] = {}
+        for r in rows:
+            bestellungen.setdefault(r["id"], [r, []])
+            if r["unit_price_cents"] is not None:
+                bestellungen[r["id"]][1].append(r)
+
+        lifetime = offen = 0
+        letzte = None
+        for kopf, items in bestellungen.values():
+            brutto = _totals_from_items(items, int(kopf["discount_cents"]), int(kopf["delivery_fee_cents"]))["gross_total_cents"]
+            lifetime += brutto
+            if kopf["status"] != "paid":
+                offen += brutto
+            letzte = max(letzte or kopf["event_date"], kopf["event_date"])
+
+        conn.execute(
+            """
+            INSERT OR REPLACE INTO customer_stats
+              (customer_id, order_count, lifetime_gross_cents, last_order_date, open_balance_cents)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            (customer_id, len(bestellungen), lifetime, letzte, offen),
+        )
+
+
+_CUSTOMER_SUMMARY_SQL = """
+    SELECT c.id, c.name, c.phone, c.address,
+           COALESCE(s.order_count, 0), COALESCE(s.lifetime_gross_cents, 0),
+           s.last_order_date, COALESCE(s.open_balance_cents, 0)
+    FROM customers c
+    LEFT JOIN customer_stats s ON s.customer_id = c.id
+"""
+
+
+def get_customer_summary(customer_id: int, conn: sqlite3.Connection | None = None) -> CustomerSummary:
+    with _verbindung(conn) as conn:
+        rows = _abfragen(conn, CustomerSummary, _CUSTOMER_SUMMARY_SQL + " WHERE c.id = ?", (int(customer_id),))
+    if not rows:
+        raise ValueError("Kunde nicht gefunden.")
+    return rows[0]
+
+
+def get_customer_by_phone(phone: str | None, conn: sqlite3.Connection | None = None) -> CustomerSummary | None:
+    """Kunde mit genau dieser Telefonnummer (z. B. während eines Anrufs), sonst None."""
+    phone_norm = (phone or "").strip()
+    if not phone_norm:
+        return None
+    with _verbindung(conn) as conn:
+        rows = _abfragen(conn, CustomerSummary, _CUSTOMER_SUMMARY_SQL + " WHERE c.phone = ? LIMIT 1", (phone_norm,))
+    return rows[0] if rows else None
+
+
+def find_customers(text: str, limit: int = 20, conn: sqlite3.Connection | None = None) -> list[CustomerSummary]:
+    """Kunden, deren Telefonnummer mit `text` beginnt oder deren Name `text` enthält."""
+    text = (text or "").strip()
+    if not text:
+        return []
+    with _verbindung(conn) as conn:
+        return _abfragen(
+            conn,
+            CustomerSummary,
+            _CUSTOMER_SUMMARY_SQL + """
+            WHERE c.phone LIKE ? || '%' OR c.name LIKE '%' || ? || '%'
+            ORDER BY s.last_order_date DESC, c.name COLLATE NOCASE
+            LIMIT ?
+            """,
+            (text, text, int(limit)),
+        )
+
+
+def get_customer_history(
+    customer_id: int, limit: int = 20, cursor: str | None = None, conn: sqlite3.Connection | None = None
+) -> tuple[list[CustomerOrderRow], str | None]:
+    """Bestellungen eines Kunden, neueste zuerst, seitenweise.
+
+    `cursor` ist der Rückgabewert des vorigen Aufrufs ("<event_date>|<id>");
+    None als zweiter Rückgabewert bedeutet: keine weiteren Seiten.
+    """
+    params: list = [int(customer_id)]
+    weiter = ""
+    if cursor:
+        c_date, c_id = cursor.split("|")
+        weiter = "AND (o.event_date < ? OR (o.event_date = ? AND o.id < ?))"
+        params += [c_date, c_date, int(c_id)]
+
+    with _verbindung(conn) as conn:
+        kopf = conn.execute(
+            f"""
+            SELECT o.id, o.event_date, o.event_time, o.fulfilment_type, o.status, o.invoice_number,
+                   o.discount_cents, o.delivery_fee_cents
+            FROM orders o
+            WHERE o.customer_id = ? {weiter}
+            ORDER BY o.event_date DESC, o.id DESC
+            LIMIT ?
+            """,
+            (*params, int(limit) + 1),
+        ).fetchall()
+
+        mehr = len(kopf) > limit
+        kopf = kopf[:limit]
+        items: dict[int, list] = {o["id"]: [] for o in kopf}
+        if kopf:
+            for it in conn.execute(
+                f"""
+                SELECT order_id, quantity, unit_price_cents, vat_rate
+                FROM order_items
+                WHERE order_id IN ({",".join("?" * len(kopf))})
+                """,
+                list(items),
+            ):
+                items[it["order_id"]].append(it)
+
+    seite = [
+        CustomerOrderRow(
+            o["id"], o["event_date"], o["event_time"], o["fulfilment_type"], o["status"], o["invoice_number"],
+            _totals_from_items(items[o["id"]], int(o["discount_cents"]), int(o["delivery_fee_cents"]))["gross_total_cents"],
+        )
+        for o in kopf
+    ]
+    next_cursor = f"{seite[-1].event_date}|{seite[-1].id}" if mehr else None
+    return seite, next_cursor
+
+
+def merge_customers(keep_id: int, duplicate_ids: list[int], conn: sqlite3.Connection | None = None) -> int:
+    """Führt Dubletten in `keep_id` zusammen (eine Transaktion); liefert die Zahl umgehängter Bestellungen.
+
+    Bestellungen und Serienvorlagen zeigen danach auf `keep_id`; fehlende
+    Telefonnummer/Adresse werden von der ersten Dublette übernommen, die sie hat.
+    """
+    keep_id = int(keep_id)
+    dubletten = sorted({int(d) for d in duplicate_ids} - {keep_id})
+    if not dubletten:
+        return 0
+    platzhalter = ",".join("?" * len(dubletten))
+
+    with _verbindung(conn) as conn:
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+        kunden = {
+            r["id"]: r
+            for r in conn.execute(
+                f"SELECT id, phone, address FROM customers WHERE id IN (?, {platzhalter})", (keep_id, *dubletten)
+            )
+        }
+        if keep_id not in kunden or len(kunden) != len(dubletten) + 1:
+            raise ValueError("Kunde nicht gefunden.")
+
+        phone = kunden[keep_id]["phone"] or next((kunden[d]["phone"] for d in dubletten if kunden[d]["phone"]), None)
+        address = kunden[keep_id]["address"] or next((kunden[d]["address"] for d in dubletten if kunden[d]["address"]), None)
+        conn.execute("UPDATE customers SET phone = ?, address = ? WHERE id = ?", (phone, address, keep_id))
+
+        umgehaengt = conn.execute(
+            f"SELECT id, customer_id FROM orders WHERE customer_id IN ({platzhalter})", dubletten
+        ).fetchall()
+        conn.execute(f"UPDATE orders SET customer_id = ? WHERE customer_id IN ({platzhalter})", (keep_id, *dubletten))
+        conn.execute(f"UPDATE order_templates SET customer_id = ? WHERE customer_id IN ({platzhalter})", (keep_id, *dubletten))
+        _log_events(conn, [
+            (o["id"], "customer_merged", {"from_customer_id": o["customer_id"], "customer_id": keep_id}) for o in umgehaengt
+        ])
+        conn.execute(f"DELETE FROM customer_stats WHERE customer_id IN ({platzhalter})", dubletten)
+        conn.execute(f"DELETE FROM customers WHERE id IN ({platzhalter})", dubletten)
+        _refresh_customer_stats(conn, [keep_id])
+        _suchindex_kunden(conn, [keep_id])
+    return len(umgehaengt)
+
+
+# ------------------------------------------------------------
+# Zeitfenster: Kapazität und Auslastung
+# slot_capacity: Obergrenzen je Zeitfenster und Art (Bestellungen bzw.
+# Lieferfahrten, Portionen = Summe der Positionsmengen); ohne Eintrag unbegrenzt.
+# slot_usage: Auslastung je Tag, wird von den Schreibfunktionen in ihrer
+# Transaktion mitgeführt; create_order prüft dagegen unter Schreibsperre.
+# ------------------------------------------------------------
+class KapazitaetErschoepft(ValueError):
+    """Zeitfenster ist voll (create_order ohne allow_overbooking)."""
+
+
+def slot_for_time(event_time: str) -> str:
+    """Zeitfenster (HH:MM, auf SLOT_MINUTEN abgerundet) einer Uhrzeit."""
+    stunde, minute = (int(x) for x in event_time.split(":")[:2])
+    return f"{stunde:02d}:{minute // SLOT_MINUTEN * SLOT_MINUTEN:02d}"
+
+
+def _slot_belegen(conn: sqlite3.Connection, aenderungen: list[tuple[str, str, str, int, float]]) -> None:
+    """(event_date, event_time, fulfilment_type, Δ Bestellungen, Δ Portionen) auf slot_usage addieren."""
+    werte = [(tag, slot_for_time(zeit), art, anzahl, portionen) for tag, zeit, art, anzahl, portionen in aenderungen]
+    conn.executemany(
+        """
+        INSERT INTO slot_usage (event_date, slot, fulfilment_type, order_count, portions)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (event_date, slot, fulfilment_type) DO UPDATE SET
+          order_count = order_count + excluded.order_count,
+          portions = portions + excluded.portions
+        """,
+        werte,
+    )
+    # Leere Zeitfenster entfernen, sonst bleiben Zeilen mit 0 Bestellungen stehen
+    # (free_slots listet jedes Fenster aus slot_usage)
+    conn.executemany(
+        "DELETE FROM slot_usage WHERE event_date = ? AND slot = ? AND fulfilment_type = ? AND order_count <= 0",
+        [(tag, slot, art) for tag, slot, art, anzahl, _ in werte if anzahl < 0],
+    )
+
+
+def _refresh_slot_usage(conn: sqlite3.Connection, event_dates) -> None:
+    """Berechnet die Auslastung der Tage neu (nach Änderungen an vielen Bestellungen auf einmal)."""
+    tage = sorted(set(event_dates))
+    for tag in tage:
+        conn.execute("DELETE FROM slot_usage WHERE event_date = ?", (tag,))
+        _slot_belegen(conn, [
+            (tag, r["event_time"], r["fulfilment_type"], 1, r["portions"])
+            for r in conn.execute(
+                """
+                SELECT o.event_time, o.fulfilment_type, COALESCE(SUM(i.quantity), 0) AS portions
+                FROM orders o
+                LEFT JOIN order_items i ON i.order_id = o.id
+                WHERE o.event_date = ? AND o.status != 'cancelled'
+                GROUP BY o.id
+                """,
+                (tag,),
+            )
+        ])
+
+
+def _kapazitaet_pruefen(
+    conn: sqlite3.Connection, event_date: str, event_time: str, fulfilment_type: str, portionen: float
+) -> None:
+    slot = slot_for_time(event_time)
+    row = conn.execute(
+        """
+        SELECT c.max_orders, c.max_portions, COALESCE(u.order_count, 0), COALESCE(u.portions, 0)
+        FROM slot_capacity c
+        LEFT JOIN slot_usage u
+          ON u.event_date = ? AND u.slot = c.slot AND u.fulfilment_type = c.fulfilment_type
+        WHERE c.slot = ? AND c.fulfilment_type = ?
+        """,
+        (event_date, slot, fulfilment_type),
+    ).fetchone()
+    if not row:
+        return
+    max_orders, max_portions, anzahl, belegt = row
+    einheit = "Lieferfahrten" if fulfilment_type == "delivery" else "Bestellungen"
+    if max_orders is not None and anzahl + 1 > max_orders:
+        raise KapazitaetErschoepft(
+            f"Zeitfenster {slot} am {event_date} ist ausgebucht: {anzahl} von {max_orders} {einheit}."
+        )
+    if max_portions is not None and belegt + portionen > max_portions:
+        raise KapazitaetErschoepft(
+            f"Zeitfenster {slot} am {event_date}: {belegt:g} + {portionen:g} Portionen überschreiten {max_portions:g}."
+        )
+
+
+def free_slots(event_date: str, conn: sqlite3.Connection | None = None) -> list[SlotRow]:
+    """Kapazität und Auslastung aller konfigurierten oder belegten Zeitfenster eines Tages."""
+    with _verbindung(conn) as conn:
+        return _abfragen(
+            conn,
+            SlotRow,
+            """
+            SELECT k.slot, k.fulfilment_type, c.max_orders, c.max_portions,
+                   COALESCE(u.order_count, 0), COALESCE(u.portions, 0)
+            FROM (
+              SELECT slot, fulfilment_type FROM slot_capacity
+              UNION
+              SELECT slot, fulfilment_type FROM slot_usage WHERE event_date = ?
+            ) k
+            LEFT JOIN slot_capacity c ON c.slot = k.slot AND c.fulfilment_type = k.fulfilment_type
+            LEFT JOIN slot_usage u
+              ON u.event_date = ? AND u.slot = k.slot AND u.fulfilment_type = k.fulfilment_type
+            ORDER BY k.slot, k.fulfilment_type
+            """,
+            (event_date, event_date),
+        )
+
+
+def list_slot_capacities(conn: sqlite3.Connection | None = None) -> list[SlotRow]:
+    """Konfigurierte Obergrenzen (order_count/portions sind hier 0)."""
+    with _verbindung(conn) as conn:
+        return _abfragen(
+            conn,
+            SlotRow,
+            "SELECT slot, fulfilment_type, max_orders, max_portions, 0, 0 FROM slot_capacity ORDER BY slot, fulfilment_type",
+        )
+
+
+def set_slot_capacities(capacities: list[dict], conn: sqlite3.Connection | None = None) -> None:
+    """Ersetzt alle Obergrenzen; je Eintrag slot (HH:MM), fulfilment_type, max_orders, max_portions."""
+    werte = []
+    for c in capacities:
+        if c.get("fulfilment_type") not in ("pickup", "delivery"):
+            raise ValueError("fulfilment_type muss 'pickup' oder 'delivery' sein.")
+        slot = str(c.get("slot") or "")
+        try:
+            gueltig = slot_for_time(slot) == slot
+        except ValueError:
+            gueltig = False
+        if not gueltig:
+            raise ValueError(f"Zeitfenster '{slot}' muss HH:MM im {SLOT_MINUTEN}-Minuten-Raster sein.")
+        max_orders = c.get("max_orders")
+        max_portions = c.get("max_portions")
+        if max_orders is None and max_portions is None:
+            continue
+        werte.append((
+            slot, c["fulfilment_type"],
+            None if max_orders is None else int(max_orders),
+            None if max_portions is None else float(max_portions),
+        ))
+
+    with _verbindung(conn) as conn:
+        conn.execute("DELETE FROM slot_capacity")
+        conn.executemany(
+            "INSERT INTO slot_capacity (slot, fulfilment_type, max_orders, max_portions) VALUES (?, ?, ?, ?)",
+            werte,
+        )
+
+
 # ------------------------------------------------------------
 # Produktliste / Artikelstamm
 # ------------------------------------------------------------
@@ -71,12 +781,13 @@ def create_product(
     default_unit: str,
     default_quantity: float,
     sku: str | None = None,
+    conn: sqlite3.Connection | None = None,
 ) -> int:
     name = name.strip()
     if not name:
         raise ValueError("Produktname darf nicht leer sein.")
 
-    with get_conn() as conn:
+    with _verbindung(conn) as conn:
         cur = conn.execute(
             """
             INSERT INTO products (sku, name, default_quantity, default_unit, default_vat_rate, default_unit_price_cents)
@@ -95,33 +806,27 @@ def create_product(
         
 
 
-def list_products(active_only: bool = True) -> list[dict]:
-    with get_conn() as conn:
-        if active_only:
-            rows = conn.execute(
-                """
-                SELECT id, sku, name, default_quantity, default_unit,
-                       default_vat_rate, default_unit_price_cents, is_active
-                FROM products
-                WHERE is_active = 1
-                ORDER BY name COLLATE NOCASE
-                """
-            ).fetchall()
-        else:
-            rows = conn.execute(
-                """
-                SELECT id, sku, name, default_quantity, default_unit,
-                       default_vat_rate, default_unit_price_cents, is_active
-                FROM products
-                ORDER BY name COLLATE NOCASE
-                """
-            ).fetchall()
-        return [dict(r) for r in rows]
+def list_products(active_only: bool = True, conn: sqlite3.Connection | None = None) -> list[ProductRow]:
+    where = "WHERE is_active = 1" if active_only else ""
+    with _verbindung(conn) as conn:
+        return _abfragen(
+            conn,
+            ProductRow,
+            f"""
+            SELECT id, sku, name, default_quantity, default_unit,
+                   default_vat_rate, default_unit_price_cents, is_active
+            FROM products
+            {where}
+            ORDER BY name COLLATE NOCASE
+            """,
+        )
 
 
-def get_product(product_id: int) -> dict:
-    with get_conn() as conn:
-        row = conn.execute(
+def get_product(product_id: int, conn: sqlite3.Connection | None = None) -> ProductRow:
+    with _verbindung(conn) as conn:
+        rows = _abfragen(
+            conn,
+            ProductRow,
             """
             SELECT id, sku, name, default_quantity, default_unit,
                    default_vat_rate, default_unit_price_cents, is_active
@@ -129,20 +834,185 @@ def get_product(product_id: int) -> dict:
             WHERE id = ?
             """,
             (product_id,),
-        ).fetchone()
-        if not row:
+        )
+        if not rows:
             raise ValueError("Produkt nicht gefunden.")
-        return dict(row)
+        return rows[0]
 
 
-def set_product_active(product_id: int, is_active: bool) -> None:
-    with get_conn() as conn:
+def set_product_active(product_id: int, is_active: bool, conn: sqlite3.Connection | None = None) -> None:
+    with _verbindung(conn) as conn:
         conn.execute(
             "UPDATE products SET is_active = ? WHERE id = ?",
             (1 if is_active else 0, int(product_id)),
         )
 
 
+# ------------------------------------------------------------
+# Rezepturen und Einkaufsliste
+# recipe_lines: Bestandteile je 1 Einheit eines Produkts – Zutat oder
+# Unterrezept (anderes Produkt). Aufgelöste Rezepte (Zutat -> Menge je
+# Einheit) werden je Prozess und Datei gemerkt; settings.recipe_version macht den
+# Speicher ungültig, sobald irgendwo ein Rezept geändert wird.
+# ------------------------------------------------------------
+_rezepte_lock = threading.Lock()
+_rezepte: dict[Path, tuple[int, dict, dict]] = {}   # Datei -> (Version, Zeilen je Produkt, aufgelöst je Produkt)
+
+
+def create_ingredient(name: str, unit: str, conn: sqlite3.Connection | None = None) -> int:
+    name = (name or "").strip()
+    if not name:
+        raise ValueError("Zutatenname darf nicht leer sein.")
+    with _verbindung(conn) as conn:
+        if conn.execute("SELECT 1 FROM ingredients WHERE name = ?", (name,)).fetchone():
+            raise ValueError(f"Zutat „{name}“ ist bereits angelegt.")
+        cur = conn.execute(
+            "INSERT INTO ingredients (name, unit) VALUES (?, ?)",
+            (name, (unit or "kg").strip() or "kg"),
+        )
+        return int(cur.lastrowid)
+
+
+def list_ingredients(conn: sqlite3.Connection | None = None) -> list[IngredientRow]:
+    with _verbindung(conn) as conn:
+        return _abfragen(conn, IngredientRow, "SELECT id, name, unit FROM ingredients ORDER BY name COLLATE NOCASE")
+
+
+def get_recipe(product_id: int, conn: sqlite3.Connection | None = None) -> list[RecipeLineRow]:
+    with _verbindung(conn) as conn:
+        return _abfragen(
+            conn,
+            RecipeLineRow,
+            """
+            SELECT r.id, r.ingredient_id, r.sub_product_id, r.quantity,
+                   COALESCE(g.name, p.name), COALESCE(g.unit, p.default_unit)
+            FROM recipe_lines r
+            LEFT JOIN ingredients g ON g.id = r.ingredient_id
+            LEFT JOIN products p ON p.id = r.sub_product_id
+            WHERE r.product_id = ?
+            ORDER BY r.id
+            """,
+            (int(product_id),),
+        )
+
+
+def _rezeptzeilen(conn: sqlite3.Connection) -> tuple[int, dict, dict]:
+    """Alle Rezeptzeilen (eine Abfrage) samt Auflösungsspeicher der aktuellen Version."""
+    row = conn.execute("SELECT value FROM settings WHERE key = 'recipe_version'").fetchone()
+    version = int(row[0]) if row else 0
+    path = _db_path()
+    with _rezepte_lock:
+        if path not in _rezepte or _rezepte[path][0] != version:
+            zeilen: dict[int, list[tuple]] = {}
+            for r in conn.execute("SELECT product_id, ingredient_id, sub_product_id, quantity FROM recipe_lines"):
+                zeilen.setdefault(r["product_id"], []).append((r["ingredient_id"], r["sub_product_id"], r["quantity"]))
+            _rezepte[path] = (version, zeilen, {})
+        return _rezepte[path]
+
+
+def _aufloesen(product_id: int, zeilen: dict, aufgeloest: dict, pfad: tuple = ()) -> dict[int, float] | None:
+    """Zutat -> Menge je 1 Einheit des Produkts; None, wenn es kein Rezept hat."""
+    if product_id in aufgeloest:
+        return aufgeloest[product_id]
+    if product_id in pfad:
+        raise ValueError("Rezept enthält sich selbst (über Unterrezepte).")
+    if product_id not in zeilen:
+        return None
+
+    ergebnis: dict[int, float] = {}
+    for ingredient_id, sub_product_id, menge in zeilen[product_id]:
+        if ingredient_id is not None:
+            ergebnis[ingredient_id] = ergebnis.get(ingredient_id, 0.0) + menge
+            continue
+        unter = _aufloesen(sub_product_id, zeilen, aufgeloest, pfad + (product_id,))
+        for zutat, m in (unter or {}).items():
+            ergebnis[zutat] = ergebnis.get(zutat, 0.0) + menge * m
+    aufgeloest[product_id] = ergebnis
+    return ergebnis
+
+
+def set_recipe(product_id: int, lines: list[dict], conn: sqlite3.Connection | None = None) -> None:
+    """Ersetzt das Rezept; je Zeile ingredient_id oder sub_product_id und quantity (je 1 Einheit)."""
+    werte = []
+    for line in lines:
+        ingredient_id = line.get("ingredient_id")
+        sub_product_id = line.get("sub_product_id")
+        if (ingredient_id is None) == (sub_product_id is None):
+            raise ValueError("Jede Rezeptzeile braucht entweder eine Zutat oder ein Unterrezept.")
+        menge = float(line.get("quantity") or 0)
+        if not menge > 0:
+            raise ValueError("Rezeptmengen müssen größer als 0 sein.")
+        werte.append((
+            int(product_id),
+            None if ingredient_id is None else int(ingredient_id),
+            None if sub_product_id is None else int(sub_product_id),
+            menge,
+        ))
+
+    with _verbindung(conn) as conn:
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+        conn.execute("DELETE FROM recipe_lines WHERE product_id = ?", (int(product_id),))
+        conn.executemany(
+            "INSERT INTO recipe_lines (product_id, ingredient_id, sub_product_id, quantity) VALUES (?, ?, ?, ?)",
+            werte,
+        )
+        # Zyklus prüfen, bevor die neue Version gilt (Fehler -> Rollback)
+        zeilen: dict[int, list[tuple]] = {}
+        for r in conn.execute("SELECT product_id, ingredient_id, sub_product_id, quantity FROM recipe_lines"):
+            zeilen.setdefault(r["product_id"], []).append((r["ingredient_id"], r["sub_product_id"], r["quantity"]))
+        _aufloesen(int(product_id), zeilen, {})
+
+        conn.execute(
+            """
+            INSERT INTO settings (key, value) VALUES ('recipe_version', '1')
+            ON CONFLICT (key) DO UPDATE SET value = CAST(value AS INTEGER) + 1
+            """
+        )
+
+
+def purchasing_list(
+    start_date: str, end_date: str, conn: sqlite3.Connection | None = None
+) -> tuple[list[PurchaseRow], list[UnresolvedRow]]:
+    """Rohwarenbedarf aller Bestellpositionen im Zeitraum.
+
+    Eine Abfrage summiert die bestellten Mengen je Produkt (GROUP BY); jede
+    Summe wird mit dem gemerkten, aufgelösten Rezept multipliziert. Positionen
+    ohne Produkt oder ohne Rezept kommen als nicht aufgelöst zurück.
+    """
+    with _verbindung(conn) as conn:
+        _, zeilen, aufgeloest = _rezeptzeilen(conn)
+        summen = conn.execute(
+            """
+            SELECT i.product_id,
+                   CASE WHEN i.product_id IS NULL THEN i.description ELSE MIN(i.description) END AS description,
+                   i.unit, SUM(i.quantity) AS quantity
+            FROM orders o
+            JOIN order_items i ON i.order_id = o.id
+            WHERE o.event_date BETWEEN ? AND ? AND o.status != 'cancelled'
+            GROUP BY i.product_id, CASE WHEN i.product_id IS NULL THEN i.description END, i.unit
+            """,
+            (start_date, end_date),
+        ).fetchall()
+        zutaten = {r["id"]: r for r in conn.execute("SELECT id, name, unit FROM ingredients")}
+
+    bedarf: dict[int, float] = {}
+    offen = []
+    for r in summen:
+        rezept = None if r["product_id"] is None else _aufloesen(r["product_id"], zeilen, aufgeloest)
+        if not rezept:
+            offen.append(UnresolvedRow(r["product_id"], r["description"], r["unit"], r["quantity"]))
+            continue
+        for zutat, menge in rezept.items():
+            bedarf[zutat] = bedarf.get(zutat, 0.0) + r["quantity"] * menge
+
+    liste = sorted(
+        (PurchaseRow(z, zutaten[z]["name"], zutaten[z]["unit"], round(m, 3)) for z, m in bedarf.items()),
+        key=lambda p: p.name.lower(),
+    )
+    return liste, sorted(offen, key=lambda o: (o.description or "").lower())
+
+
 # ------------------------------------------------------------
 # Bestellung anlegen (Kopf + Positionen)
 # Positionen speichern immer Snapshot von Text/Preis/MwSt
@@ -156,6 +1026,8 @@ def create_order(
     discount_cents: int = 0,
     delivery_fee_cents: int = 0,
     items: list[dict] | None = None,
+    allow_overbooking: bool = False,
+    conn: sqlite3.Connection | None = None,
 ) -> int:
     items = items or []
     if fulfilment_type not in ("pickup", "delivery"):
@@ -164,8 +1036,16 @@ def create_order(
         raise ValueError("Es muss mindestens eine Position geben.")
 
     notes = (notes or "").strip() or None
+    positionen = _positionswerte(items)
+    portionen = sum(p[2] for p in positionen)
+
+    with _verbindung(conn) as conn:
+        # Schreibsperre vor der Kapazitätsprüfung, sonst buchen zwei Sitzungen denselben letzten Platz
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+        if not allow_overbooking:
+            _kapazitaet_pruefen(conn, event_date, event_time, fulfilment_type, portionen)
 
-    with get_conn() as conn:
         cur = conn.execute(
             """
             INSERT INTO orders (
@@ -178,45 +1058,477 @@ def create_order(
         )
         order_id = int(cur.lastrowid)
 
-        conn.executemany(
+        cur = conn.executemany(
             """
             INSERT INTO order_items (
               order_id, product_id, description, quantity, unit, unit_price_cents, vat_rate
             )
             VALUES (?, ?, ?, ?, ?, ?, ?)
             """,
-            [
-                (
-                    order_id,
-                    int(it["product_id"]) if it.get("product_id") else None,
-                    it["description"].strip(),
-                    float(it.get("quantity", 1) or 1),
-                    (it.get("unit") or "Stk").strip() or "Stk",
-                    int(it["unit_price_cents"]),
-                    float(it.get("vat_rate", 0.19)),
-                )
-                for it in items
-                if it.get("description", "").strip()
-            ],
+            [(order_id, *werte) for werte in positionen],
         )
+        _log_event(conn, order_id, "created", {
+            "customer_id": customer_id,
+            "event_date": event_date,
+            "event_time": event_time,
+            "fulfilment_type": fulfilment_type,
+            "item_count": cur.rowcount,
+        })
+        _slot_belegen(conn, [(event_date, event_time, fulfilment_type, 1, portionen)])
+        _suchindex_aktualisieren(conn, [order_id])
+        if customer_id is not None:
+            _refresh_customer_stats(conn, [customer_id])
         return order_id
-    
-def delete_order(order_id: int) -> None:
+
+
+def _positionswerte(items: list[dict]) -> list[tuple]:
+    """(product_id, description, quantity, unit, unit_price_cents, vat_rate) je Position mit Text."""
+    return [
+        (
+            int(it["product_id"]) if it.get("product_id") else None,
+            it["description"].strip(),
+            float(it.get("quantity", 1) or 1),
+            (it.get("unit") or "Stk").strip() or "Stk",
+            int(it["unit_price_cents"]),
+            float(it.get("vat_rate", 0.19)),
+        )
+        for it in items
+        if it.get("description", "").strip()
+    ]
+
+
+def delete_order(order_id: int, conn: sqlite3.Connection | None = None) -> None:
     """Löscht eine Bestellung vollständig (inkl. Positionen via ON DELETE CASCADE)."""
-    with get_conn() as conn:
+    with _verbindung(conn) as conn:
+        row = conn.execute(
+            "SELECT customer_id, event_date, invoice_number FROM orders WHERE id = ?",
+            (int(order_id),),
+        ).fetchone()
+        if not row:
+            return
+        slot = conn.execute(
+            """
+            SELECT o.event_time, o.fulfilment_type, o.status, COALESCE(SUM(i.quantity), 0) AS portions
+            FROM orders o
+            LEFT JOIN order_items i ON i.order_id = o.id
+            WHERE o.id = ?
+            """,
+            (int(order_id),),
+        ).fetchone()
         conn.execute("DELETE FROM orders WHERE id = ?", (int(order_id),))
+        _log_event(conn, order_id, "deleted", dict(row))
+        _suchindex_aktualisieren(conn, [order_id])
+        if slot["status"] != "cancelled":
+            _slot_belegen(conn, [(row["event_date"], slot["event_time"], slot["fulfilment_type"], -1, -slot["portions"])])
+        if row["customer_id"] is not None:
+            _refresh_customer_stats(conn, [row["customer_id"]])
+
+
+# ------------------------------------------------------------
+# Serienbestellungen: Vorlage (Kopf + Positionen) + Wiederholungsregel
+# Regel: Wochentage (0 = Montag) alle `interval_weeks` Wochen ab start_date,
+# optional bis end_date. Erzeugte Bestellungen tragen template_id;
+# generated_until merkt sich, bis wohin schon erzeugt wurde (einzeln
+# gelöschte Termine entstehen dadurch nicht neu).
+# ------------------------------------------------------------
+_TEMPLATE_SQL = """
+    SELECT t.id, t.customer_id, t.name, t.event_time, t.fulfilment_type, t.notes,
+           t.discount_cents, t.delivery_fee_cents, t.weekdays, t.interval_weeks,
+           t.start_date, t.end_date, t.generated_until, t.is_active, c.name AS customer_name
+    FROM order_templates t
+    LEFT JOIN customers c ON c.id = t.customer_id
+"""
+
+
+def _vorlagenwerte(
+    customer_id: int | None,
+    name: str,
+    event_time: str,
+    fulfilment_type: str,
+    notes: str | None,
+    weekdays,
+    interval_weeks: int,
+    start_date: str,
+    end_date: str | None,
+    discount_cents: int,
+    delivery_fee_cents: int,
+    items: list[dict] | None,
+) -> tuple[tuple, list[tuple]]:
+    """Prüft die Eingaben einer Vorlage; liefert (Kopfwerte, Positionswerte)."""
+    name = (name or "").strip()
+    if not name:
+        raise ValueError("Die Vorlage braucht einen Namen.")
+    if fulfilment_type not in ("pickup", "delivery"):
+        raise ValueError("fulfilment_type muss 'pickup' oder 'delivery' sein.")
+    tage = sorted({int(w) for w in weekdays})
+    if not tage or not all(0 <= w <= 6 for w in tage):
+        raise ValueError("Mindestens ein Wochentag (0 = Montag … 6 = Sonntag) ist erforderlich.")
+    if int(interval_weeks) < 1:
+        raise ValueError("Das Intervall muss mindestens 1 Woche sein.")
+    date.fromisoformat(start_date)
+    if end_date and date.fromisoformat(end_date) < date.fromisoformat(start_date):
+        raise ValueError("Das Enddatum liegt vor dem Startdatum.")
+    positionen = _positionswerte(items or [])
+    if not positionen:
+        raise ValueError("Es muss mindestens eine Position geben.")
+
+    kopf = (
+        customer_id, name, event_time, fulfilment_type, (notes or "").strip() or None,
+        int(discount_cents), int(delivery_fee_cents),
+        ",".join(str(w) for w in tage), int(interval_weeks), start_date, end_date or None,
+    )
+    return kopf, positionen
+
+
+def _serien_termine(t: OrderTemplateRow, von: date, bis: date) -> list[str]:
+    """Termine der Regel im Bereich [von, bis]."""
+    start = date.fromisoformat(t.start_date)
+    if t.end_date:
+        bis = min(bis, date.fromisoformat(t.end_date))
+    von = max(von, start)
+    tage = {int(w) for w in t.weekdays.split(",")}
+    erste_woche = start - timedelta(days=start.weekday())
+
+    termine = []
+    tag = von
+    while tag <= bis:
+        if tag.weekday() in tage and ((tag - erste_woche).days // 7) % t.interval_weeks == 0:
+            termine.append(tag.isoformat())
+        tag += timedelta(days=1)
+    return termine
+
+
+def create_order_template(
+    customer_id: int | None,
+    name: str,
+    event_time: str,
+    fulfilment_type: str,
+    notes: str | None,
+    weekdays,
+    start_date: str,
+    end_date: str | None = None,
+    interval_weeks: int = 1,
+    discount_cents: int = 0,
+    delivery_fee_cents: int = 0,
+    items: list[dict] | None = None,
+    conn: sqlite3.Connection | None = None,
+) -> int:
+    kopf, positionen = _vorlagenwerte(
+        customer_id, name, event_time, fulfilment_type, notes, weekdays, interval_weeks,
+        start_date, end_date, discount_cents, delivery_fee_cents, items,
+    )
+    with _verbindung(conn) as conn:
+        cur = conn.execute(
+            """
+            INSERT INTO order_templates (
+              customer_id, name, event_time, fulfilment_type, notes, discount_cents, delivery_fee_cents,
+              weekdays, interval_weeks, start_date, end_date
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            kopf,
+        )
+        template_id = int(cur.lastrowid)
+        conn.executemany(
+            """
+            INSERT INTO order_template_items (
+              template_id, product_id, description, quantity, unit, unit_price_cents, vat_rate
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            [(template_id, *werte) for werte in positionen],
+        )
+        return template_id
+
+
+def list_order_templates(active_only: bool = True, conn: sqlite3.Connection | None = None) -> list[OrderTemplateRow]:
+    with _verbindung(conn) as conn:
+        return _abfragen(
+            conn,
+            OrderTemplateRow,
+            _TEMPLATE_SQL + (" WHERE t.is_active = 1" if active_only else "") + " ORDER BY t.name, t.id",
+        )
+
+
+def get_order_template_items(template_id: int, conn: sqlite3.Connection | None = None) -> list[OrderItemRow]:
+    with _verbindung(conn) as conn:
+        return _abfragen(
+            conn,
+            OrderItemRow,
+            """
+            SELECT id, product_id, description, quantity, unit, unit_price_cents, vat_rate
+            FROM order_template_items
+            WHERE template_id = ?
+            ORDER BY id
+            """,
+            (int(template_id),),
+        )
+
+
+def _serie_erzeugen(conn: sqlite3.Connection, bis: date, template_id: int | None = None) -> int:
+    """Legt alle fehlenden Termine bis `bis` an – Köpfe, Positionen und Ereignisse je als ein executemany."""
+    heute = date.today()
+    sql = _TEMPLATE_SQL + " WHERE t.is_active = 1"
+    params: tuple = ()
+    if template_id is not None:
+        sql += " AND t.id = ?"
+        params = (int(template_id),)
+    vorlagen = _abfragen(conn, OrderTemplateRow, sql, params)
+
+    neu = []
+    for t in vorlagen:
+        von = heute
+        if t.generated_until:
+            von = max(von, date.fromisoformat(t.generated_until) + timedelta(days=1))
+        for tag in _serien_termine(t, von, bis):
+            neu.append((
+                t.customer_id, t.id, tag, t.event_time, t.fulfilment_type, t.notes,
+                t.discount_cents, t.delivery_fee_cents,
+            ))
+    if vorlagen:
+        conn.executemany(
+            "UPDATE order_templates SET generated_until = MAX(COALESCE(generated_until, ''), ?) WHERE id = ?",
+            [(bis.isoformat(), t.id) for t in vorlagen],
+        )
+    if not neu:
+        return 0
+
+    max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM orders").fetchone()[0]
+    conn.executemany(
+        """
+        INSERT OR IGNORE INTO orders (
+          customer_id, template_id, event_date, event_time, fulfilment_type, notes,
+          discount_cents, delivery_fee_cents
+        )
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        neu,
+    )
+    # Neue Zeilen über die ID wiederfinden (executemany liefert keine lastrowid je Zeile)
+    erzeugt = conn.execute(
+        "SELECT id, template_id, customer_id, event_date, event_time, fulfilment_type FROM orders WHERE id > ? AND template_id IS NOT NULL",
+        (max_id,),
+    ).fetchall()
+    if not erzeugt:
+        return 0
+
+    positionen: dict[int, list[tuple]] = {}
+    for r in conn.execute(
+        f"""
+        SELECT template_id, product_id, description, quantity, unit, unit_price_cents, vat_rate
+        FROM order_template_items
+        WHERE template_id IN ({",".join("?" * len(vorlagen))})
+        ORDER BY id
+        """,
+        [t.id for t in vorlagen],
+    ):
+        positionen.setdefault(r["template_id"], []).append(tuple(r)[1:])
+
+    conn.executemany(
+        """
+        INSERT INTO order_items (
+          order_id, product_id, description, quantity, unit, unit_price_cents, vat_rate
+        )
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """,
+        [(o["id"], *werte) for o in erzeugt for werte in positionen.get(o["template_id"], [])],
+    )
+    _log_events(conn, [
+        (o["id"], "created", {
+            "customer_id": o["customer_id"],
+            "event_date": o["event_date"],
+            "event_time": o["event_time"],
+            "fulfilment_type": o["fulfilment_type"],
+            "item_count": len(positionen.get(o["template_id"], [])),
+            "template_id": o["template_id"],
+        })
+        for o in erzeugt
+    ])
+    # Serien sind zugesagt: keine Kapazitätsprüfung, aber die Auslastung zählt mit
+    _slot_belegen(conn, [
+        (o["event_date"], o["event_time"], o["fulfilment_type"], 1,
+         sum(p[2] for p in positionen.get(o["template_id"], [])))
+        for o in erzeugt
+    ])
+    _suchindex_aktualisieren(conn, [o["id"] for o in erzeugt])
+    _refresh_customer_stats(conn, {o["customer_id"] for o in erzeugt if o["customer_id"] is not None})
+    return len(erzeugt)
+
+
+def generate_template_orders(until: str, template_id: int | None = None, conn: sqlite3.Connection | None = None) -> int:
+    """Erzeugt die Serienbestellungen aller aktiven Vorlagen (oder einer) bis einschließlich `until`."""
+    bis = date.fromisoformat(until)
+    with _verbindung(conn) as conn:
+        # Schreibsperre vorab: zwei Sitzungen dürfen dieselben Termine nicht gleichzeitig anlegen
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+        return _serie_erzeugen(conn, bis, template_id)
+
+
+# Künftige, noch nicht abgerechnete Termine einer Vorlage (ab morgen; heute wird schon vorbereitet).
+# "+invoice_number": ohne Statistik würde der Planer sonst den Rechnungsnummer-Index
+# (IS NULL trifft fast alle Zeilen) statt idx_orders_template_date nehmen.
+_OFFENE_TERMINE_WHERE = """
+    template_id = ? AND event_date > ? AND +invoice_number IS NULL AND status = 'open'
+"""
+
+
+def update_order_template(
+    template_id: int,
+    customer_id: int | None,
+    name: str,
+    event_time: str,
+    fulfilment_type: str,
+    notes: str | None,
+    weekdays,
+    start_date: str,
+    end_date: str | None = None,
+    interval_weeks: int = 1,
+    discount_cents: int = 0,
+    delivery_fee_cents: int = 0,
+    items: list[dict] | None = None,
+    conn: sqlite3.Connection | None = None,
+) -> int:
+    """Ändert die Vorlage und überträgt Kopf und Positionen auf alle künftigen, nicht abgerechneten
+    Termine. Termine, die nicht mehr zur Regel passen, entfallen; neue werden bis zum bisherigen
+    Horizont angelegt. Liefert die Anzahl der aktualisierten Bestellungen."""
+    kopf, positionen = _vorlagenwerte(
+        customer_id, name, event_time, fulfilment_type, notes, weekdays, interval_weeks,
+        start_date, end_date, discount_cents, delivery_fee_cents, items,
+    )
+    heute = date.today().isoformat()
+
+    with _verbindung(conn) as conn:
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+        alt = conn.execute(
+            "SELECT customer_id, weekdays, interval_weeks, start_date, end_date, generated_until FROM order_templates WHERE id = ?",
+            (int(template_id),),
+        ).fetchone()
+        if not alt:
+            raise ValueError("Vorlage nicht gefunden.")
+
+        conn.execute(
+            """
+            UPDATE order_templates
+            SET customer_id = ?, name = ?, event_time = ?, fulfilment_type = ?, notes = ?,
+                discount_cents = ?, delivery_fee_cents = ?, weekdays = ?, interval_weeks = ?,
+                start_date = ?, end_date = ?, updated_at = datetime('now')
+            WHERE id = ?
+            """,
+            (*kopf, int(template_id)),
+        )
+        conn.execute("DELETE FROM order_template_items WHERE template_id = ?", (int(template_id),))
+        conn.executemany(
+            """
+            INSERT INTO order_template_items (
+              template_id, product_id, description, quantity, unit, unit_price_cents, vat_rate
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            [(int(template_id), *werte) for werte in positionen],
+        )
+        t = _abfragen(conn, OrderTemplateRow, _TEMPLATE_SQL + " WHERE t.id = ?", (int(template_id),))[0]
+
+        # Termine, die nach der neuen Regel entfallen
+        offen = conn.execute(
+            f"SELECT id, event_date FROM orders WHERE {_OFFENE_TERMINE_WHERE}", (int(template_id), heute)
+        ).fetchall()
+        gueltig = set()
+        if offen:
+            tage = [r["event_date"] for r in offen]
+            gueltig = set(_serien_termine(t, date.fromisoformat(min(tage)), date.fromisoformat(max(tage))))
+        entfallen = [(r["id"], r["event_date"]) for r in offen if r["event_date"] not in gueltig]
+        conn.executemany("DELETE FROM orders WHERE id = ?", [(order_id,) for order_id, _ in entfallen])
+        _log_events(conn, [
+            (order_id, "deleted", {"customer_id": alt["customer_id"], "event_date": tag, "template_id": int(template_id)})
+            for order_id, tag in entfallen
+        ])
+
+        # Kopf und Positionen der verbleibenden Termine in einem Durchgang
+        cur = conn.execute(
+            f"""
+            UPDATE orders
+            SET customer_id = ?, event_time = ?, fulfilment_type = ?, notes = ?,
+                discount_cents = ?, delivery_fee_cents = ?, updated_at = datetime('now')
+            WHERE {_OFFENE_TERMINE_WHERE}
+            """,
+            (t.customer_id, t.event_time, t.fulfilment_type, t.notes, t.discount_cents, t.delivery_fee_cents,
+             int(template_id), heute),
+        )
+        aktualisiert = cur.rowcount
+        ids = [r[0] for r in conn.execute(
+            f"SELECT id FROM orders WHERE {_OFFENE_TERMINE_WHERE}", (int(template_id), heute)
+        )]
+        conn.execute(
+            f"DELETE FROM order_items WHERE order_id IN (SELECT id FROM orders WHERE {_OFFENE_TERMINE_WHERE})",
+            (int(template_id), heute),
+        )
+        conn.executemany(
+            """
+            INSERT INTO order_items (
+              order_id, product_id, description, quantity, unit, unit_price_cents, vat_rate
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            [(order_id, *werte) for order_id in ids for werte in positionen],
+        )
+        _log_events(conn, [(order_id, "template_updated", {"template_id": int(template_id)}) for order_id in ids])
+        _suchindex_aktualisieren(conn, [order_id for order_id, _ in entfallen] + ids)
+
+        # Regel geändert: neue Termine bis zum bisherigen Horizont nachziehen
+        regel_alt = (alt["weekdays"], alt["interval_weeks"], alt["start_date"], alt["end_date"])
+        if regel_alt != (t.weekdays, t.interval_weeks, t.start_date, t.end_date) and (alt["generated_until"] or "") > heute:
+            conn.execute("UPDATE order_templates SET generated_until = ? WHERE id = ?", (heute, int(template_id)))
+            # Vorhandene Termine bleiben dank INSERT OR IGNORE unberührt
+            _serie_erzeugen(conn, date.fromisoformat(alt["generated_until"]), int(template_id))
+
+        _refresh_slot_usage(conn, [r["event_date"] for r in offen])
+        _refresh_customer_stats(conn, {c for c in (alt["customer_id"], t.customer_id) if c is not None})
+        return aktualisiert
+
+
+def end_order_template(template_id: int, last_date: str | None = None, conn: sqlite3.Connection | None = None) -> int:
+    """Beendet eine Serie nach `last_date` (Standard: heute); künftige, nicht abgerechnete
+    Termine danach werden gelöscht. Liefert die Anzahl der gelöschten Bestellungen."""
+    last_date = last_date or date.today().isoformat()
+    with _verbindung(conn) as conn:
+        row = conn.execute("SELECT customer_id FROM order_templates WHERE id = ?", (int(template_id),)).fetchone()
+        if not row:
+            raise ValueError("Vorlage nicht gefunden.")
+        conn.execute(
+            "UPDATE order_templates SET end_date = ?, is_active = 0, updated_at = datetime('now') WHERE id = ?",
+            (last_date, int(template_id)),
+        )
+        grenze = max(last_date, date.today().isoformat())
+        entfallen = conn.execute(
+            f"SELECT id, event_date FROM orders WHERE {_OFFENE_TERMINE_WHERE}", (int(template_id), grenze)
+        ).fetchall()
+        conn.executemany("DELETE FROM orders WHERE id = ?", [(r["id"],) for r in entfallen])
+        _log_events(conn, [
+            (r["id"], "deleted", {"customer_id": row["customer_id"], "event_date": r["event_date"], "template_id": int(template_id)})
+            for r in entfallen
+        ])
+        _refresh_slot_usage(conn, [r["event_date"] for r in entfallen])
+        _suchindex_aktualisieren(conn, [r["id"] for r in entfallen])
+        if row["customer_id"] is not None and entfallen:
+            _refresh_customer_stats(conn, [row["customer_id"]])
+        return len(entfallen)
 
 
 
 # ------------------------------------------------------------
 # Listen / Details
 # ------------------------------------------------------------    
-def list_orders_for_period(start_date: str, end_date: str) -> list[dict]:
-    with get_conn() as conn:
-        rows = conn.execute(
+def list_orders_for_period(start_date: str, end_date: str, conn: sqlite3.Connection | None = None) -> list[OrderListRow]:
+    with _verbindung(conn) as conn:
+        return _abfragen(
+            conn,
+            OrderListRow,
             """
             SELECT
-              o.*,
+              o.id, o.event_date, o.event_time, o.fulfilment_type, o.status, o.notes,
+              o.invoice_number, o.invoice_date, o.payment_method,
               c.name AS customer_name, c.phone AS customer_phone, c.address AS customer_address
             FROM orders o
             LEFT JOIN customers c ON c.id = o.customer_id
@@ -224,30 +1536,35 @@ def list_orders_for_period(start_date: str, end_date: str) -> list[dict]:
             ORDER BY o.event_date ASC, o.event_time ASC, o.id ASC
             """,
             (start_date, end_date),
-        ).fetchall()
-        return [dict(r) for r in rows]
+        )
 
 
-def get_order_with_customer(order_id: int) -> dict:
-    with get_conn() as conn:
-        row = conn.execute(
+def get_order_with_customer(order_id: int, conn: sqlite3.Connection | None = None) -> OrderRow:
+    with _verbindung(conn) as conn:
+        rows = _abfragen(
+            conn,
+            OrderRow,
             """
-            SELECT o.*,
+            SELECT o.id, o.customer_id, o.event_date, o.event_time, o.fulfilment_type, o.status, o.notes,
+                   o.invoice_number, o.invoice_date, o.payment_status, o.payment_method,
+                   o.discount_cents, o.delivery_fee_cents, o.created_at, o.updated_at,
                    c.name AS customer_name, c.phone AS customer_phone, c.address AS customer_address
             FROM orders o
             LEFT JOIN customers c ON c.id = o.customer_id
             WHERE o.id = ?
             """,
             (order_id,),
-        ).fetchone()
-        if not row:
+        )
+        if not rows:
             raise ValueError("Bestellung nicht gefunden.")
-        return dict(row)
+        return rows[0]
 
 
-def get_order_items(order_id: int) -> list[dict]:
-    with get_conn() as conn:
-        rows = conn.execute(
+def get_order_items(order_id: int, conn: sqlite3.Connection | None = None) -> list[OrderItemRow]:
+    with _verbindung(conn) as conn:
+        return _abfragen(
+            conn,
+            OrderItemRow,
             """
             SELECT id, product_id, description, quantity, unit, unit_price_cents, vat_rate
             FROM order_items
@@ -255,19 +1572,224 @@ def get_order_items(order_id: int) -> list[dict]:
             ORDER BY id ASC
             """,
             (order_id,),
-        ).fetchall()
-        return [dict(r) for r in rows]
+        )
+
+
+# ------------------------------------------------------------
+# Volltextsuche (FTS5-Tabelle order_search)
+# Ein Dokument je Bestellung (rowid = orders.id): Notiz, Positionstexte,
+# Kunde (Name, Telefon, Adresse) und Rechnungsnummer. Die Schreibfunktionen
+# schreiben die betroffenen Dokumente in ihrer eigenen Transaktion neu;
+# Datum und Status werden beim Suchen aus orders gelesen und sind daher
+# nie veraltet.
+# ------------------------------------------------------------
+_SUCHTEXT_SQL = """
+    INSERT INTO order_search (rowid, notes, items, customer, invoice)
+    SELECT o.id, o.notes,
+           (SELECT group_concat(i.description, ' ') FROM order_items i WHERE i.order_id = o.id),
+           -- Telefon zusätzlich ohne Trennzeichen, damit "0171/234567" und "0171234567" gleich gefunden werden
+           COALESCE(c.name, '') || ' ' || COALESCE(c.phone, '') || ' '
+             || COALESCE(replace(replace(replace(replace(c.phone, ' ', ''), '/', ''), '-', ''), '+', ''), '') || ' '
+             || COALESCE(c.address, ''),
+           o.invoice_number
+    FROM orders o
+    LEFT JOIN customers c ON c.id = o.customer_id
+"""
+# Spaltengewichte für bm25: notes, items, customer, invoice
+_SUCH_GEWICHTE = "1.0, 1.0, 2.0, 10.0"
+_SUCHWORT = re.compile(r"\w")
+
+
+def _suchindex_aktualisieren(conn: sqlite3.Connection, order_ids) -> None:
+    """Suchdokumente der Bestellungen neu schreiben; gelöschte Bestellungen fallen heraus."""
+    ids = sorted({int(i) for i in order_ids})
+    for start in range(0, len(ids), 500):
+        teil = ids[start:start + 500]
+        platzhalter = ",".join("?" * len(teil))
+        conn.execute(f"DELETE FROM order_search WHERE rowid IN ({platzhalter})", teil)
+        conn.execute(_SUCHTEXT_SQL + f" WHERE o.id IN ({platzhalter})", teil)
+
+
+def _suchindex_kunden(conn: sqlite3.Connection, customer_ids) -> None:
+    """Nach Änderung von Kundendaten: alle Bestellungen der Kunden neu indizieren."""
+    ids = [int(c) for c in customer_ids]
+    if ids:
+        _suchindex_aktualisieren(conn, [r[0] for r in conn.execute(
+            f"SELECT id FROM orders WHERE customer_id IN ({','.join('?' * len(ids))})", ids
+        )])
+
+
+def _fts_anfrage(text: str) -> str:
+    """Freitext -> FTS5-Anfrage: jedes Wort als Präfix, alle Wörter müssen vorkommen.
+
+    Wörter werden als Phrase übergeben, Sonderzeichen (AND, NEAR, Klammern,
+    Bindestriche) haben so keine Bedeutung: "glutenfrei-Müller" sucht die
+    Wortfolge "glutenfrei müller*", "N-1042" die Rechnungsnummer.
+    """
+    worte = [w.replace('"', "") for w in (text or "").split()]
+    return " ".join(f'"{w}"*' for w in worte if _SUCHWORT.search(w))
+
+
+def search_orders(
+    text: str,
+    limit: int = 20,
+    cursor: str | None = None,
+    start_date: str | None = None,
+    end_date: str | None = None,
+    status: str | None = None,
+    conn: sqlite3.Connection | None = None,
+) -> tuple[list[SearchHitRow], str | None]:
+    """Bestellungen zum Suchtext, beste Treffer zuerst, seitenweise.
+
+    Optional eingeschränkt auf einen Zeitraum (event_date) und/oder Status.
+    `cursor` ist der Rückgabewert des vorigen Aufrufs ("<Position>|<höchste ID>");
+    None als zweiter Rückgabewert bedeutet: keine weiteren Seiten.
+
+    Der Cursor merkt sich die Position in der Rangliste, nicht den Score:
+    bm25 hängt von der Statistik des ganzen Index ab, jede neue Bestellung
+    verschiebt alle Scores. Bestellungen, die nach Seite 1 angelegt wurden
+    (ID über der gemerkten höchsten ID), bleiben beim Weiterblättern außen vor.
+    """
+    position, bis_id = 0, None
+    if cursor:
+        try:
+            teile = cursor.split("|")
+            position, bis_id = int(teile[0]), int(teile[1])
+            if len(teile) != 2 or position < 1 or bis_id < 0:
+                raise ValueError
+        except (ValueError, IndexError):
+            raise ValueError("Ungültiger Cursor.") from None
+
+    anfrage = _fts_anfrage(text)
+    if not anfrage:
+        return [], None
+
+    bedingungen = []
+    params: list = [anfrage]
+    if start_date:
+        bedingungen.append("o.event_date >= ?")
+        params.append(start_date)
+    if end_date:
+        bedingungen.append("o.event_date <= ?")
+        params.append(end_date)
+    if status:
+        bedingungen.append("o.status = ?")
+        params.append(status)
+
+    with _verbindung(conn) as conn:
+        if bis_id is None:
+            bis_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM orders").fetchone()[0]
+        bedingungen.append("o.id <= ?")
+        params.append(bis_id)
+        where = "WHERE " + " AND ".join(bedingungen)
+
+        treffer = _abfragen(
+            conn,
+            SearchHitRow,
+            f"""
+            WITH t AS MATERIALIZED (
+              SELECT rowid AS id, bm25(order_search, {_SUCH_GEWICHTE}) AS score
+              FROM order_search
+              WHERE order_search MATCH ?
+            )
+            SELECT
+              o.id, o.event_date, o.event_time, o.fulfilment_type, o.status, o.notes,
+              o.invoice_number, o.invoice_date, o.payment_method,
+              c.name AS customer_name, c.phone AS customer_phone, c.address AS customer_address,
+              t.score, NULL AS snippet
+            FROM t
+            JOIN orders o ON o.id = t.id
+            LEFT JOIN customers c ON c.id = o.customer_id
+            {where}
+            ORDER BY t.score ASC, o.id ASC
+            LIMIT ? OFFSET ?
+            """,
+            (*params, int(limit) + 1, position),
+        )
+        mehr = len(treffer) > limit
+        treffer = treffer[:limit]
+
+        # Textausschnitte nur für die angezeigte Seite. "+rowid": als Bedingung an
+        # FTS5 übergeben, würde die Suche für jede ID einzeln wiederholt
+        ausschnitte = {}
+        if treffer:
+            ausschnitte = dict(conn.execute(
+                f"""
+                SELECT rowid, snippet(order_search, -1, '**', '**', '…', 12)
+                FROM order_search
+                WHERE order_search MATCH ? AND +rowid IN ({",".join("?" * len(treffer))})
+                """,
+                (anfrage, *[h.id for h in treffer]),
+            ).fetchall())
+
+    seite = [h._replace(snippet=ausschnitte.get(h.id)) for h in treffer]
+    next_cursor = f"{position + len(seite)}|{bis_id}" if mehr else None
+    return seite, next_cursor
+
+
+# ------------------------------------------------------------
+# Tagesplan: alle Bestellungen eines Tages inkl. Positionen in einer Abfrage
+# ------------------------------------------------------------
+def list_run_sheet(event_date: str, conn: sqlite3.Connection | None = None) -> list[RunSheetOrder]:
+    """Bestellungen eines Tages nach Art und Uhrzeit, je mit Positionen und offenem Betrag."""
+    with _verbindung(conn) as conn:
+        rows = _abfragen(
+            conn,
+            RunSheetRow,
+            """
+            SELECT o.id, o.event_time, o.fulfilment_type, o.status, o.notes, o.invoice_number,
+                   o.payment_method, o.discount_cents, o.delivery_fee_cents,
+                   c.name, c.phone, c.address,
+                   i.id, i.product_id, i.description, i.quantity, i.unit, i.unit_price_cents, i.vat_rate
+            FROM orders o
+            LEFT JOIN customers c ON c.id = o.customer_id
+            LEFT JOIN order_items i ON i.order_id = o.id
+            WHERE o.event_date = ?
+            ORDER BY o.fulfilment_type ASC, o.event_time ASC, o.id ASC, i.id ASC
+            """,
+            (event_date,),
+        )
+
+    # Zeilen kommen je Bestellung zusammenhängend (ORDER BY ... o.id, i.id)
+    orders: list[RunSheetOrder] = []
+    for _, gruppe in groupby(rows, key=lambda r: r.order_id):
+        gruppe = list(gruppe)
+        r = gruppe[0]
+        items = [OrderItemRow._make(z[-7:]) for z in gruppe if z.item_id is not None]
+        totals = _totals_from_items(items, int(r.discount_cents), int(r.delivery_fee_cents))
+        orders.append(RunSheetOrder(
+            id=r.order_id,
+            event_date=event_date,
+            event_time=r.event_time,
+            fulfilment_type=r.fulfilment_type,
+            status=r.status,
+            notes=r.notes,
+            invoice_number=r.invoice_number,
+            payment_method=r.payment_method,
+            discount_cents=r.discount_cents,
+            delivery_fee_cents=r.delivery_fee_cents,
+            customer_name=r.customer_name,
+            customer_phone=r.customer_phone,
+            customer_address=r.customer_address,
+            items=items,
+            gross_total_cents=totals["gross_total_cents"],
+            amount_due_cents=0 if r.status == "paid" else totals["gross_total_cents"],
+        ))
+    return orders
 
 
 # ------------------------------------------------------------
 # Status / Zahlung
 # ------------------------------------------------------------
-def update_status(order_id: int, new_status: str) -> None:
+def update_status(order_id: int, new_status: str, conn: sqlite3.Connection | None = None) -> None:
     allowed = {"open", "paid"}
     if new_status not in allowed:
         raise ValueError(f"Status muss einer von {sorted(allowed)} sein.")
 
-    with get_conn() as conn:
+    with _verbindung(conn) as conn:
+        row = conn.execute("SELECT customer_id FROM orders WHERE id = ?", (int(order_id),)).fetchone()
+        if not row:
+            raise ValueError("Bestellung nicht gefunden.")
         conn.execute(
             """
             UPDATE orders
@@ -276,11 +1798,14 @@ def update_status(order_id: int, new_status: str) -> None:
             """,
             (new_status, int(order_id)),
         )
+        _log_event(conn, order_id, "status_changed", {"status": new_status})
+        if row["customer_id"] is not None:
+            _refresh_customer_stats(conn, [row["customer_id"]])
 
 
-def set_payment_method(order_id: int, payment_method: str | None) -> None:
+def set_payment_method(order_id: int, payment_method: str | None, conn: sqlite3.Connection | None = None) -> None:
     """Speichert die Zahlungsart (Bar/Karte/...) in der Bestellung."""
-    with get_conn() as conn:
+    with _verbindung(conn) as conn:
         conn.execute(
             """
             UPDATE orders
@@ -289,16 +1814,31 @@ def set_payment_method(order_id: int, payment_method: str | None) -> None:
             """,
             ((payment_method or None), int(order_id)),
         )
+        _log_event(conn, order_id, "payment_method_set", {"payment_method": payment_method or None})
 
 
 
 # ------------------------------------------------------------
 # Rechnung: Nummer vergeben (sequentiell)
 # ------------------------------------------------------------
-def assign_invoice_number(order_id: int) -> str:
+def assign_invoice_number(order_id: int, conn: sqlite3.Connection | None = None) -> str:
     today = date.today().isoformat()
 
-    with get_conn() as conn:
+    with _verbindung(conn) as conn:
+        # Schreibsperre vor dem Lesen des Zählers, sonst lesen zwei Sitzungen dieselbe Nummer
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+
+        order = conn.execute(
+            "SELECT invoice_number FROM orders WHERE id = ?", (int(order_id),)
+        ).fetchone()
+        if not order:
+            raise ValueError("Bestellung nicht gefunden.")
+
+        # Nur vergeben, wenn noch keine Rechnungsnummer gesetzt ist (sonst Lücke im Nummernkreis)
+        if order["invoice_number"]:
+            return order["invoice_number"]
+
         row = conn.execute(
             "SELECT value FROM settings WHERE key='next_invoice_number'"
         ).fetchone()
@@ -311,17 +1851,20 @@ def assign_invoice_number(order_id: int) -> str:
         else:
             next_no = int(row["value"])
 
-        invoice_number = str(next_no)
+        # Standortpräfix (z. B. "N-1001"); der Standardstandort bleibt rein numerisch
+        prefix = conn.execute("SELECT value FROM settings WHERE key='invoice_prefix'").fetchone()
+        invoice_number = f"{prefix['value'] if prefix else ''}{next_no}"
 
-        # Nur vergeben, wenn noch keine Rechnungsnummer gesetzt ist
         conn.execute(
             """
             UPDATE orders
             SET invoice_number = ?, invoice_date = ?, updated_at = datetime('now')
-            WHERE id = ? AND invoice_number IS NULL
+            WHERE id = ?
             """,
             (invoice_number, today, int(order_id)),
         )
+        _log_event(conn, order_id, "invoice_assigned", {"invoice_number": invoice_number, "invoice_date": today})
+        _suchindex_aktualisieren(conn, [order_id])
 
         # Nummer hochzählen
         conn.execute(
@@ -332,22 +1875,60 @@ def assign_invoice_number(order_id: int) -> str:
     return invoice_number
 
 
+# ------------------------------------------------------------
+# Änderungsprotokoll (order_events)
+# Schreibfunktionen rufen _log_event in ihrer eigenen Transaktion auf;
+# Konsumenten lesen mit changes_since ab ihrem letzten seq weiter.
+# ------------------------------------------------------------
+def _log_event(conn: sqlite3.Connection, order_id: int, event_type: str, payload: dict) -> None:
+    _log_events(conn, [(order_id, event_type, payload)])
+
+
+def _log_events(conn: sqlite3.Connection, events: list[tuple[int, str, dict]]) -> None:
+    conn.executemany(
+        "INSERT INTO order_events (order_id, event_type, payload) VALUES (?, ?, ?)",
+        [(int(order_id), event_type, json.dumps(payload, ensure_ascii=False)) for order_id, event_type, payload in events],
+    )
+
+
+def changes_since(seq: int = 0, limit: int = 500, conn: sqlite3.Connection | None = None) -> list[OrderEvent]:
+    """Ereignisse mit seq > `seq`, aufsteigend; der letzte seq ist der nächste Cursor."""
+    with _verbindung(conn) as conn:
+        events = _abfragen(
+            conn,
+            OrderEvent,
+            """
+            SELECT seq, order_id, event_type, payload, created_at
+            FROM order_events
+            WHERE seq > ?
+            ORDER BY seq ASC
+            LIMIT ?
+            """,
+            (int(seq), int(limit)),
+        )
+    return [e._replace(payload=json.loads(e.payload)) for e in events]
+
+
 # ------------------------------------------------------------
 # Summenberechnung (Brutto-Speicherung -> Netto/MwSt berechnen)
 # Hinweis: Rabatt/Lieferpauschale werden vereinfacht dem höchsten MwSt-Satz zugeordnet.
 # Wenn du "buchhalterisch exakt" willst: Rabatt proportional auf Steuersätze verteilen.
 # ------------------------------------------------------------
-def compute_totals(order_id: int) -> dict:
-    with get_conn() as conn:
+def compute_totals(order_id: int, conn: sqlite3.Connection | None = None) -> dict:
+    with _verbindung(conn) as conn:
         o = conn.execute(
             "SELECT discount_cents, delivery_fee_cents FROM orders WHERE id = ?",
             (int(order_id),),
         ).fetchone()
         if not o:
             raise ValueError("Bestellung nicht gefunden.")
+        items = get_order_items(order_id, conn=conn)
+
+    return _totals_from_items(items, int(o["discount_cents"]), int(o["delivery_fee_cents"]))
 
-    items = get_order_items(order_id)
 
+def _totals_from_items(items, discount: int, delivery_fee: int) -> dict:
+    """Summen aus bereits geladenen Positionen (ohne weitere Abfrage)."""
     by_vat: dict[float, dict] = {}
     for it in items:
         vat = float(it["vat_rate"])
@@ -361,9 +1942,6 @@ def compute_totals(order_id: int) -> dict:
         bucket["net"] += line_net
         bucket["vat"] += line_vat
 
-    discount = int(o["discount_cents"])
-    delivery_fee = int(o["delivery_fee_cents"])
-
     if by_vat:
         vat_target = max(by_vat.keys())
 
@@ -0,0 +1,137 @@
+import heapq
+import queue
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import db
+
+# ------------------------------------------------------------
+# Standortübergreifendes Lesen (Zeiträume, Berichte, Exporte)
+#
+# Jede Abfrage läuft je Standortdatei in einem eigenen Thread mit eigener
+# Verbindung (db.im_standort) – die Dateien sind unabhängig, es gibt keine
+# gemeinsamen Sperren. Die je Standort bereits sortierten Ergebnisse werden
+# per heapq.merge in dieselbe Reihenfolge gebracht wie die Einzelabfrage.
+# Geschrieben wird nie hierüber, sondern immer im gewählten Standort.
+# ------------------------------------------------------------
+
+ALLE = "alle"
+
+# Zeile eines Standorts: location = Standort-Code (None = DB_PATH ohne Konfiguration)
+StandortZeile = namedtuple("StandortZeile", "location row")
+
+
+def _ausfuehren(code: str | None, fn, args: tuple, kwargs: dict):
+    with db.im_standort(code):
+        return fn(*args, **kwargs)
+
+
+def verteilen(fn, *args, codes: list[str | None] | None = None, **kwargs) -> list[tuple[str | None, object]]:
+    """Ruft fn(*args, **kwargs) parallel in jedem Standort auf; (Code, Ergebnis) in Konfigurationsreihenfolge."""
+    codes = db.standort_codes() if codes is None else codes
+    if len(codes) == 1:
+        return [(codes[0], _ausfuehren(codes[0], fn, args, kwargs))]
+    with ThreadPoolExecutor(max_workers=len(codes), thread_name_prefix="standort") as pool:
+        futures = [pool.submit(_ausfuehren, code, fn, args, kwargs) for code in codes]
+        return [(code, f.result()) for code, f in zip(codes, futures)]
+
+
+def _zusammenfuehren(teile, schluessel) -> list[StandortZeile]:
+    return list(heapq.merge(
+        *([StandortZeile(code, r) for r in rows] for code, rows in teile),
+        key=lambda z: schluessel(z.row),
+    ))
+
+
+def orders_for_period(start_date: str, end_date: str) -> list[StandortZeile]:
+    """db.list_orders_for_period über alle Standorte, nach Datum, Uhrzeit, ID."""
+    return _zusammenfuehren(
+        verteilen(db.list_orders_for_period, start_date, end_date),
+        lambda o: (o.event_date, o.event_time, o.id),
+    )
+
+
+def run_sheet(event_date: str) -> list[StandortZeile]:
+    """db.list_run_sheet über alle Standorte, nach Art, Uhrzeit, ID."""
+    return _zusammenfuehren(
+        verteilen(db.list_run_sheet, event_date),
+        lambda o: (o.fulfilment_type, o.event_time, o.id),
+    )
+
+
+def purchasing_list(start_date: str, end_date: str) -> tuple[list[db.PurchaseRow], list[StandortZeile]]:
+    """Einkaufsliste aller Standorte; Zutaten werden über Name und Einheit zusammengefasst."""
+    summen: dict[tuple[str, str], float] = {}
+    offen = []
+    for code, (liste, ohne_rezept) in verteilen(db.purchasing_list, start_date, end_date):
+        for p in liste:
+            summen[(p.name, p.unit)] = summen.get((p.name, p.unit), 0.0) + p.quantity
+        offen.extend(StandortZeile(code, o) for o in ohne_rezept)
+    return (
+        sorted(
+            (db.PurchaseRow(None, name, unit, round(menge, 3)) for (name, unit), menge in summen.items()),
+            key=lambda p: p.name.lower(),
+        ),
+        offen,
+    )
+
+
+# ------------------------------------------------------------
+# Exporte: Zeilenströme je Standort (z. B. show_db.zeilen_streamen) werden
+# in eigenen Threads vorausgelesen und sortiert zusammengeführt.
+# ------------------------------------------------------------
+_ENDE = object()
+
+
+def _vorauslesen(code: str | None, strom_erzeugen, puffer: queue.Queue) -> None:
+    try:
+        with db.im_standort(code):
+            for zeile in strom_erzeugen():
+                puffer.put(zeile)
+    except BaseException as e:
+        puffer.put(e)
+    finally:
+        puffer.put(_ENDE)
+
+
+def _aus_puffer(puffer: queue.Queue):
+    while True:
+        zeile = puffer.get()
+        if zeile is _ENDE:
+            return
+        if isinstance(zeile, BaseException):
+            raise zeile
+        yield zeile
+
+
+def _markieren(code: str | None, strom):
+    for zeile in strom:
+        yield (code,) + tuple(zeile)
+
+
+def stroeme_zusammenfuehren(strom_erzeugen, schluessel, puffer_zeilen: int = 2000, codes=None):
+    """strom_erzeugen() liefert je Standort zuerst die Spaltennamen, dann sortierte Zeilen.
+
+    Ergebnis im selben Format, mit vorangestellter Spalte "location";
+    `schluessel(spalten)` liefert die Sortierfunktion für eine Zeile.
+    """
+    codes = db.standort_codes() if codes is None else codes
+    stroeme = []
+    for code in codes:
+        puffer = queue.Queue(maxsize=puffer_zeilen)
+        threading.Thread(target=_vorauslesen, args=(code, strom_erzeugen, puffer), daemon=True).start()
+        stroeme.append((code, _aus_puffer(puffer)))
+
+    spalten = None
+    for _, strom in stroeme:
+        spalten = next(strom, None) or spalten
+    if spalten is None:
+        return
+    yield ["location"] + list(spalten)
+
+    sortierung = schluessel(spalten)
+    yield from heapq.merge(
+        *(_markieren(code, strom) for code, strom in stroeme),
+        key=lambda z: sortierung(z[1:]),
+    )
@@ -0,0 +1,229 @@
+import argparse
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import threading
+import zipfile
+from collections import namedtuple
+from pathlib import Path
+
+import db
+
+# ------------------------------------------------------------
+# Rechnungsarchiv: unveränderliche PDF-Blobs in einer Pack-Datei
+#
+# Pack-Datei (nur anhängen), je Eintrag:
+#   MAGIC (4 Byte) | Länge Rechnungsnr. (H) | Länge PDF (Q) | Rechnungsnr. (UTF-8) | PDF
+# Index in der Datenbank (Tabelle invoice_archive): Rechnungsnummer ->
+# Offset des PDFs, Länge, SHA-256. Lesen erfolgt ohne Kopie über mmap.
+# Jeder Standort (db.standorte) hat neben seiner Datenbank eine eigene
+# Pack-Datei; der Standardstandort behält PACK_PATH.
+# ------------------------------------------------------------
+
+PACK_PATH = Path("rechnungen") / "rechnungen.pack"
+
+MAGIC = b"RPK1"
+_KOPF = struct.Struct("<4sHQ")
+
+ArchivEintrag = namedtuple("ArchivEintrag", "invoice_number pack_offset length sha256")
+
+_karte_lock = threading.Lock()
+_karten: dict[Path, mmap.mmap] = {}
+
+
+def _pack_path() -> Path:
+    standort = db.aktueller_standort()
+    if standort is None or standort.db_path == db.DB_PATH:
+        return PACK_PATH
+    return PACK_PATH.with_name(f"{standort.db_path.stem}.pack")
+
+
+def _eintrag(invoice_number: str) -> ArchivEintrag | None:
+    with db.get_conn() as conn:
+        row = conn.execute(
+            "SELECT invoice_number, pack_offset, length, sha256 FROM invoice_archive WHERE invoice_number = ?",
+            (str(invoice_number),),
+        ).fetchone()
+    return ArchivEintrag(*row) if row else None
+
+
+def speichern(invoice_number: str, pdf: bytes) -> ArchivEintrag:
+    """Legt das PDF einmalig ab; ist die Nummer schon archiviert, bleibt der alte Eintrag."""
+    nr = str(invoice_number).encode("utf-8")
+    pack = _pack_path()
+    pack.parent.mkdir(parents=True, exist_ok=True)
+
+    with db.get_conn() as conn:
+        # Schreibsperre der Datenbank serialisiert auch das Anhängen an die Pack-Datei
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute(
+            "SELECT invoice_number, pack_offset, length, sha256 FROM invoice_archive WHERE invoice_number = ?",
+            (str(invoice_number),),
+        ).fetchone()
+        if row:
+            return ArchivEintrag(*row)
+
+        with open(pack, "ab") as f:
+            f.seek(0, os.SEEK_END)
+            start = f.tell()
+            f.write(_KOPF.pack(MAGIC, len(nr), len(pdf)) + nr)
+            f.write(pdf)
+            f.flush()
+            os.fsync(f.fileno())
+
+        eintrag = ArchivEintrag(str(invoice_number), start + _KOPF.size + len(nr), len(pdf), hashlib.sha256(pdf).hexdigest())
+        conn.execute(
+            "INSERT INTO invoice_archive (invoice_number, pack_offset, length, sha256) VALUES (?, ?, ?, ?)",
+            eintrag,
+        )
+        return eintrag
+
+
+def _abbildung(mindestgroesse: int) -> mmap.mmap:
+    """mmap der Pack-Datei; wird neu erstellt, wenn die Datei inzwischen gewachsen ist."""
+    pack = _pack_path()
+    with _karte_lock:
+        if pack not in _karten or len(_karten[pack]) < mindestgroesse:
+            # Alte Abbildung nicht schließen: ausgegebene memoryviews halten sie am Leben
+            with open(pack, "rb") as f:
+                _karten[pack] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return _karten[pack]
+
+
+def lesen(invoice_number: str) -> memoryview | None:
+    """PDF-Bytes als memoryview direkt aus der Pack-Datei (ohne Kopie); None, wenn nicht archiviert."""
+    eintrag = _eintrag(invoice_number)
+    if eintrag is None:
+        return None
+    return _ausschnitt(eintrag)
+
+
+def _ausschnitt(eintrag: ArchivEintrag) -> memoryview:
+    ende = eintrag.pack_offset + eintrag.length
+    return memoryview(_abbildung(ende))[eintrag.pack_offset:ende]
+
+
+def _eintraege(jahr: int | None = None, nummern: list[str] | None = None) -> list[ArchivEintrag]:
+    sql = """
+        SELECT a.invoice_number, a.pack_offset, a.length, a.sha256
+        FROM invoice_archive a
+        LEFT JOIN orders o ON o.invoice_number = a.invoice_number
+    """
+    where, params = [], []
+    if jahr is not None:
+        where.append("substr(o.invoice_date, 1, 4) = ?")
+        params.append(f"{int(jahr):04d}")
+    if nummern:
+        where.append(f"a.invoice_number IN ({','.join('?' * len(nummern))})")
+        params.extend(str(n) for n in nummern)
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY a.pack_offset"
+    with db.get_conn() as conn:
+        return [ArchivEintrag(*r) for r in conn.execute(sql, params).fetchall()]
+
+
+def zip_exportieren(ziel: Path, jahr: int | None = None, nummern: list[str] | None = None) -> int:
+    """Schreibt die gewählten Rechnungen als Rechnung_<nr>.pdf in ein ZIP; liefert die Anzahl."""
+    eintraege = _eintraege(jahr, nummern)
+    with zipfile.ZipFile(ziel, "w", compression=zipfile.ZIP_STORED) as zf:
+        for e in eintraege:
+            zf.writestr(f"Rechnung_{e.invoice_number}.pdf", _ausschnitt(e))
+    return len(eintraege)
+
+
+def pruefen() -> list[str]:
+    """Prüft Index gegen Pack-Datei (Grenzen, Kopf, SHA-256); liefert gefundene Probleme."""
+    eintraege = _eintraege()
+    if not eintraege:
+        return []
+    pack = _pack_path()
+    if not pack.exists():
+        return [f"Pack-Datei {pack} fehlt ({len(eintraege)} Einträge im Index)."]
+
+    groesse = pack.stat().st_size
+    karte = _abbildung(groesse)
+    probleme = []
+    ende_max = 0
+    for e in eintraege:
+        nr = e.invoice_number.encode("utf-8")
+        kopf_start = e.pack_offset - len(nr) - _KOPF.size
+        if kopf_start < 0 or e.pack_offset + e.length > groesse:
+            probleme.append(f"{e.invoice_number}: Eintrag liegt außerhalb der Pack-Datei.")
+            continue
+        magic, nr_len, laenge = _KOPF.unpack_from(karte, kopf_start)
+        if magic != MAGIC or nr_len != len(nr) or laenge != e.length or karte[kopf_start + _KOPF.size:e.pack_offset] != nr:
+            probleme.append(f"{e.invoice_number}: Kopf in der Pack-Datei passt nicht zum Index.")
+            continue
+        if hashlib.sha256(karte[e.pack_offset:e.pack_offset + e.length]).hexdigest() != e.sha256:
+            probleme.append(f"{e.invoice_number}: SHA-256 stimmt nicht.")
+        ende_max = max(ende_max, e.pack_offset + e.length)
+
+    if ende_max < groesse:
+        probleme.append(f"{groesse - ende_max} Byte am Ende der Pack-Datei ohne Index-Eintrag (abgebrochener Schreibvorgang?).")
+    return probleme
+
+
+def dateien_importieren(ordner: Path) -> int:
+    """Übernimmt vorhandene Rechnung_<nr>.pdf-Dateien, die noch nicht archiviert sind."""
+    anzahl = 0
+    for pfad in sorted(ordner.glob("Rechnung_*.pdf")):
+        nr = pfad.stem[len("Rechnung_"):]
+        if _eintrag(nr) is None:
+            speichern(nr, pfad.read_bytes())
+            anzahl += 1
+    return anzahl
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rechnungsarchiv (Pack-Datei + Index)")
+    sub = parser.add_subparsers(dest="befehl", required=True)
+
+    p_export = sub.add_parser("export", help="Rechnungen als ZIP exportieren")
+    p_export.add_argument("ziel", type=Path)
+    p_export.add_argument("--jahr", type=int, help="nur Rechnungen mit Rechnungsdatum in diesem Jahr")
+    p_export.add_argument("--nr", nargs="*", help="nur diese Rechnungsnummern")
+
+    p_get = sub.add_parser("get", help="eine Rechnung als PDF-Datei ausgeben")
+    p_get.add_argument("nr")
+    p_get.add_argument("--out", type=Path)
+
+    sub.add_parser("verify", help="Archiv auf Vollständigkeit und Prüfsummen prüfen")
+
+    p_import = sub.add_parser("import", help="lose Rechnung_<nr>.pdf-Dateien übernehmen")
+    p_import.add_argument("ordner", type=Path, nargs="?", default=Path("rechnungen"))
+
+    parser.add_argument("--standort", help="Standort-Code aus standorte.json (Standard: DB_PATH)")
+    args = parser.parse_args()
+    try:
+        db.standort_waehlen(args.standort)
+    except ValueError as e:
+        parser.error(str(e))
+    db.init_db()
+
+    if args.befehl == "export":
+        anzahl = zip_exportieren(args.ziel, jahr=args.jahr, nummern=args.nr)
+        print(f"{anzahl} Rechnungen nach {args.ziel} exportiert.")
+    elif args.befehl == "get":
+        pdf = lesen(args.nr)
+        if pdf is None:
+            sys.exit(f"Rechnung {args.nr} ist nicht archiviert.")
+        ziel = args.out or Path(f"Rechnung_{args.nr}.pdf")
+        ziel.write_bytes(pdf)
+        print(f"{ziel} geschrieben ({len(pdf)} Byte).")
+    elif args.befehl == "verify":
+        probleme = pruefen()
+        for p in probleme:
+            print(p)
+        if probleme:
+            sys.exit(1)
+        print("Archiv in Ordnung.")
+    elif args.befehl == "import":
+        print(f"{dateien_importieren(args.ordner)} Dateien übernommen.")
+
+
+if __name__ == "__main__":
+    main()
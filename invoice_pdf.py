@@ -1,29 +1,309 @@
+import io
+from functools import lru_cache
 from pathlib import Path
 from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase.pdfmetrics import stringWidth
 from reportlab.pdfgen import canvas
 
 import db
+import invoice_archive
 
 
 def cent_zu_euro_text(cent: int) -> str:
     return f"{cent / 100:.2f}".replace(".", ",")
 
 
-def text_umbrechen(text: str, max_len: int) -> list[str]:
-    """Einfacher Umbruch nach Wortlänge (für Beschreibung)."""
-    words = (text or "").split()
-    lines, cur = [], []
-    for w in words:
-        if sum(len(x) for x in cur) + len(cur) + len(w) > max_len:
+# ------------------------------------------------------------
+# Satz: Textbreiten aus den Schriftmetriken (ReportLab), Umbruch nach Breite
+# Wortbreiten werden je (Wort, Schrift, Größe) gemerkt – Speisekarten
+# wiederholen dieselben Wörter ständig, gemessen wird jedes Wort nur einmal.
+# Die Standardschriften (Helvetica) haben keine Unterschneidung, die Breite
+# einer Zeile ist daher genau die Summe der Wort- und Leerzeichenbreiten.
+# ------------------------------------------------------------
+@lru_cache(maxsize=20_000)
+def _wortbreite(wort: str, schrift: str, groesse: float) -> float:
+    return stringWidth(wort, schrift, groesse)
+
+
+def textbreite(text: str, schrift: str = "Helvetica", groesse: float = 9) -> float:
+    worte = text.split(" ")
+    return sum(_wortbreite(w, schrift, groesse) for w in worte) + (len(worte) - 1) * _wortbreite(" ", schrift, groesse)
+
+
+def _wort_trennen(wort: str, max_breite: float, schrift: str, groesse: float) -> list[str]:
+    """Überlanges Wort (Artikelnummer, URL) zeichenweise auf mehrere Zeilen verteilen."""
+    teile, start, breite = [], 0, 0.0
+    for i, zeichen in enumerate(wort):
+        b = _wortbreite(zeichen, schrift, groesse)
+        if breite + b > max_breite and i > start:
+            teile.append(wort[start:i])
+            start, breite = i, 0.0
+        breite += b
+    teile.append(wort[start:])
+    return teile
+
+
+def text_umbrechen(text: str, max_breite: float, schrift: str = "Helvetica", groesse: float = 9) -> list[str]:
+    """Umbruch nach gemessener Breite in Punkt (für Beschreibung und Hinweise)."""
+    leer = _wortbreite(" ", schrift, groesse)
+    lines, cur, breite = [], [], 0.0
+    for w in (text or "").split():
+        b = _wortbreite(w, schrift, groesse)
+        if b > max_breite:
+            if cur:
+                lines.append(" ".join(cur))
+            *voll, rest = _wort_trennen(w, max_breite, schrift, groesse)
+            lines.extend(voll)
+            cur, breite = [rest], _wortbreite(rest, schrift, groesse)
+        elif cur and breite + leer + b > max_breite:
             lines.append(" ".join(cur))
-            cur = [w]
+            cur, breite = [w], b
         else:
+            breite += (leer if cur else 0.0) + b
             cur.append(w)
     if cur:
         lines.append(" ".join(cur))
     return lines or [""]
 
 
+# ------------------------------------------------------------
+# Seitenplanung: die Rechnung wird zuerst in Blöcke mit bekannter Höhe
+# zerlegt (Kopf, Tabellenkopf, je Position ein Block, Summen, Hinweise),
+# dann auf Seiten verteilt und erst danach gezeichnet. So ist die
+# Seitenzahl vorher bekannt ("Seite 2 von 3"), der Tabellenkopf steht auf
+# jeder Folgeseite, eine Position wird nicht zerrissen und der Summenblock
+# bleibt zusammen. Jeder Block wird genau einmal gesetzt: linear in der
+# Zahl der Positionen.
+# ------------------------------------------------------------
+SEITE_BREITE, SEITE_HOEHE = A4
+LINKS = 50
+RECHTS = SEITE_BREITE - 50
+OBEN = SEITE_HOEHE - 50
+UNTEN = 60          # darunter steht nur die Fußzeile
+X_MENGE = 360
+X_EINZEL = 450
+BESCHREIBUNG_BREITE = X_MENGE - LINKS - 70   # Rest bleibt für die rechtsbündige Menge
+ZEILE_POSITION = 12
+# Längere Positionen (ganze Menüs) werden in Stücke geteilt, die sicher auf eine Seite passen
+ZEILEN_JE_STUECK = 40
+
+
+class _Block:
+    """Vorab gesetzter Abschnitt: Zeichenbefehle relativ zur Oberkante und seine Höhe."""
+
+    __slots__ = ("ops", "hoehe")
+
+    def __init__(self):
+        self.ops = []
+        self.hoehe = 0.0
+
+    def text(self, schrift: str, groesse: float, x: float, text: str, rechts: bool = False) -> None:
+        self.ops.append((schrift, groesse, x, self.hoehe, text, rechts))
+
+    def linie(self) -> None:
+        self.ops.append((None, 0, 0, self.hoehe, "", False))
+
+    def vorschub(self, dy: float) -> None:
+        self.hoehe += dy
+
+
+class _Seitenplan:
+    """Verteilt Blöcke auf Seiten; jede Seite ist eine Liste (y, Block)."""
+
+    def __init__(self):
+        self.seiten: list[list[tuple[float, _Block]]] = [[]]
+        self.y = OBEN
+
+    def passt(self, hoehe: float) -> bool:
+        return self.y - hoehe >= UNTEN
+
+    def neue_seite(self) -> None:
+        self.seiten.append([])
+        self.y = OBEN
+
+    def setzen(self, block: _Block) -> None:
+        self.seiten[-1].append((self.y, block))
+        self.y -= block.hoehe
+
+
+def _zeichnen(c: canvas.Canvas, seiten: list[list[tuple[float, _Block]]], fusszeile: str) -> None:
+    anzahl = len(seiten)
+    for nr, bloecke in enumerate(seiten, start=1):
+        schrift_aktiv = None
+        for y, block in bloecke:
+            for schrift, groesse, x, dy, text, rechts in block.ops:
+                if schrift is None:
+                    c.line(LINKS, y - dy, RECHTS, y - dy)
+                    continue
+                if (schrift, groesse) != schrift_aktiv:
+                    c.setFont(schrift, groesse)
+                    schrift_aktiv = (schrift, groesse)
+                if rechts:
+                    c.drawRightString(x, y - dy, text)
+                else:
+                    c.drawString(x, y - dy, text)
+        c.setFont("Helvetica", 8)
+        c.drawRightString(RECHTS, 30, f"{fusszeile} – Seite {nr} von {anzahl}")
+        c.showPage()
+
+
+def _kopf_block(order) -> _Block:
+    b = _Block()
+
+    # Absender / Firmendaten (hier bitte deine Daten eintragen)
+    for zeile in (
+        "DEIN PARTY-SERVICE (bitte anpassen)",
+        "Straße 1, 12345 Ort",
+        "Telefon: 01234 56789 | E-Mail: info@...",
+        "USt-IdNr.: ... | IBAN: ...",
+    ):
+        b.text("Helvetica", 10, LINKS, zeile)
+        b.vorschub(14)
+    b.vorschub(12)
+
+    # Rechnungskopf
+    b.text("Helvetica-Bold", 16, LINKS, "Rechnung")
+    b.vorschub(22)
+    for zeile in (
+        f"Rechnungsnummer: {order['invoice_number']}",
+        f"Rechnungsdatum: {order.get('invoice_date') or '-'}",
+        f"Auftragsnummer: {order['id']}",
+        f"Termin: {order['event_date']} {order['event_time']} | Art: {order['fulfilment_type']}",
+    ):
+        b.text("Helvetica", 10, LINKS, zeile)
+        b.vorschub(14)
+    b.vorschub(8)
+
+    # Empfänger (Kunde)
+    b.text("Helvetica-Bold", 10, LINKS, "Rechnung an:")
+    b.vorschub(14)
+    b.text("Helvetica", 10, LINKS, f"{order.get('customer_name') or '-'}")
+    b.vorschub(14)
+    addr = (order.get("customer_address") or "").strip()
+    for line in addr.splitlines():
+        b.text("Helvetica", 10, LINKS, line)
+        b.vorschub(14)
+    phone = (order.get("customer_phone") or "").strip()
+    if phone:
+        b.text("Helvetica", 10, LINKS, f"Telefon: {phone}")
+        b.vorschub(14)
+    b.vorschub(10)
+    return b
+
+
+def _tabellenkopf_block(fortsetzung: bool) -> _Block:
+    b = _Block()
+    b.text("Helvetica-Bold", 10, LINKS, "Positionen (Fortsetzung)" if fortsetzung else "Positionen")
+    b.vorschub(14)
+    b.text("Helvetica-Bold", 9, LINKS, "Beschreibung")
+    b.text("Helvetica-Bold", 9, X_MENGE, "Menge", rechts=True)
+    b.text("Helvetica-Bold", 9, X_EINZEL, "Einzel (Br.)", rechts=True)
+    b.text("Helvetica-Bold", 9, RECHTS, "Gesamt (Br.)", rechts=True)
+    b.vorschub(8)
+    b.linie()
+    b.vorschub(14)
+    return b
+
+
+def _positions_bloecke(it) -> list[_Block]:
+    line_gross = int(round(float(it["quantity"]) * int(it["unit_price_cents"])))
+    desc_lines = text_umbrechen(it["description"], BESCHREIBUNG_BREITE, "Helvetica", 9)
+
+    bloecke = []
+    for start in range(0, len(desc_lines), ZEILEN_JE_STUECK):
+        b = _Block()
+        for j, part in enumerate(desc_lines[start:start + ZEILEN_JE_STUECK], start=start):
+            b.text("Helvetica", 9, LINKS, part)
+            if j == 0:
+                b.text("Helvetica", 9, X_MENGE, f"{float(it['quantity']):g} {it.get('unit') or ''}".strip(), rechts=True)
+                b.text("Helvetica", 9, X_EINZEL, f"{cent_zu_euro_text(int(it['unit_price_cents']))} €", rechts=True)
+                b.text("Helvetica", 9, RECHTS, f"{cent_zu_euro_text(line_gross)} €", rechts=True)
+            b.vorschub(ZEILE_POSITION)
+        bloecke.append(b)
+    return bloecke
+
+
+def _summen_block(totals: dict) -> _Block:
+    b = _Block()
+    b.vorschub(6)
+    b.linie()
+    b.vorschub(18)
+
+    # Lieferung / Rabatt
+    if totals["delivery_fee_cents"]:
+        b.text("Helvetica", 9, RECHTS, f"Lieferpauschale: {cent_zu_euro_text(totals['delivery_fee_cents'])} €", rechts=True)
+        b.vorschub(14)
+    if totals["discount_cents"]:
+        b.text("Helvetica", 9, RECHTS, f"Rabatt: -{cent_zu_euro_text(totals['discount_cents'])} €", rechts=True)
+        b.vorschub(14)
+    b.vorschub(8)
+
+    # MwSt-Aufschlüsselung
+    b.text("Helvetica-Bold", 10, LINKS, "MwSt-Aufschlüsselung")
+    b.vorschub(14)
+    for vat_rate, vals in sorted(totals["by_vat"].items(), key=lambda x: x[0]):
+        b.text(
+            "Helvetica",
+            10,
+            LINKS,
+            f"{int(vat_rate*100)}%: Netto {cent_zu_euro_text(vals['net'])} € / MwSt {cent_zu_euro_text(vals['vat'])} € / Brutto {cent_zu_euro_text(vals['gross'])} €",
+        )
+        b.vorschub(14)
+
+    b.vorschub(8)
+    b.text("Helvetica-Bold", 12, RECHTS, f"Gesamtbetrag (brutto): {cent_zu_euro_text(totals['gross_total_cents'])} €", rechts=True)
+    b.vorschub(14)
+    return b
+
+
+def _hinweis_bloecke(notes: str) -> list[_Block]:
+    """Je Zeile ein Block; die Überschrift bleibt mit der ersten Zeile zusammen."""
+    zeilen = [part for line in notes.splitlines() for part in text_umbrechen(line, RECHTS - LINKS, "Helvetica", 10)]
+    bloecke = []
+    for i, zeile in enumerate(zeilen):
+        b = _Block()
+        if i == 0:
+            b.vorschub(14)
+            b.text("Helvetica-Bold", 10, LINKS, "Hinweise")
+            b.vorschub(14)
+        b.text("Helvetica", 10, LINKS, zeile)
+        b.vorschub(14)
+        bloecke.append(b)
+    return bloecke
+
+
+def rechnung_seiten_planen(order, items, totals) -> list[list[tuple[float, _Block]]]:
+    """Rechnung in Blöcke zerlegen und auf Seiten verteilen (ohne zu zeichnen)."""
+    plan = _Seitenplan()
+    plan.setzen(_kopf_block(order))
+
+    positionen = [b for it in items for b in _positions_bloecke(it)]
+    tabellenkopf = _tabellenkopf_block(fortsetzung=False)
+    # Tabellenkopf nie allein am Seitenende
+    if not plan.passt(tabellenkopf.hoehe + (positionen[0].hoehe if positionen else 0)):
+        plan.neue_seite()
+    plan.setzen(tabellenkopf)
+
+    fortsetzung = _tabellenkopf_block(fortsetzung=True)
+    for b in positionen:
+        if not plan.passt(b.hoehe):
+            plan.neue_seite()
+            plan.setzen(fortsetzung)
+        plan.setzen(b)
+
+    # Summen immer zusammen auf einer Seite
+    summen = _summen_block(totals)
+    if not plan.passt(summen.hoehe):
+        plan.neue_seite()
+    plan.setzen(summen)
+
+    for b in _hinweis_bloecke((order.get("notes") or "").strip()):
+        if not plan.passt(b.hoehe):
+            plan.neue_seite()
+        plan.setzen(b)
+    return plan.seiten
+
+
 def rechnung_pdf_erzeugen(order_id: int, out_dir: str = "rechnungen") -> Path:
     order = db.get_order_with_customer(order_id)
 
@@ -32,150 +312,141 @@ def rechnung_pdf_erzeugen(order_id: int, out_dir: str = "rechnungen") -> Path:
         db.assign_invoice_number(order_id)
         order = db.get_order_with_customer(order_id)
 
-    items = db.get_order_items(order_id)
-    totals = db.compute_totals(order_id)
-
     out = Path(out_dir)
     out.mkdir(parents=True, exist_ok=True)
 
     pdf_path = out / f"Rechnung_{order['invoice_number']}.pdf"
 
-    c = canvas.Canvas(str(pdf_path), pagesize=A4)
-    width, height = A4
-    y = height - 50
-
-    # ------------------------------------------------------------
-    # Absender / Firmendaten (hier bitte deine Daten eintragen)
-    # ------------------------------------------------------------
-    c.setFont("Helvetica", 10)
-    c.drawString(50, y, "DEIN PARTY-SERVICE (bitte anpassen)")
-    y -= 14
-    c.drawString(50, y, "Straße 1, 12345 Ort")
-    y -= 14
-    c.drawString(50, y, "Telefon: 01234 56789 | E-Mail: info@...")
-    y -= 14
-    c.drawString(50, y, "USt-IdNr.: ... | IBAN: ...")
-    y -= 26
-
-    # ------------------------------------------------------------
-    # Rechnungskopf
-    # ------------------------------------------------------------
-    c.setFont("Helvetica-Bold", 16)
-    c.drawString(50, y, "Rechnung")
-    y -= 22
-
-    c.setFont("Helvetica", 10)
-    c.drawString(50, y, f"Rechnungsnummer: {order['invoice_number']}")
-    y -= 14
-    c.drawString(50, y, f"Rechnungsdatum: {order.get('invoice_date') or '-'}")
-    y -= 14
-    c.drawString(50, y, f"Auftragsnummer: {order['id']}")
-    y -= 14
-    c.drawString(50, y, f"Termin: {order['event_date']} {order['event_time']} | Art: {order['fulfilment_type']}")
-    y -= 22
-
-    # ------------------------------------------------------------
-    # Empfänger (Kunde)
-    # ------------------------------------------------------------
-    c.setFont("Helvetica-Bold", 10)
-    c.drawString(50, y, "Rechnung an:")
-    y -= 14
+    # Rechnungen sind nach Vergabe der Nummer unveränderlich: vorhandenes Archiv-PDF verwenden
+    archiviert = invoice_archive.lesen(order["invoice_number"])
+    if archiviert is not None:
+        if not pdf_path.exists():
+            pdf_path.write_bytes(archiviert)
+        return pdf_path
 
-    c.setFont("Helvetica", 10)
-    c.drawString(50, y, f"{order.get('customer_name') or '-'}")
-    y -= 14
+    items = db.get_order_items(order_id)
+    totals = db.compute_totals(order_id)
 
-    addr = (order.get("customer_address") or "").strip()
-    if addr:
-        for line in addr.splitlines():
-            c.drawString(50, y, line)
-            y -= 14
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4)
+    _zeichnen(c, rechnung_seiten_planen(order, items, totals), f"Rechnung {order['invoice_number']}")
+    c.save()
+    pdf = buffer.getvalue()
+    invoice_archive.speichern(order["invoice_number"], pdf)
+    pdf_path.write_bytes(pdf)
+    return pdf_path
 
-    phone = (order.get("customer_phone") or "").strip()
-    if phone:
-        c.drawString(50, y, f"Telefon: {phone}")
-        y -= 14
-
-    y -= 10
-
-    # ------------------------------------------------------------
-    # Positionen (Tabelle)
-    # ------------------------------------------------------------
-    c.setFont("Helvetica-Bold", 10)
-    c.drawString(50, y, "Positionen")
-    y -= 14
-
-    c.setFont("Helvetica-Bold", 9)
-    c.drawString(50, y, "Beschreibung")
-    c.drawRightString(360, y, "Menge")
-    c.drawRightString(450, y, "Einzel (Br.)")
-    c.drawRightString(width - 50, y, "Gesamt (Br.)")
-    y -= 8
-    c.line(50, y, width - 50, y)
-    y -= 14
-
-    c.setFont("Helvetica", 9)
-    for it in items:
-        line_gross = int(round(float(it["quantity"]) * int(it["unit_price_cents"])))
-        desc_lines = text_umbrechen(it["description"], 45)
-
-        for j, part in enumerate(desc_lines):
-            c.drawString(50, y, part)
-            if j == 0:
-                c.drawRightString(360, y, f"{float(it['quantity']):g} {it.get('unit') or ''}".strip())
-                c.drawRightString(450, y, f"{cent_zu_euro_text(int(it['unit_price_cents']))} €")
-                c.drawRightString(width - 50, y, f"{cent_zu_euro_text(line_gross)} €")
-            y -= 12
 
-            # Seitenumbruch
-            if y < 120:
-                c.showPage()
-                y = height - 50
-                c.setFont("Helvetica", 9)
+# ------------------------------------------------------------
+# Tagesplan (Fahrer / Theke): alle Bestellungen eines Tages
+# ------------------------------------------------------------
+ART_TITEL = {
+    "pickup": "Abholung",
+    "delivery": "Lieferung",
+}
 
-    y -= 6
-    c.line(50, y, width - 50, y)
-    y -= 18
 
-    # Lieferung / Rabatt
-    if totals["delivery_fee_cents"]:
-        c.drawRightString(width - 50, y, f"Lieferpauschale: {cent_zu_euro_text(totals['delivery_fee_cents'])} €")
-        y -= 14
-    if totals["discount_cents"]:
-        c.drawRightString(width - 50, y, f"Rabatt: -{cent_zu_euro_text(totals['discount_cents'])} €")
-        y -= 14
+def _tagesplan_block(o: db.RunSheetOrder) -> list[tuple[str, str, str]]:
+    """Zeilen eines Auftrags im Tagesplan als (Schrift, links, rechts)."""
+    kopf = f"{o.event_time}  #{o.id}  {o.customer_name or '-'}"
+    if o.amount_due_cents:
+        betrag = f"Offen: {cent_zu_euro_text(o.amount_due_cents)} €"
+    else:
+        betrag = "bezahlt"
+    zeilen = [("Helvetica-Bold", kopf, betrag)]
 
-    y -= 8
+    phone = (o.customer_phone or "").strip()
+    if phone:
+        zeilen.append(("Helvetica", f"Telefon: {phone}", ""))
+    if o.fulfilment_type == "delivery":
+        addr = (o.customer_address or "").strip() or "-"
+        for i, line in enumerate(addr.splitlines()):
+            zeilen.append(("Helvetica", ("Adresse: " if i == 0 else "         ") + line, ""))
+    if o.invoice_number:
+        zeilen.append(("Helvetica", f"Rechnung: {o.invoice_number}", ""))
+
+    for it in o.items:
+        menge = f"{float(it.quantity):g} {it.unit or ''}".strip()
+        einzug = f"    {menge} × "
+        for j, part in enumerate(text_umbrechen(it.description, RECHTS - LINKS - textbreite(einzug), "Helvetica", 9)):
+            zeilen.append(("Helvetica", einzug + part if j == 0 else f"        {part}", ""))
+
+    notes = (o.notes or "").strip()
+    if notes:
+        for line in notes.splitlines():
+            for part in text_umbrechen(line, RECHTS - LINKS - textbreite("Hinweis: ", "Helvetica-Oblique", 9), "Helvetica-Oblique", 9):
+                zeilen.append(("Helvetica-Oblique", f"Hinweis: {part}", ""))
+    return zeilen
 
-    # MwSt-Aufschlüsselung
-    c.setFont("Helvetica-Bold", 10)
-    c.drawString(50, y, "MwSt-Aufschlüsselung")
-    y -= 14
 
-    c.setFont("Helvetica", 10)
-    for vat_rate, vals in sorted(totals["by_vat"].items(), key=lambda x: x[0]):
-        c.drawString(
-            50,
-            y,
-            f"{int(vat_rate*100)}%: Netto {cent_zu_euro_text(vals['net'])} € / MwSt {cent_zu_euro_text(vals['vat'])} € / Brutto {cent_zu_euro_text(vals['gross'])} €",
-        )
-        y -= 14
+def tagesplan_pdf_erzeugen(datum: str, out_dir: str = "tagesplaene") -> Path:
+    """Tagesplan für `datum` (YYYY-MM-DD): Abholungen und Lieferungen nach Uhrzeit."""
+    orders = db.list_run_sheet(datum)
 
-    y -= 8
-    c.setFont("Helvetica-Bold", 12)
-    c.drawRightString(width - 50, y, f"Gesamtbetrag (brutto): {cent_zu_euro_text(totals['gross_total_cents'])} €")
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    pdf_path = out / f"Tagesplan_{datum}.pdf"
 
-    # Hinweise
-    notes = (order.get("notes") or "").strip()
-    if notes:
-        y -= 28
-        c.setFont("Helvetica-Bold", 10)
-        c.drawString(50, y, "Hinweise")
-        y -= 14
+    c = canvas.Canvas(str(pdf_path), pagesize=A4)
+    width, height = A4
+    seite = 1
+    zeilenhoehe = 12
+
+    def seitenkopf() -> float:
+        c.setFont("Helvetica-Bold", 14)
+        c.drawString(50, height - 50, f"Tagesplan {datum}")
+        c.setFont("Helvetica", 9)
+        c.drawRightString(width - 50, height - 50, f"Seite {seite}")
+        return height - 76
+
+    y = seitenkopf()
+    if not orders:
         c.setFont("Helvetica", 10)
-        for line in notes.splitlines():
-            c.drawString(50, y, line)
-            y -= 14
+        c.drawString(50, y, "Keine Bestellungen.")
+
+    for art in ("pickup", "delivery"):
+        gruppe = [o for o in orders if o.fulfilment_type == art]
+        if not gruppe:
+            continue
+
+        # Abschnittstitel nicht allein am Seitenende stehen lassen
+        if y < 120:
+            c.showPage()
+            seite += 1
+            y = seitenkopf()
+        offen = sum(o.amount_due_cents for o in gruppe)
+        c.setFont("Helvetica-Bold", 12)
+        c.drawString(50, y, f"{ART_TITEL[art]} ({len(gruppe)})")
+        c.setFont("Helvetica", 9)
+        c.drawRightString(width - 50, y, f"Offen gesamt: {cent_zu_euro_text(offen)} €")
+        y -= 6
+        c.line(50, y, width - 50, y)
+        y -= 16
+
+        for o in gruppe:
+            zeilen = _tagesplan_block(o)
+            # Auftrag nicht über Seiten teilen (außer er ist länger als eine Seite)
+            if y - len(zeilen) * zeilenhoehe < 50 and y < height - 100:
+                c.showPage()
+                seite += 1
+                y = seitenkopf()
+
+            for schrift, links, rechts in zeilen:
+                c.setFont(schrift, 10 if schrift == "Helvetica-Bold" else 9)
+                c.drawString(50, y, links)
+                if rechts:
+                    c.drawRightString(width - 50, y, rechts)
+                y -= zeilenhoehe
+                if y < 50:
+                    c.showPage()
+                    seite += 1
+                    y = seitenkopf()
+
+            y -= 4
+            c.setLineWidth(0.3)
+            c.line(50, y + 8, width - 50, y + 8)
+            c.setLineWidth(1)
+            y -= 6
 
     c.save()
     return pdf_path
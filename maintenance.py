@@ -0,0 +1,260 @@
+import argparse
+import datetime as dt
+import logging
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+import db
+
+# ------------------------------------------------------------
+# Datenbankwartung: Statistik, freie Seiten, WAL, Suchindex, Integrität
+#
+# Jeder Lauf hat ein festes Zeitbudget: ein Progress-Handler bricht die
+# laufende Anweisung nach Ablauf ab, und auf Schreibsperren wird nur kurz
+# gewartet – die Bestellerfassung hat immer Vorrang. Was nicht fertig wird,
+# ist beim nächsten Lauf wieder fällig. Jede Aufgabe wird mit Dauer und
+# Ergebnis in maintenance_log protokolliert. Mit mehreren Standorten
+# (db.standorte) wird jede Datei für sich gewartet, jede mit eigenem Budget.
+#
+# Start aus der App: Planer (Hintergrund-Thread, läuft bei Leerlauf).
+# Von Hand: python maintenance.py run [--budget 5] [--alle] | log
+# ------------------------------------------------------------
+
+BUDGET_S = 2.0
+BUSY_TIMEOUT_MS = 100
+SEITEN_JE_SCHRITT = 256
+WIEDERHOLEN_S = 15 * 60
+LOG_BEHALTEN = 1000
+
+log = logging.getLogger("maintenance")
+
+WartungsLauf = namedtuple("WartungsLauf", "task started_at duration_ms result detail")
+
+
+def _statistik(conn: sqlite3.Connection) -> str:
+    # ANALYZE nur stichprobenartig, damit große Tabellen das Budget nicht sprengen
+    conn.execute("PRAGMA analysis_limit = 400")
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone():
+        conn.execute("ANALYZE")
+        return "ANALYZE (erste Statistik)"
+    conn.execute("PRAGMA optimize")
+    return "PRAGMA optimize"
+
+
+def _freie_seiten(conn: sqlite3.Connection, frist: float) -> str:
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        return "übersprungen: auto_vacuum ist nicht INCREMENTAL (db.preflight() ausführen)"
+    vorher = frei = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    # In kleinen Schritten, damit die Schreibsperre nie lange gehalten wird
+    while frei and time.monotonic() < frist:
+        conn.execute(f"PRAGMA incremental_vacuum({SEITEN_JE_SCHRITT})").fetchall()
+        frei = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    return f"{vorher - frei} Seiten freigegeben, {frei} noch frei"
+
+
+def _wal_checkpoint(conn: sqlite3.Connection) -> str:
+    if conn.execute("PRAGMA journal_mode").fetchone()[0] != "wal":
+        return "übersprungen: kein WAL"
+    # PASSIVE wartet nicht auf Leser/Schreiber; der Rest folgt beim nächsten Lauf
+    busy, log, kopiert = conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+    return f"{kopiert} von {log} Seiten übertragen" + (" (teilweise blockiert)" if busy else "")
+
+
+def _suchindex_zusammenfassen(conn: sqlite3.Connection) -> str:
+    # Jede Änderung legt in FTS5 ein kleines Segment an; "merge" fasst sie in
+    # begrenzten Schritten zusammen (ein vollständiges "optimize" sprengt das Budget)
+    vorher = conn.total_changes
+    conn.execute("INSERT INTO order_search (order_search, rank) VALUES ('merge', 500)")
+    return f"{conn.total_changes - vorher} Indexblöcke geschrieben"
+
+
+def _quick_check(conn: sqlite3.Connection) -> str:
+    meldungen = [r[0] for r in conn.execute("PRAGMA quick_check").fetchall()]
+    if meldungen != ["ok"]:
+        raise RuntimeError("; ".join(meldungen[:10]))
+    return "ok"
+
+
+# Aufgabe -> (Mindestabstand in Sekunden, Funktion(conn, frist))
+AUFGABEN = {
+    "optimize": (60 * 60, lambda conn, frist: _statistik(conn)),
+    "incremental_vacuum": (60 * 60, _freie_seiten),
+    "wal_checkpoint": (10 * 60, lambda conn, frist: _wal_checkpoint(conn)),
+    "fts_merge": (60 * 60, lambda conn, frist: _suchindex_zusammenfassen(conn)),
+    "quick_check": (24 * 60 * 60, lambda conn, frist: _quick_check(conn)),
+}
+
+
+def _faellig(conn: sqlite3.Connection, jetzt: dt.datetime) -> list[str]:
+    """Aufgaben ohne erfolgreichen Lauf im Mindestabstand und ohne Versuch in den letzten WIEDERHOLEN_S."""
+    letzte = {}
+    for task, zuletzt_ok, zuletzt in conn.execute(
+        "SELECT task, MAX(CASE WHEN result = 'ok' THEN started_at END), MAX(started_at) FROM maintenance_log GROUP BY task"
+    ):
+        letzte[task] = (zuletzt_ok, zuletzt)
+
+    faellig = []
+    for task, (abstand_s, _) in AUFGABEN.items():
+        zuletzt_ok, zuletzt = letzte.get(task, (None, None))
+        if zuletzt_ok and (jetzt - dt.datetime.fromisoformat(zuletzt_ok)).total_seconds() < abstand_s:
+            continue
+        if zuletzt and (jetzt - dt.datetime.fromisoformat(zuletzt)).total_seconds() < WIEDERHOLEN_S:
+            continue
+        faellig.append(task)
+    return faellig
+
+
+def ausfuehren(budget_s: float = BUDGET_S, alle: bool = False) -> list[WartungsLauf]:
+    """Fällige (oder mit alle=True sämtliche) Aufgaben innerhalb des Zeitbudgets ausführen und protokollieren."""
+    frist = time.monotonic() + budget_s
+    laeufe = []
+    with db.get_conn() as conn:
+        conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+        try:
+            tasks = list(AUFGABEN) if alle else _faellig(conn, dt.datetime.now())
+            for task in tasks:
+                if time.monotonic() >= frist:
+                    break
+                started_at = dt.datetime.now().isoformat(timespec="seconds")
+                t0 = time.perf_counter()
+                conn.set_progress_handler(lambda: time.monotonic() > frist, 1000)
+                try:
+                    detail = AUFGABEN[task][1](conn, frist)
+                    result = "ok"
+                except sqlite3.OperationalError as e:
+                    result = "timeout" if "interrupt" in str(e) else "busy" if "locked" in str(e) else "error"
+                    detail = str(e)
+                except Exception as e:
+                    result, detail = "error", str(e)
+                finally:
+                    conn.set_progress_handler(None, 0)
+
+                lauf = WartungsLauf(task, started_at, int((time.perf_counter() - t0) * 1000), result, detail)
+                conn.execute(
+                    "INSERT INTO maintenance_log (task, started_at, duration_ms, result, detail) VALUES (?, ?, ?, ?, ?)",
+                    lauf,
+                )
+                # Sofort festschreiben: wal_checkpoint/incremental_vacuum laufen außerhalb einer Transaktion
+                conn.commit()
+                laeufe.append(lauf)
+
+            if laeufe:
+                conn.execute("DELETE FROM maintenance_log WHERE id <= (SELECT MAX(id) FROM maintenance_log) - ?", (LOG_BEHALTEN,))
+        finally:
+            conn.execute(f"PRAGMA busy_timeout = {int(db.BUSY_TIMEOUT_S * 1000)}")
+    return laeufe
+
+
+def protokoll(limit: int = 20) -> list[WartungsLauf]:
+    with db.get_conn() as conn:
+        rows = conn.execute(
+            "SELECT task, started_at, duration_ms, result, detail FROM maintenance_log ORDER BY id DESC LIMIT ?",
+            (int(limit),),
+        ).fetchall()
+    return [WartungsLauf(*r) for r in rows]
+
+
+# ------------------------------------------------------------
+# Planer: Hintergrund-Thread im App-Prozess
+# Läuft, sobald seit leerlauf_s keine Aktivität gemeldet wurde,
+# spätestens aber nach spaetestens_s (dann ebenfalls nur im Zeitbudget).
+# aktivitaet() kommt aus den Session-Threads der App, _schleife liest im
+# Wartungs-Thread: die Zeitstempel und der Thread stehen unter self._lock.
+# ------------------------------------------------------------
+class Planer:
+    def __init__(self, leerlauf_s: float = 120.0, spaetestens_s: float = 6 * 60 * 60,
+                 pruefen_s: float = 30.0, budget_s: float = BUDGET_S):
+        self.leerlauf_s = leerlauf_s
+        self.spaetestens_s = spaetestens_s
+        self.pruefen_s = pruefen_s
+        self.budget_s = budget_s
+        self._lock = threading.Lock()
+        self._zuletzt_aktiv = time.monotonic()
+        self._zuletzt_gelaufen = time.monotonic()
+        self._stopp = threading.Event()
+        self._thread = None
+
+    def aktivitaet(self) -> None:
+        """Von der App bei jeder Interaktion aufrufen; verschiebt die Wartung."""
+        with self._lock:
+            self._zuletzt_aktiv = time.monotonic()
+
+    def starten(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._stopp.clear()
+                self._thread = threading.Thread(target=self._schleife, name="db-wartung", daemon=True)
+                self._thread.start()
+
+    def stoppen(self) -> None:
+        self._stopp.set()
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join()
+
+    def _jetzt_faellig(self) -> bool:
+        """Leerlauf erreicht oder spaetestens_s überschritten; merkt den Lauf vor."""
+        jetzt = time.monotonic()
+        with self._lock:
+            if jetzt - self._zuletzt_aktiv < self.leerlauf_s and jetzt - self._zuletzt_gelaufen < self.spaetestens_s:
+                return False
+            self._zuletzt_gelaufen = jetzt
+            return True
+
+    def _schleife(self) -> None:
+        try:
+            while not self._stopp.wait(self.pruefen_s):
+                if not self._jetzt_faellig():
+                    continue
+                try:
+                    codes = db.standort_codes()
+                except Exception:
+                    log.exception("Wartung: Standorte nicht lesbar")
+                    continue
+                for code in codes:
+                    try:
+                        with db.im_standort(code):
+                            ausfuehren(self.budget_s)
+                    except sqlite3.Error:
+                        # z. B. Datei gesperrt beim Protokollieren – beim nächsten Durchgang erneut
+                        pass
+                    except Exception:
+                        # z. B. unlesbarer Zeitstempel in maintenance_log: protokollieren und
+                        # weiterlaufen, sonst stünde die Wartung bis zum Neustart der App still
+                        log.exception("Wartung im Standort %s fehlgeschlagen", code)
+        finally:
+            # Falls der Thread doch endet: starten() soll einen neuen anlegen können
+            with self._lock:
+                if self._thread is threading.current_thread():
+                    self._thread = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Datenbankwartung (optimize, incremental_vacuum, WAL, quick_check)")
+    sub = parser.add_subparsers(dest="befehl", required=True)
+
+    p_run = sub.add_parser("run", help="fällige Wartungsaufgaben jetzt ausführen")
+    p_run.add_argument("--budget", type=float, default=BUDGET_S, help="Zeitbudget in Sekunden")
+    p_run.add_argument("--alle", action="store_true", help="alle Aufgaben, auch wenn noch nicht fällig")
+
+    p_log = sub.add_parser("log", help="letzte Wartungsläufe anzeigen")
+    p_log.add_argument("--limit", type=int, default=20)
+
+    args = parser.parse_args()
+    for code in db.standort_codes():
+        with db.im_standort(code):
+            db.init_db()
+            laeufe = ausfuehren(args.budget, alle=args.alle) if args.befehl == "run" else protokoll(args.limit)
+        if code is not None:
+            print(f"[{code}]")
+        if not laeufe:
+            print("Keine Wartung fällig." if args.befehl == "run" else "Noch keine Wartungsläufe.")
+        for lauf in laeufe:
+            print(f"{lauf.started_at}  {lauf.task:<20}{lauf.duration_ms:>7} ms  {lauf.result:<8}{lauf.detail or ''}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,7 @@
 PRAGMA foreign_keys = ON;
+-- Neue Dateien: freie Seiten lassen sich später schrittweise zurückgeben
+-- (maintenance.py); bestehende Dateien stellt db.preflight() einmalig um.
+PRAGMA auto_vacuum = INCREMENTAL;
 
 CREATE TABLE IF NOT EXISTS customers (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -75,9 +78,154 @@ CREATE TABLE IF NOT EXISTS order_items (
   FOREIGN KEY (product_id) REFERENCES products(id)
 );
 
+-- Änderungsprotokoll (nur anhängen): jede Schreiboperation auf orders erzeugt
+-- in derselben Transaktion ein Ereignis; seq dient Konsumenten als Cursor.
+-- Kein Fremdschlüssel, damit Ereignisse gelöschter Bestellungen erhalten bleiben.
+CREATE TABLE IF NOT EXISTS order_events (
+  seq INTEGER PRIMARY KEY AUTOINCREMENT,
+  order_id INTEGER NOT NULL,
+  event_type TEXT NOT NULL
+    CHECK (event_type IN ('created','deleted','status_changed','payment_method_set','invoice_assigned','template_updated','customer_merged')),
+  payload TEXT NOT NULL DEFAULT '{}',
+  created_at TEXT DEFAULT (datetime('now'))
+);
+
+-- Index des Rechnungsarchivs (invoice_archive.py): Lage der unveränderlichen
+-- PDF-Blobs in der Pack-Datei, je Rechnungsnummer genau ein Eintrag.
+CREATE TABLE IF NOT EXISTS invoice_archive (
+  invoice_number TEXT PRIMARY KEY,
+  pack_offset INTEGER NOT NULL,
+  length INTEGER NOT NULL,
+  sha256 TEXT NOT NULL,
+  archived_at TEXT DEFAULT (datetime('now'))
+);
+
+-- Kundenkennzahlen, bei jedem Schreibvorgang auf Bestellungen des Kunden
+-- in derselben Transaktion neu berechnet (db._refresh_customer_stats).
+CREATE TABLE IF NOT EXISTS customer_stats (
+  customer_id INTEGER PRIMARY KEY,
+  order_count INTEGER NOT NULL DEFAULT 0,
+  lifetime_gross_cents INTEGER NOT NULL DEFAULT 0,
+  last_order_date TEXT,
+  open_balance_cents INTEGER NOT NULL DEFAULT 0,
+  FOREIGN KEY (customer_id) REFERENCES customers(id) ON DELETE CASCADE
+);
+
+-- Serienbestellungen: Vorlage mit Kopf, Positionen und Wiederholungsregel.
+-- weekdays: kommagetrennt, 0 = Montag; alle interval_weeks Wochen ab start_date.
+-- generated_until: bis zu diesem Datum sind Bestellungen erzeugt (orders.template_id).
+CREATE TABLE IF NOT EXISTS order_templates (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  customer_id INTEGER,
+  name TEXT NOT NULL,
+
+  event_time TEXT NOT NULL,
+  fulfilment_type TEXT NOT NULL CHECK (fulfilment_type IN ('pickup','delivery')),
+  notes TEXT,
+  discount_cents INTEGER NOT NULL DEFAULT 0,
+  delivery_fee_cents INTEGER NOT NULL DEFAULT 0,
+
+  weekdays TEXT NOT NULL,
+  interval_weeks INTEGER NOT NULL DEFAULT 1,
+  start_date TEXT NOT NULL,
+  end_date TEXT,
+  generated_until TEXT,
+  is_active INTEGER NOT NULL DEFAULT 1,
+
+  created_at TEXT DEFAULT (datetime('now')),
+  updated_at TEXT DEFAULT (datetime('now')),
+
+  FOREIGN KEY (customer_id) REFERENCES customers(id)
+);
+
+CREATE TABLE IF NOT EXISTS order_template_items (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  template_id INTEGER NOT NULL,
+
+  product_id INTEGER,
+  description TEXT NOT NULL,
+  quantity REAL NOT NULL DEFAULT 1,
+  unit TEXT DEFAULT 'Stk',
+
+  unit_price_cents INTEGER NOT NULL,
+  vat_rate REAL NOT NULL DEFAULT 0.19,
+
+  FOREIGN KEY (template_id) REFERENCES order_templates(id) ON DELETE CASCADE,
+  FOREIGN KEY (product_id) REFERENCES products(id)
+);
+
+-- Kapazität je Zeitfenster (db.SLOT_MINUTEN) und Art: Obergrenze für Bestellungen
+-- (bei Lieferung = Fahrten) und/oder Portionen; NULL = keine Grenze.
+CREATE TABLE IF NOT EXISTS slot_capacity (
+  slot TEXT NOT NULL,
+  fulfilment_type TEXT NOT NULL CHECK (fulfilment_type IN ('pickup','delivery')),
+  max_orders INTEGER,
+  max_portions REAL,
+  PRIMARY KEY (slot, fulfilment_type)
+);
+
+-- Auslastung je Tag und Zeitfenster, von den Schreibfunktionen mitgeführt
+-- (db._slot_belegen / db._refresh_slot_usage).
+CREATE TABLE IF NOT EXISTS slot_usage (
+  event_date TEXT NOT NULL,
+  slot TEXT NOT NULL,
+  fulfilment_type TEXT NOT NULL,
+  order_count INTEGER NOT NULL DEFAULT 0,
+  portions REAL NOT NULL DEFAULT 0,
+  PRIMARY KEY (event_date, slot, fulfilment_type)
+) WITHOUT ROWID;
+
+-- Rezepturen: Zutaten (Rohwaren) und Bestandteile je 1 Einheit eines Produkts.
+-- Eine Zeile verweist entweder auf eine Zutat oder auf ein anderes Produkt
+-- (Unterrezept, z. B. Kartoffelsalat im Buffet).
+CREATE TABLE IF NOT EXISTS ingredients (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  name TEXT NOT NULL UNIQUE,
+  unit TEXT NOT NULL DEFAULT 'kg',
+  created_at TEXT DEFAULT (datetime('now'))
+);
+
+CREATE TABLE IF NOT EXISTS recipe_lines (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  product_id INTEGER NOT NULL,
+  ingredient_id INTEGER,
+  sub_product_id INTEGER,
+  quantity REAL NOT NULL CHECK (quantity > 0),
+  CHECK ((ingredient_id IS NULL) != (sub_product_id IS NULL)),
+  FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE,
+  FOREIGN KEY (ingredient_id) REFERENCES ingredients(id),
+  FOREIGN KEY (sub_product_id) REFERENCES products(id)
+);
+
+-- Volltextsuche (db.search_orders): ein Dokument je Bestellung, rowid = orders.id.
+-- Gepflegt von den Schreibfunktionen (db._suchindex_aktualisieren); Datum und
+-- Status kommen beim Suchen aus orders. Umlaute/Akzente werden ignoriert.
+CREATE VIRTUAL TABLE IF NOT EXISTS order_search USING fts5(
+  notes, items, customer, invoice,
+  tokenize = 'unicode61 remove_diacritics 2',
+  prefix = '2 3'
+);
+
+-- Protokoll der Datenbankwartung (maintenance.py): je Aufgabe und Lauf
+-- Dauer und Ergebnis (ok / timeout / error).
+CREATE TABLE IF NOT EXISTS maintenance_log (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  task TEXT NOT NULL,
+  started_at TEXT NOT NULL,
+  duration_ms INTEGER NOT NULL,
+  result TEXT NOT NULL,
+  detail TEXT
+);
+
 CREATE INDEX IF NOT EXISTS idx_orders_date_time ON orders(event_date, event_time);
 CREATE INDEX IF NOT EXISTS idx_orders_status ON orders(status);
+CREATE INDEX IF NOT EXISTS idx_orders_customer_date ON orders(customer_id, event_date);
 CREATE INDEX IF NOT EXISTS idx_orders_invoice ON orders(invoice_number);
+CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items(order_id);
+CREATE INDEX IF NOT EXISTS idx_order_template_items_template ON order_template_items(template_id);
+CREATE INDEX IF NOT EXISTS idx_recipe_lines_product ON recipe_lines(product_id);
 CREATE INDEX IF NOT EXISTS idx_customers_phone ON customers(phone);
 CREATE INDEX IF NOT EXISTS idx_products_active ON products(is_active);
 CREATE INDEX IF NOT EXISTS idx_products_name ON products(name);
+CREATE INDEX IF NOT EXISTS idx_order_events_order ON order_events(order_id);
+CREATE INDEX IF NOT EXISTS idx_maintenance_log_task ON maintenance_log(task, id);
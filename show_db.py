@@ -1,9 +1,313 @@
-import sqlite3
+import argparse
+import csv
+import itertools
+import json
+import os
+import sys
+import time
+from collections import namedtuple
+from pathlib import Path
 
-conn = sqlite3.connect("partyservice.db")
-cur = conn.cursor()
+import db
+import federation
 
-for row in cur.execute("SELECT id, event_date, event_time FROM orders"):
-    print(row)
+# ------------------------------------------------------------
+# Datenbank ansehen und abfragen (nur lesend)
+# Start: python show_db.py orders --from 2026-01-01 --to 2026-01-31 --status open
+#        python show_db.py items --order 42 --format csv
+#        python show_db.py invoices --from 2026-01-01 --format jsonl --explain
+#        python show_db.py --standort alle orders --from 2026-01-01 --format csv
+#
+# Ausgabe wird seitenweise gestreamt (Keyset: WHERE (schlüssel) > letzte Zeile
+# ORDER BY schlüssel LIMIT n) – auch große Dateien brauchen kaum Speicher,
+# und jede Seite ist ein Index-Bereichszugriff statt OFFSET.
+# --explain schreibt Abfrageplan und Zeiten nach stderr.
+# --standort alle liest alle Standortdateien parallel und führt die Ströme
+# nach demselben Schlüssel zusammen (erste Spalte "location").
+# ------------------------------------------------------------
 
-conn.close()
+# sql: SELECT ohne WHERE/ORDER; schluessel: (Ausdruck, Spaltenname) in Sortierreihenfolge
+Sicht = namedtuple("Sicht", "sql schluessel")
+
+SICHTEN = {
+    "orders": Sicht(
+        """
+        SELECT o.id, o.event_date, o.event_time, o.fulfilment_type, o.status,
+               o.invoice_number, o.payment_method, o.customer_id,
+               c.name AS customer_name, c.phone AS customer_phone
+        FROM orders o
+        LEFT JOIN customers c ON c.id = o.customer_id
+        """,
+        (("o.event_date", "event_date"), ("o.event_time", "event_time"), ("o.id", "id")),
+    ),
+    "items": Sicht(
+        """
+        SELECT i.order_id, i.id, i.product_id, i.description, i.quantity, i.unit,
+               i.unit_price_cents, i.vat_rate, o.event_date, o.status
+        FROM order_items i
+        JOIN orders o ON o.id = i.order_id
+        LEFT JOIN customers c ON c.id = o.customer_id
+        """,
+        (("i.order_id", "order_id"), ("i.id", "id")),
+    ),
+    "customers": Sicht(
+        """
+        SELECT c.id, c.name, c.phone, c.address, c.created_at,
+               s.order_count, s.lifetime_gross_cents, s.open_balance_cents, s.last_order_date
+        FROM customers c
+        LEFT JOIN customer_stats s ON s.customer_id = c.id
+        """,
+        (("c.id", "id"),),
+    ),
+    "products": Sicht(
+        """
+        SELECT p.id, p.sku, p.name, p.default_quantity, p.default_unit,
+               p.default_unit_price_cents, p.default_vat_rate, p.is_active
+        FROM products p
+        """,
+        (("p.id", "id"),),
+    ),
+    "invoices": Sicht(
+        """
+        SELECT o.invoice_number, o.invoice_date, o.id AS order_id, o.status, o.payment_method,
+               o.discount_cents, o.delivery_fee_cents, c.name AS customer_name
+        FROM orders o
+        LEFT JOIN customers c ON c.id = o.customer_id
+        """,
+        (("o.invoice_number", "invoice_number"),),
+    ),
+}
+
+
+def _filter(befehl: str, args) -> tuple[list[str], list]:
+    where, params = [], []
+    datum = "o.invoice_date" if befehl == "invoices" else "o.event_date"
+    if befehl == "invoices":
+        where.append("o.invoice_number IS NOT NULL")
+
+    if getattr(args, "von", None):
+        where.append(f"{datum} >= ?")
+        params.append(args.von)
+    if getattr(args, "bis", None):
+        where.append(f"{datum} <= ?")
+        params.append(args.bis)
+    if getattr(args, "status", None):
+        where.append("o.status = ?")
+        params.append(args.status)
+    if getattr(args, "invoice", None):
+        where.append("o.invoice_number = ?")
+        params.append(args.invoice)
+    if getattr(args, "order", None):
+        where.append("i.order_id = ?")
+        params.append(args.order)
+    if getattr(args, "customer", None):
+        # Zahl = Kunden-ID, sonst Teil von Name oder Telefonnummer
+        kunde = args.customer.strip()
+        if kunde.isdigit():
+            where.append("c.id = ?")
+            params.append(int(kunde))
+        else:
+            where.append("(c.name LIKE ? OR c.phone LIKE ?)")
+            params.extend([f"%{kunde}%"] * 2)
+    if getattr(args, "name", None):
+        where.append("(p.name LIKE ? OR p.sku LIKE ?)")
+        params.extend([f"%{args.name}%"] * 2)
+    if getattr(args, "active", False):
+        where.append("p.is_active = 1")
+    return where, params
+
+
+def _seiten_sql(sicht: Sicht, where: list[str], nach_schluessel: bool) -> str:
+    bedingungen = list(where)
+    if nach_schluessel:
+        ausdruecke = ", ".join(a for a, _ in sicht.schluessel)
+        platzhalter = ", ".join("?" * len(sicht.schluessel))
+        bedingungen.append(f"({ausdruecke}) > ({platzhalter})")
+    sql = sicht.sql.rstrip()
+    if bedingungen:
+        sql += "\n        WHERE " + " AND ".join(bedingungen)
+    return sql + "\n        ORDER BY " + ", ".join(a for a, _ in sicht.schluessel) + "\n        LIMIT ?"
+
+
+def _rechnungsbetraege(conn, spalten: list[str], zeilen: list[tuple]) -> list[tuple]:
+    """Hängt den Bruttobetrag je Rechnung an (Positionen der Seite in einer Abfrage)."""
+    i_order, i_rabatt, i_liefer = (spalten.index(s) for s in ("order_id", "discount_cents", "delivery_fee_cents"))
+    ids = [z[i_order] for z in zeilen]
+    items: dict[int, list] = {i: [] for i in ids}
+    for r in conn.execute(
+        f"SELECT order_id, quantity, unit_price_cents, vat_rate FROM order_items WHERE order_id IN ({','.join('?' * len(ids))})",
+        ids,
+    ):
+        items[r["order_id"]].append(r)
+    return [
+        z + (db._totals_from_items(items[z[i_order]], int(z[i_rabatt]), int(z[i_liefer]))["gross_total_cents"],)
+        for z in zeilen
+    ]
+
+
+def zeilen_streamen(befehl: str, args, statistik: dict):
+    """Liefert zuerst die Spaltennamen, danach Seite für Seite die Zeilen (als Tupel)."""
+    sicht = SICHTEN[befehl]
+    where, params = _filter(befehl, args)
+    rest = args.limit if args.limit else None
+    letzter = None
+
+    with db.get_conn() as conn:
+        if args.explain:
+            sql = _seiten_sql(sicht, where, False)
+            print("Abfrageplan (erste Seite):", file=sys.stderr)
+            for zeile in conn.execute("EXPLAIN QUERY PLAN " + sql, [*params, args.page_size]):
+                print(f"  {zeile['detail']}", file=sys.stderr)
+
+        spalten = None
+        while rest is None or rest > 0:
+            groesse = args.page_size if rest is None else min(args.page_size, rest)
+            sql = _seiten_sql(sicht, where, letzter is not None)
+            t0 = time.perf_counter()
+            cur = conn.execute(sql, [*params, *(letzter or ()), groesse])
+            zeilen = [tuple(r) for r in cur.fetchall()]
+            statistik["sql_s"] += time.perf_counter() - t0
+            statistik["seiten"] += 1
+
+            if spalten is None:
+                spalten = [d[0] for d in cur.description]
+                schluessel_pos = [spalten.index(name) for _, name in sicht.schluessel]
+                yield spalten + (["gross_total_cents"] if befehl == "invoices" else [])
+            if not zeilen:
+                break
+
+            letzter = tuple(zeilen[-1][i] for i in schluessel_pos)
+            if befehl == "invoices":
+                zeilen = _rechnungsbetraege(conn, spalten, zeilen)
+            if statistik["erste_zeile_s"] is None:
+                statistik["erste_zeile_s"] = time.perf_counter() - statistik["start"]
+            statistik["zeilen"] += len(zeilen)
+            yield from zeilen
+
+            if rest is not None:
+                rest -= len(zeilen)
+            if len(zeilen) < groesse:
+                break
+
+
+def _text(wert) -> str:
+    return "" if wert is None else " ".join(str(wert).splitlines())
+
+
+def ausgeben(zeilen, format_: str, max_breite: int) -> None:
+    spalten = next(zeilen)
+    if format_ == "csv":
+        writer = csv.writer(sys.stdout, lineterminator="\n")
+        writer.writerow(spalten)
+        writer.writerows(zeilen)
+    elif format_ == "jsonl":
+        for z in zeilen:
+            sys.stdout.write(json.dumps(dict(zip(spalten, z)), ensure_ascii=False) + "\n")
+    else:
+        # Tabelle: Spaltenbreite aus Kopf und den ersten 200 Zeilen, längere Werte werden gekürzt
+        vorlauf = []
+        for z in zeilen:
+            vorlauf.append(z)
+            if len(vorlauf) >= 200:
+                break
+        breiten = [
+            min(max_breite, max([len(s)] + [len(_text(z[i])) for z in vorlauf]))
+            for i, s in enumerate(spalten)
+        ]
+
+        def zeile_formatieren(werte) -> str:
+            teile = []
+            for w, b in zip(werte, breiten):
+                t = _text(w)
+                teile.append((t[: b - 1] + "…" if len(t) > b else t).ljust(b))
+            return "  ".join(teile).rstrip()
+
+        print(zeile_formatieren(spalten))
+        print("  ".join("-" * b for b in breiten))
+        for z in vorlauf:
+            print(zeile_formatieren(z))
+        for z in zeilen:
+            print(zeile_formatieren(z))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Datenbank ansehen (Bestellungen, Positionen, Kunden, Produkte, Rechnungen)")
+    parser.add_argument("--db", type=Path, default=db.DB_PATH, help=f"Datenbankdatei (Standard: {db.DB_PATH})")
+    parser.add_argument("--standort", help=f"Standort-Code aus standorte.json oder '{federation.ALLE}' (statt --db)")
+    sub = parser.add_subparsers(dest="befehl", required=True)
+
+    gemeinsam = argparse.ArgumentParser(add_help=False)
+    gemeinsam.add_argument("--format", choices=["table", "csv", "jsonl"], default="table")
+    gemeinsam.add_argument("--limit", type=int, help="höchstens so viele Zeilen")
+    gemeinsam.add_argument("--page-size", type=int, default=500, help="Zeilen je Abfrage")
+    gemeinsam.add_argument("--max-width", type=int, default=40, help="Spaltenbreite im Tabellenformat")
+    gemeinsam.add_argument("--explain", action="store_true", help="Abfrageplan und Zeiten nach stderr")
+
+    bestellfilter = argparse.ArgumentParser(add_help=False)
+    bestellfilter.add_argument("--from", dest="von", metavar="YYYY-MM-DD")
+    bestellfilter.add_argument("--to", dest="bis", metavar="YYYY-MM-DD")
+    bestellfilter.add_argument("--status")
+    bestellfilter.add_argument("--customer", help="Kunden-ID oder Teil von Name/Telefon")
+    bestellfilter.add_argument("--invoice", help="Rechnungsnummer")
+
+    sub.add_parser("orders", parents=[gemeinsam, bestellfilter], help="Bestellungen (nach Datum/Uhrzeit)")
+    p_items = sub.add_parser("items", parents=[gemeinsam, bestellfilter], help="Bestellpositionen")
+    p_items.add_argument("--order", type=int, help="nur Positionen dieser Bestellung")
+    p_kunden = sub.add_parser("customers", parents=[gemeinsam], help="Kunden mit Kennzahlen")
+    p_kunden.add_argument("--customer", help="Kunden-ID oder Teil von Name/Telefon")
+    p_produkte = sub.add_parser("products", parents=[gemeinsam], help="Produktliste")
+    p_produkte.add_argument("--name", help="Teil von Name oder SKU")
+    p_produkte.add_argument("--active", action="store_true", help="nur aktive Produkte")
+    sub.add_parser("invoices", parents=[gemeinsam, bestellfilter], help="Rechnungen (Datum = Rechnungsdatum)")
+
+    args = parser.parse_args()
+    if args.page_size < 1:
+        parser.error("--page-size muss mindestens 1 sein")
+    db.DB_PATH = args.db
+    if args.standort == federation.ALLE:
+        dateien = [db.standorte()[c].db_path if c else db.DB_PATH for c in db.standort_codes()]
+    elif args.standort:
+        try:
+            dateien = [db.standort_waehlen(args.standort).db_path]
+        except ValueError as e:
+            parser.error(str(e))
+    else:
+        dateien = [db.DB_PATH]
+    for datei in dateien:
+        if not datei.exists():
+            sys.exit(f"Datenbank {datei} nicht gefunden.")
+
+    statistik = {"start": time.perf_counter(), "erste_zeile_s": None, "sql_s": 0.0, "seiten": 0, "zeilen": 0}
+    if args.standort == federation.ALLE:
+        schluessel = [name for _, name in SICHTEN[args.befehl].schluessel]
+
+        def sortierung(spalten):
+            pos = [spalten.index(name) for name in schluessel]
+            return lambda z: tuple(z[i] for i in pos)
+
+        zeilen = federation.stroeme_zusammenfuehren(lambda: zeilen_streamen(args.befehl, args, statistik), sortierung)
+        if args.limit:
+            zeilen = itertools.islice(zeilen, args.limit + 1)
+    else:
+        zeilen = zeilen_streamen(args.befehl, args, statistik)
+    try:
+        ausgeben(zeilen, args.format, args.max_width)
+        sys.stdout.flush()
+    except BrokenPipeError:
+        # Ausgabe z. B. an "head" weitergereicht und dort beendet
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)
+
+    if args.explain:
+        gesamt = time.perf_counter() - statistik["start"]
+        erste = statistik["erste_zeile_s"]
+        erste_text = f"erste Zeile nach {erste * 1000:.1f} ms, " if erste is not None else ""
+        print(
+            f"{statistik['zeilen']} Zeilen in {statistik['seiten']} Seiten, {erste_text}"
+            f"SQL {statistik['sql_s'] * 1000:.1f} ms, gesamt {gesamt * 1000:.1f} ms",
+            file=sys.stderr,
+        )
+
+
+if __name__ == "__main__":
+    main()